@@ -0,0 +1,157 @@
+#Cache de respuestas por juego (namespace) para preguntas repetidas
+# Muchos usuarios hacen las mismas preguntas sobre el mismo juego ("¿cuántas acciones hay por turno?")
+# Antes de llamar al retriever y al LLM se busca la pregunta en la cache:
+#    1. Por el texto normalizado de la pregunta (minúsculas, sin acentos ni signos de puntuación)
+#    2. Por similitud (coseno) del embedding de la pregunta por encima de un umbral configurable
+# Cada namespace tiene sus entradas con expulsión LRU y caducidad (TTL). Al volver a procesar un juego se invalida su namespace
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+# Valores por defecto si no se configuran ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL y ANSWER_CACHE_THRESHOLD
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_THRESHOLD = 0.95
+
+_punctuationRegex = re.compile(r"[^\w\s]")
+_spacesRegex = re.compile(r"\s+")
+
+
+# Función que normaliza el texto de una pregunta para buscarla en la cache
+# Ej: "¿Cuántas acciones hay por turno?" y "cuantas acciones hay  por turno" tienen la misma clave
+def normalize_question(question):
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = _punctuationRegex.sub(" ", text)
+    return _spacesRegex.sub(" ", text).strip()
+
+
+# Respuestas de un namespace: pregunta normalizada -> (respuesta, embedding normalizado o None, instante de creación)
+class _NamespaceEntries:
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        # Matriz con los embeddings de las entradas para calcular todas las similitudes de una vez. Se regenera si cambian las entradas
+        self._matrix = None
+        self._keys = None
+
+    def matrix(self):
+        if self._matrix is None:
+            self._keys = [key for key, entry in self.entries.items() if entry[1] is not None]
+            self._matrix = np.array([self.entries[key][1] for key in self._keys], dtype=np.float32) if self._keys else None
+        return self._keys, self._matrix
+
+    def changed(self):
+        self._matrix = None
+        self._keys = None
+
+
+class AnswerCache:
+
+    def __init__(self, maxEntries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, threshold=DEFAULT_THRESHOLD):
+        self.maxEntries = max(1, int(maxEntries))
+        self.ttl = float(ttl)
+        self.threshold = float(threshold)
+        self.hits = 0
+        self.semanticHits = 0
+        self.misses = 0
+        self.semanticMisses = 0
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    def _expired(self, entry):
+        return self.ttl and time.time() - entry[2] > self.ttl
+
+    def _remove(self, entries, key):
+        del entries.entries[key]
+        entries.changed()
+
+    # Función que busca la respuesta por el texto normalizado de la pregunta
+    # Return: respuesta o None si no está
+    def get_exact(self, namespace, question):
+        key = normalize_question(question)
+        with self._lock:
+            entries = self._namespaces.get(namespace)
+            entry = entries.entries.get(key) if entries else None
+            if entry is not None and self._expired(entry):
+                self._remove(entries, key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            entries.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    # Función que busca la respuesta de la pregunta más parecida (embedding) por encima del umbral
+    # Return: respuesta o None si no hay ninguna pregunta suficientemente parecida
+    def get_similar(self, namespace, vector):
+        query = _unit(vector)
+        with self._lock:
+            entries = self._namespaces.get(namespace)
+            if entries:
+                # Las respuestas caducadas se eliminan antes de buscar: si no, una caducada más parecida ocultaría a una vigente
+                for key in [key for key, entry in entries.entries.items() if self._expired(entry)]:
+                    self._remove(entries, key)
+                keys, matrix = entries.matrix()
+                if matrix is not None:
+                    scores = matrix @ query
+                    best = int(np.argmax(scores))
+                    entry = entries.entries[keys[best]]
+                    if scores[best] >= self.threshold:
+                        entries.entries.move_to_end(keys[best])
+                        self.semanticHits += 1
+                        return entry[0]
+            self.semanticMisses += 1
+            return None
+
+    # Guarda la respuesta a una pregunta. vector es el embedding de la pregunta (opcional)
+    def put(self, namespace, question, answer, vector=None):
+        key = normalize_question(question)
+        with self._lock:
+            entries = self._namespaces.setdefault(namespace, _NamespaceEntries())
+            entries.entries[key] = (answer, _unit(vector) if vector is not None else None, time.time())
+            entries.entries.move_to_end(key)
+            while len(entries.entries) > self.maxEntries:
+                entries.entries.popitem(last=False)
+            entries.changed()
+
+    # Elimina todas las respuestas de un namespace (se llama al volver a procesar el juego)
+    def invalidate(self, namespace):
+        with self._lock:
+            self._namespaces.pop(namespace, None)
+
+    # Return: diccionario con el número de entradas y de aciertos y fallos por texto exacto (hits, misses) y por similitud
+    # (semantic_hits, semantic_misses). Las búsquedas por similitud solo se hacen después de un fallo por texto exacto
+    def stats(self):
+        with self._lock:
+            return {"entries": sum(len(entries.entries) for entries in self._namespaces.values()),
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "semantic_hits": self.semanticHits,
+                    "semantic_misses": self.semanticMisses}
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+# Una única cache de respuestas en todo el proceso, compartida por todas las sesiones
+_cache = None
+_cacheLock = threading.Lock()
+
+# Función que devuelve la cache de respuestas del proceso (ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD)
+def get_answer_cache(config):
+    global _cache
+    with _cacheLock:
+        if _cache is None:
+            _cache = AnswerCache(config.get("ANSWER_CACHE_SIZE", DEFAULT_MAX_ENTRIES),
+                                 config.get("ANSWER_CACHE_TTL", DEFAULT_TTL),
+                                 config.get("ANSWER_CACHE_THRESHOLD", DEFAULT_THRESHOLD))
+        return _cache
@@ -0,0 +1,595 @@
+#Benchmark sin conexión de la ingesta y de las consultas de gptda2.py
+# Ejecuta la ingesta de la aplicación (gameLibrary.ingest_files), get_vectorstore, get_conversation_chain y handle_userinput
+# sobre un corpus de PDF generados, sustituyendo los servicios externos por dobles deterministas:
+#    - OpenAI: embeddings por hashing de palabras (HashingEmbeddings) y un LLM con respuestas fijas (CannedChatModel), con streaming
+#    - PineCone: vector store en memoria (MemoryBackend, VECTORSTORE_BACKEND = "memory")
+#    - BGG: servidor HTTP local que devuelve la página de cada juego (BGG_URL)
+# Cada doble admite una latencia configurable para simular la red. El resultado es un JSON con páginas/s, chunks/s,
+# latencias p50/p95 de las preguntas y memoria máxima (RSS), para comparar resultados entre commits
+#
+# Uso: python benchmark.py --sizes 5 20 80 --questions 20 --embed-latency 0.2 --output resultado.json
+import argparse
+import hashlib
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import numpy as np
+import streamlit as st
+from langchain.chat_models.base import SimpleChatModel
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+
+import gptda2
+import vectorBackends
+from gameLibrary import ingest_files
+from gameCatalog import get_catalog
+from textChunker import DEFAULT_CHUNK_TOKENS
+from startup import profile_imports
+from keywordIndex import KeywordStore
+from vectorBackends import EMBEDDING_DIMENSION, write_texts
+
+PREFIX = "bench-"
+# Primer ID de BGG de los juegos del corpus. El ID 0 es un juego que no existe (página de error de la BGG)
+FIRST_BGG_ID = 100000
+LINES_PER_PAGE = 40
+WORDS_PER_LINE = 12
+
+
+# Embeddings deterministas: cada palabra suma 1 en una posición del vector (hash de la palabra)
+#    - latency: segundos de espera en cada llamada (una petición a OpenAI por lote)
+class HashingEmbeddings(Embeddings):
+
+    def __init__(self, latency=0.0, dimension=EMBEDDING_DIMENSION):
+        self.model = "hashing-" + str(dimension)
+        self.latency = latency
+        self.dimension = dimension
+        self.calls = 0
+        self.texts = 0
+        self._lock = threading.Lock()
+
+    def _vector(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:4], "little") % self.dimension] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _call(self, texts):
+        with self._lock:
+            self.calls += 1
+            self.texts += len(texts)
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_documents(self, texts):
+        return self._call(list(texts))
+
+    def embed_query(self, text):
+        return self._call([text])[0]
+
+
+# Registro de los instantes en que los LLM falsos emiten su primer token (para medir el tiempo hasta el primer token)
+class TokenClock:
+
+    def __init__(self):
+        self.firstTokens = []
+        self._lock = threading.Lock()
+
+    def mark(self):
+        with self._lock:
+            self.firstTokens.append(time.perf_counter())
+
+    # Return: primer instante registrado después de start o None
+    def first_after(self, start):
+        with self._lock:
+            return next((mark for mark in self.firstTokens if mark >= start), None)
+
+
+# LLM con respuestas fijas. Acepta los mismos argumentos que ChatOpenAI en gptda2.py (openai_api_key, streaming, request_timeout, max_retries)
+#    - latency: espera antes del primer token. token_latency: espera entre tokens
+#    - Reformulación de preguntas (condense question): devuelve la pregunta tal cual. Resúmenes de memoria: un resumen fijo
+class CannedChatModel(SimpleChatModel):
+    openai_api_key: str = ""
+    streaming: bool = False
+    latency: float = 0.0
+    token_latency: float = 0.0
+    answer_tokens: int = 60
+    clock: TokenClock = None
+    request_timeout: float = None
+    max_retries: int = 1
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def _llm_type(self):
+        return "canned"
+
+    def _call(self, messages, stop=None, run_manager=None):
+        prompt = messages[-1].content
+        if self.latency:
+            time.sleep(self.latency)
+        if "Standalone question:" in prompt:
+            return prompt.rsplit("Follow Up Input:", 1)[-1].split("Standalone question:")[0].strip()
+        if "New summary:" in prompt:
+            return "Resumen de la conversación sobre las reglas del juego."
+        words = prompt.split() or ["respuesta"]
+        tokens = [words[i % len(words)] + " " for i in range(self.answer_tokens)]
+        if self.streaming and run_manager:
+            for i, token in enumerate(tokens):
+                if i == 0 and self.clock:
+                    self.clock.mark()
+                elif self.token_latency:
+                    time.sleep(self.token_latency)
+                run_manager.on_llm_new_token(token)
+        return "".join(tokens).strip()
+
+
+# Vector store en memoria con búsqueda por producto escalar (los vectores de HashingEmbeddings están normalizados)
+class MemoryVectorStore:
+
+    def __init__(self, embeddings, latency=0.0):
+        self.embeddings = embeddings
+        self.latency = latency
+        self.texts = []
+        self.metadatas = []
+        self.vectors = []
+        self.ids = []
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def add(self, texts, vectors, metadatas, ids):
+        self.delete(ids)
+        with self._lock:
+            self.texts.extend(texts)
+            self.vectors.extend(vectors)
+            self.metadatas.extend(metadatas)
+            self.ids.extend(ids)
+            self._matrix = None
+
+    def delete(self, ids):
+        ids = set(ids)
+        with self._lock:
+            kept = [i for i, id in enumerate(self.ids) if id not in ids]
+            deleted = len(self.ids) - len(kept)
+            if deleted:
+                self.texts = [self.texts[i] for i in kept]
+                self.vectors = [self.vectors[i] for i in kept]
+                self.metadatas = [self.metadatas[i] for i in kept]
+                self.ids = [self.ids[i] for i in kept]
+                self._matrix = None
+        return deleted
+
+    def similarity_search(self, query, k=4, **kwargs):
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.asarray(self.vectors, dtype=np.float32)
+            matrix = self._matrix
+        if not len(matrix):
+            return []
+        best = np.argsort(-(matrix @ vector))[:k]
+        return [Document(page_content=self.texts[i], metadata=dict(self.metadatas[i])) for i in best]
+
+
+# Backend de vector store en memoria con las mismas funciones que los backends de vectorBackends
+#    - latency: segundos de espera en cada inserción (upsert) y en cada búsqueda
+class MemoryBackend:
+    name = "memory"
+    latency = 0.0
+    _stores = {}
+
+    def __init__(self, config):
+        self.config = config
+        self.keywords = KeywordStore(config)
+
+    def list_namespaces(self):
+        return list(self._stores)
+
+    def namespace_counts(self):
+        return {namespace: len(store.texts) for namespace, store in self._stores.items()}
+
+    def open_writer(self, embeddings, namespace):
+        return MemoryWriter(self, embeddings, namespace, self.keywords.open_writer(namespace))
+
+    def from_texts(self, text_chunks, embeddings, namespace):
+        return write_texts(self.open_writer(embeddings, namespace), text_chunks, embeddings)
+
+    def get_vectorstore(self, embeddings, namespace):
+        if namespace not in self._stores:
+            raise KeyError(namespace)
+        store = self._stores[namespace]
+        store.embeddings = embeddings
+        return store
+
+    def delete_namespace(self, namespace):
+        self._stores.pop(namespace, None)
+        self.keywords.delete(namespace)
+
+    def load_keywords(self, namespace):
+        return self.keywords.load(namespace)
+
+
+class MemoryWriter:
+
+    def __init__(self, backend, embeddings, namespace, keywords):
+        self.namespace = namespace
+        self.keywords = keywords
+        self.count = 0
+        self.deleted = 0
+        self.store = backend._stores.setdefault(namespace, MemoryVectorStore(embeddings, backend.latency))
+
+    def add(self, texts, vectors, metadatas=None, ids=None):
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        if self.store.latency:
+            time.sleep(self.store.latency)
+        self.store.add(texts, vectors, metadatas, ids)
+        self.keywords.add(texts, metadatas, ids)
+        self.count += len(texts)
+
+    def delete(self, ids):
+        self.deleted += self.store.delete(ids)
+        self.keywords.delete(ids)
+
+    def close(self):
+        self.keywords.close()
+        return self.store
+
+    def discard(self):
+        self.keywords.discard()
+
+
+# Servidor HTTP local que imita las páginas de juegos de la BGG (solo importa el <title>)
+def start_bgg_stub(latency=0.0):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            bggID = self.path.rstrip("/").rsplit("/", 1)[-1]
+            if latency:
+                time.sleep(latency)
+            if bggID.isdigit() and int(bggID) >= FIRST_BGG_ID:
+                title = "Bench Game " + bggID + " | Board Game | BoardGameGeek"
+            else:
+                title = "BoardGameGeek"
+            body = ("<html><head><title>" + title + "</title></head><body>" + "x" * 20000 + "</body></html>").encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except ConnectionError:
+                # El resolvedor cierra la conexión en cuanto lee el título
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Sustituto de st.session_state fuera de "streamlit run": diccionario con acceso por atributo
+class BenchSessionState(dict):
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+
+# Fichero subido (mismo interfaz que UploadedFile de Streamlit)
+class BenchFile:
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def getvalue(self):
+        return self.data
+
+
+# Función que genera el texto de un reglamento de numPages páginas (determinista a partir de seed)
+# Return: lista con el texto de cada página (solo ASCII, para la fuente estándar del PDF)
+def generate_pages(numPages, seed):
+    rng = random.Random(seed)
+    syllables = ["ca", "de", "fi", "go", "lu", "ma", "ne", "po", "ra", "si", "to", "va", "zen", "dor", "mir", "tas"]
+    vocabulary = ["".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(600)]
+    pages = []
+    section = 0
+    for _ in range(numPages):
+        lines = []
+        for lineNumber in range(LINES_PER_PAGE):
+            if lineNumber % 12 == 0:
+                section += 1
+                lines.append(str(section) + ". " + " ".join(rng.choice(vocabulary) for _ in range(3)).upper())
+            else:
+                lines.append(" ".join(rng.choice(vocabulary) for _ in range(WORDS_PER_LINE)).capitalize() + ".")
+        pages.append("\n".join(lines))
+    return pages
+
+# Función que crea un PDF mínimo (fuente Helvetica, una línea de texto por línea de la página)
+# Return: contenido binario del PDF
+def make_pdf(pages):
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(str(3 + 2 * i) + " 0 R" for i in range(len(pages)))
+    objects.append(("<< /Type /Pages /Kids [" + kids + "] /Count " + str(len(pages)) + " >>").encode("ascii"))
+    font = 3 + 2 * len(pages)
+    for i, pageText in enumerate(pages):
+        lines = [line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in pageText.split("\n")]
+        content = ("BT /F1 10 Tf 12 TL 50 750 Td " + " ".join("(" + line + ") Tj T*" for line in lines) + " ET").encode("latin-1")
+        objects.append(("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 " + str(font) +
+                        " 0 R >> >> /Contents " + str(4 + 2 * i) + " 0 R >>").encode("ascii"))
+        objects.append(b"<< /Length " + str(len(content)).encode("ascii") + b" >>\nstream\n" + content + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for i, body in enumerate(objects):
+        offsets.append(len(data))
+        data += str(i + 1).encode("ascii") + b" 0 obj\n" + body + b"\nendobj\n"
+    xref = len(data)
+    data += ("xref\n0 " + str(len(objects) + 1) + "\n0000000000 65535 f \n").encode("ascii")
+    data += b"".join(("%010d 00000 n \n" % offset).encode("ascii") for offset in offsets)
+    data += ("trailer\n<< /Size " + str(len(objects) + 1) + " /Root 1 0 R >>\nstartxref\n" + str(xref) + "\n%%EOF\n").encode("ascii")
+    return data
+
+# Return: lista de (BenchFile, texto de las páginas) con un PDF por cada tamaño (número de páginas) de sizes
+def build_corpus(sizes, seed):
+    corpus = []
+    for i, numPages in enumerate(sizes):
+        pages = generate_pages(numPages, seed + i)
+        corpus.append((BenchFile(str(FIRST_BGG_ID + i) + "_Rules.pdf", make_pdf(pages)), pages))
+    return corpus
+
+# Return: lista de count preguntas con palabras del texto del reglamento (deterministas a partir de seed)
+def generate_questions(pages, count, seed):
+    rng = random.Random(seed)
+    words = " ".join(pages).replace(".", "").lower().split()
+    return ["que ocurre con " + " ".join(rng.choice(words) for _ in range(3)) + " durante el turno?" for _ in range(count)]
+
+
+# Return: percentil p (0..100) de values por el método del rango más cercano, o None si no hay valores
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100.0 * len(ordered)) - 1)]
+
+def milliseconds(seconds):
+    return None if seconds is None else round(seconds * 1000.0, 3)
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode("ascii").strip()
+    except Exception:
+        return None
+
+
+# Prepara el entorno del benchmark: configuración (st.secrets) en un directorio temporal, st.session_state,
+# dobles de OpenAI, backend en memoria y servidor local de la BGG
+# Return: diccionario con embeddings, clock y secrets
+@contextmanager
+def bench_environment(args):
+    with tempfile.TemporaryDirectory(prefix="gptda2-bench-") as workDir, ExitStack() as stack:
+        bggServer = start_bgg_stub(args.bgg_latency)
+        stack.callback(bggServer.shutdown)
+        secrets = {
+            "PINECONE_PREFIX": PREFIX,
+            "VECTORSTORE_BACKEND": MemoryBackend.name,
+            "KEYWORD_INDEX_PATH": os.path.join(workDir, "keyword_indexes"),
+            "EMBEDDING_CACHE_PATH": os.path.join(workDir, "embedding_cache.sqlite"),
+            "BGG_CACHE_PATH": os.path.join(workDir, "bgg_cache.sqlite"),
+            "BGG_URL": "http://127.0.0.1:" + str(bggServer.server_address[1]) + "/boardgame/",
+            "PDF_WORKERS": args.pdf_workers,
+            "CHUNK_TOKENS": args.chunk_tokens,
+            "CATALOG_PATH": os.path.join(workDir, "game_catalog.sqlite"),
+        }
+        embeddings = HashingEmbeddings(args.embed_latency)
+        clock = TokenClock()
+        MemoryBackend.latency = args.store_latency
+        stack.enter_context(mock.patch.dict(vectorBackends.BACKENDS, {MemoryBackend.name: MemoryBackend}))
+        stack.enter_context(mock.patch.object(st, "secrets", secrets))
+        stack.enter_context(mock.patch.object(st, "session_state", BenchSessionState(openAI_user_key="bench")))
+        # gptda2.py importa los clientes de OpenAI dentro de las funciones: se sustituyen en los módulos de LangChain
+        stack.enter_context(mock.patch("langchain.embeddings.OpenAIEmbeddings", lambda **kwargs: embeddings))
+        stack.enter_context(mock.patch("langchain.chat_models.ChatOpenAI",
+                                              partial(CannedChatModel, latency=args.llm_latency, token_latency=args.token_latency,
+                                                      answer_tokens=args.answer_tokens, clock=clock)))
+        yield {"embeddings": embeddings, "clock": clock, "secrets": secrets}
+
+
+# Ingesta del corpus con el pipeline de la aplicación (gameLibrary.ingest_files, igual que gptda2.ingest_pdfs): extracción, chunks,
+# embeddings e inserción en paralelo, con IDs deterministas de los chunks y registro de los documentos en el catálogo
+# Las etapas se solapan entre los threads del pipeline: stage_seconds es la suma de cada etapa en todos los threads
+# Return: (diccionario de métricas, lista de (juego, páginas))
+def run_ingest(corpus, env):
+    secrets = env["secrets"]
+    trace = gptda2.get_tracer(secrets).start("bench_ingest")
+    start = time.perf_counter()
+    progress = ingest_files(secrets, gptda2.get_shared_backend(), gptda2.get_embeddings(), get_catalog(secrets),
+                            [pdf for pdf, _ in corpus], PREFIX, trace=trace)
+    seconds = time.perf_counter() - start
+    trace.finish()
+
+    files = []
+    games = []
+    for (pdf, pages), fileProgress in zip(corpus, progress):
+        done = fileProgress.status == "done"
+        files.append({"name": fileProgress.name, "game": fileProgress.game, "pages": fileProgress.pages,
+                      "chunks": fileProgress.chunks, "error": None if done else str(fileProgress.error)})
+        if done:
+            gptda2.invalidate_namespace(fileProgress.namespace)
+            games.append((fileProgress.game, pages))
+
+    pages = sum(f["pages"] for f in files)
+    chunks = sum(f["chunks"] for f in files)
+    return {"files": files,
+            "pages": pages,
+            "chunks": chunks,
+            "seconds": round(seconds, 4),
+            "pages_per_second": round(pages / seconds, 2) if seconds else None,
+            "chunks_per_second": round(chunks / seconds, 2) if seconds else None,
+            "stage_seconds": {stage["stage"]: round(stage["seconds"], 4) for stage in trace.summary()}}, games
+
+# Preguntas sobre cada juego ingerido: get_vectorstore + get_conversation_chain una vez por juego y handle_userinput por pregunta
+# Return: diccionario de métricas
+def run_queries(games, env, count, seed):
+    session = st.session_state
+    setupSeconds = []
+    latencies = []
+    firstTokens = []
+    errors = 0
+    for gameTitle, pages in games:
+        start = time.perf_counter()
+        vectorstore = gptda2.get_vectorstore(PREFIX + gameTitle)
+        session.conversation = gptda2.get_conversation_chain(vectorstore, PREFIX + gameTitle) if vectorstore else False
+        setupSeconds.append(time.perf_counter() - start)
+        if not session.conversation:
+            errors += count
+            continue
+        session.selectedGame = gameTitle
+        session.chat_html = ""
+        session.lastQuestion = None
+        session.chat_history = None
+        for question in generate_questions(pages, count, seed):
+            start = time.perf_counter()
+            result = gptda2.handle_userinput(question)
+            end = time.perf_counter()
+            if result is False:
+                errors += 1
+                continue
+            latencies.append(end - start)
+            firstToken = env["clock"].first_after(start)
+            if firstToken is not None and firstToken <= end:
+                firstTokens.append(firstToken - start)
+
+    return {"count": len(latencies),
+            "errors": errors,
+            "setup_ms_mean": milliseconds(sum(setupSeconds) / len(setupSeconds)) if setupSeconds else None,
+            "p50_ms": milliseconds(percentile(latencies, 50)),
+            "p95_ms": milliseconds(percentile(latencies, 95)),
+            "mean_ms": milliseconds(sum(latencies) / len(latencies)) if latencies else None,
+            "ttft_p50_ms": milliseconds(percentile(firstTokens, 50)),
+            "ttft_p95_ms": milliseconds(percentile(firstTokens, 95)),
+            "answer_cache": gptda2.get_answer_cache(env["secrets"]).stats()}
+
+# La misma pregunta nueva de varios usuarios a la vez sobre cada juego (answer_question desde un thread por usuario)
+# Las preguntas iguales en curso comparten una única respuesta del LLM (coalesced) en el ejecutor de consultas
+def run_concurrent(games, env, users, seed):
+    if users < 2:
+        return None
+    latencies = []
+    coalesced = 0
+    errors = 0
+    lock = threading.Lock()
+    for gameTitle, pages in games:
+        namespace = PREFIX + gameTitle
+        vectorstore = gptda2.get_vectorstore(namespace)
+        conversations = [gptda2.get_conversation_chain(vectorstore, namespace) for _ in range(users)]
+        question = generate_questions(pages, 1, seed + 1)[0] + " (" + str(users) + " usuarios)"
+        barrier = threading.Barrier(users)
+
+        def ask(conversation):
+            nonlocal coalesced, errors
+            barrier.wait()
+            start = time.perf_counter()
+            try:
+                result = gptda2.answer_question(conversation, question, namespace)
+            except Exception:
+                with lock:
+                    errors += 1
+                return
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                coalesced += result["coalesced"]
+
+        threads = [threading.Thread(target=ask, args=(conversation,)) for conversation in conversations]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    return {"users": users,
+            "count": len(latencies),
+            "errors": errors,
+            "coalesced": coalesced,
+            "p50_ms": milliseconds(percentile(latencies, 50)),
+            "p95_ms": milliseconds(percentile(latencies, 95)),
+            "query_executor": gptda2.get_query_executor(env["secrets"]).stats()}
+
+def run_benchmark(args):
+    started = time.perf_counter()
+    corpus = build_corpus(args.sizes, args.seed)
+    with bench_environment(args) as env:
+        ingest, games = run_ingest(corpus, env)
+        query = run_queries(games, env, args.questions, args.seed)
+        concurrent = run_concurrent(games, env, args.users, args.seed)
+        embeddings = env["embeddings"]
+    return {"commit": git_commit(),
+            "python": platform.python_version(),
+            "parameters": vars(args),
+            "ingest": ingest,
+            "query": query,
+            "concurrent_query": concurrent,
+            "embedding_calls": embeddings.calls,
+            "embedded_texts": embeddings.texts,
+            # Import en frío de gptda2.py en un proceso nuevo (incluye Streamlit)
+            "startup_import_ms": profile_imports("gptda2")["import_ms"],
+            # ru_maxrss en KB (Linux). children: procesos del pool de extracción de PDF
+            "peak_rss_kb": {"self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                            "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss},
+            "total_seconds": round(time.perf_counter() - started, 4)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark sin conexión de la ingesta y las consultas de gptda2")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 20, 80], help="Páginas de cada PDF del corpus")
+    parser.add_argument("--questions", type=int, default=20, help="Preguntas por juego")
+    parser.add_argument("--users", type=int, default=8, help="Usuarios que hacen a la vez la misma pregunta sobre cada juego (0 para no medirlo)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--pdf-workers", type=int, default=os.cpu_count() or 1, help="PDF_WORKERS")
+    parser.add_argument("--chunk-tokens", type=int, default=DEFAULT_CHUNK_TOKENS, help="CHUNK_TOKENS")
+    parser.add_argument("--answer-tokens", type=int, default=60, help="Tokens de cada respuesta del LLM falso")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Segundos por petición de embeddings")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Segundos hasta el primer token del LLM")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Segundos entre tokens del LLM")
+    parser.add_argument("--store-latency", type=float, default=0.0, help="Segundos por inserción o búsqueda en el vector store")
+    parser.add_argument("--bgg-latency", type=float, default=0.0, help="Segundos por petición a la BGG")
+    parser.add_argument("--output", help="Fichero JSON de resultados (por defecto, salida estándar)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = json.dumps(run_benchmark(args), indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(result + "\n")
+    else:
+        print(result)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#Resolución de títulos de juegos de la BGG (BoardGameGeek) a partir de su ID
+# Sustituye la descarga completa de la página y el parsing con BeautifulSoup/html5lib:
+#    - La respuesta se lee por bloques y se deja de leer en cuanto aparece </title>
+#    - Cache persistente en SQLite con TTL. Los IDs que no existen en la BGG también se guardan (cache negativa) con su propio TTL
+#    - Varias búsquedas a la vez se resuelven en paralelo (lookup_many)
+#    - La descarga se hace con un fetcher inyectable (función url -> respuesta con read()), para poder probar contra un servidor local
+import html
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+BGG_URL = "https://boardgamegeek.com/boardgame/"
+# Título de la página de error genérica de la BGG (ID no encontrado)
+BGG_ERROR_TITLE = "BoardGameGeek"
+
+# Valores por defecto si no se configuran BGG_CACHE_PATH, BGG_CACHE_TTL y BGG_NEGATIVE_TTL (segundos)
+DEFAULT_CACHE_PATH = "bgg_cache.sqlite"
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_NEGATIVE_TTL = 24 * 3600
+# Peticiones simultáneas a la BGG en lookup_many y timeout de cada petición
+DEFAULT_WORKERS = 8
+DEFAULT_TIMEOUT = 10
+
+# Tamaño de los bloques leídos de la respuesta y máximo que se lee buscando el título
+READ_BLOCK = 4096
+MAX_READ = 256 * 1024
+
+_titleRegex = re.compile(rb"<title[^>]*>(.*?)</title", re.IGNORECASE | re.DOTALL)
+
+
+# Fetcher por defecto: petición HTTP con urllib
+def default_fetcher(url, timeout=DEFAULT_TIMEOUT):
+    return urlopen(url, timeout=timeout)
+
+# Función que lee el <title> de una respuesta HTML sin descargar el resto de la página
+# Return: texto del título (sin entidades HTML) o None si no aparece en los primeros MAX_READ bytes
+def read_title(response):
+    data = b""
+    while len(data) < MAX_READ:
+        block = response.read(READ_BLOCK)
+        if not block:
+            break
+        data += block
+        match = _titleRegex.search(data)
+        if match:
+            return html.unescape(match.group(1).decode("utf-8", errors="replace")).strip()
+    return None
+
+# Función que extrae el nombre del juego del título de la página: primer string antes de |
+# Return: nombre del juego o None si es la página de error de la BGG
+def parse_game_title(pageTitle):
+    if not pageTitle:
+        return None
+    guion = pageTitle.find(' |')
+    gameTitle = pageTitle[0:guion] if guion >= 0 else pageTitle
+    if gameTitle == BGG_ERROR_TITLE:
+        return None
+    return gameTitle
+
+
+# Resolvedor de ID de BGG -> título del juego con cache persistente
+class BGGResolver:
+
+    def __init__(self, cachePath=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, negativeTtl=DEFAULT_NEGATIVE_TTL,
+                 fetcher=default_fetcher, baseUrl=BGG_URL, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT):
+        self.ttl = float(ttl)
+        self.negativeTtl = float(negativeTtl)
+        self.fetcher = fetcher
+        self.baseUrl = baseUrl
+        self.workers = max(1, int(workers))
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cachePath, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS bgg_titles ("
+                               "bgg_id TEXT PRIMARY KEY, title TEXT, fetched_at REAL NOT NULL)")
+
+    # Return: (True, título o None) si el ID está en la cache y no ha caducado, (False, None) si hay que descargarlo
+    def _cached(self, bggID):
+        with self._lock:
+            row = self._conn.execute("SELECT title, fetched_at FROM bgg_titles WHERE bgg_id = ?", (bggID,)).fetchone()
+        if row:
+            title, fetchedAt = row
+            ttl = self.ttl if title is not None else self.negativeTtl
+            if time.time() - fetchedAt < ttl:
+                return True, title
+        return False, None
+
+    def _store(self, bggID, title):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO bgg_titles (bgg_id, title, fetched_at) VALUES (?, ?, ?)",
+                               (bggID, title, time.time()))
+
+    # Descarga el título de la BGG y lo guarda en la cache (también si el ID no existe)
+    def _fetch(self, bggID):
+        response = self.fetcher(self.baseUrl + bggID, timeout=self.timeout)
+        try:
+            gameTitle = parse_game_title(read_title(response))
+        finally:
+            # Se cierra la conexión sin leer el resto de la página
+            response.close()
+        self._store(bggID, gameTitle)
+        return gameTitle
+
+    # Función que resuelve un ID de BGG
+    # Return: título del juego o None si el ID no existe en la BGG. Lanza la excepción del fetcher si falla la descarga
+    def lookup(self, bggID):
+        bggID = str(bggID)
+        found, title = self._cached(bggID)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if found:
+            return title
+        return self._fetch(bggID)
+
+    # Función que resuelve varios IDs a la vez. Los que no están en cache se descargan en paralelo
+    # Return: diccionario ID -> título (o None si no existe). Los IDs cuya descarga falla no aparecen en el resultado
+    def lookup_many(self, bggIDs):
+        results = {}
+        pending = []
+        for bggID in dict.fromkeys(str(bggID) for bggID in bggIDs):
+            found, title = self._cached(bggID)
+            if found:
+                results[bggID] = title
+            else:
+                pending.append(bggID)
+        with self._lock:
+            self.hits += len(results)
+            self.misses += len(pending)
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(pending))) as pool:
+                futures = {bggID: pool.submit(self._fetch, bggID) for bggID in pending}
+            for bggID, future in futures.items():
+                if future.exception() is None:
+                    results[bggID] = future.result()
+        return results
+
+    # Elimina un ID de la cache (por ejemplo, si ha cambiado el título en la BGG)
+    def invalidate(self, bggID):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM bgg_titles WHERE bgg_id = ?", (str(bggID),))
+
+
+# Un único resolvedor por fichero de cache en todo el proceso, compartido por todas las sesiones
+_resolvers = {}
+_resolversLock = threading.Lock()
+
+# Función que devuelve el resolvedor configurado (BGG_CACHE_PATH, BGG_CACHE_TTL, BGG_NEGATIVE_TTL, BGG_URL)
+# Return: instancia de BGGResolver compartida en el proceso
+def get_resolver(config):
+    path = config.get("BGG_CACHE_PATH", DEFAULT_CACHE_PATH)
+    with _resolversLock:
+        if path not in _resolvers:
+            _resolvers[path] = BGGResolver(path,
+                                           ttl=config.get("BGG_CACHE_TTL", DEFAULT_TTL),
+                                           negativeTtl=config.get("BGG_NEGATIVE_TTL", DEFAULT_NEGATIVE_TTL),
+                                           baseUrl=config.get("BGG_URL", BGG_URL))
+        return _resolvers[path]
@@ -0,0 +1,40 @@
+#Callbacks de LangChain para la respuesta en streaming del chat
+# Están en un módulo propio para que gptda2.py no importe LangChain al cargar el script (se importa la primera vez que se responde una pregunta)
+import time
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+from htmlTemplates import bot_template, render_message
+
+
+# Callback de LangChain que guarda el instante del primer token de la respuesta (tiempo hasta el primer token en la traza)
+class FirstTokenTimer(BaseCallbackHandler):
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.firstToken = None
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self.firstToken is None:
+            self.firstToken = time.perf_counter()
+
+# Callback de LangChain que reenvía los tokens de la respuesta a una función (emit del ejecutor de consultas, ver queryExecutor)
+# Se ejecuta en el thread del ejecutor, que no puede pintar en Streamlit: el thread del script recibe los tokens y los pinta con StreamHandler
+class TokenForwarder(BaseCallbackHandler):
+
+    def __init__(self, emit):
+        self.emit = emit
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.emit(token)
+
+# Callback de LangChain que va pintando la respuesta en el mensaje del bot a medida que llegan los tokens del LLM
+class StreamHandler(BaseCallbackHandler):
+
+    def __init__(self, placeholder):
+        self.placeholder = placeholder
+        self.text = ""
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.text += token
+        self.placeholder.write(render_message(bot_template, self.text), unsafe_allow_html=True)
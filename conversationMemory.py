@@ -0,0 +1,97 @@
+#Memoria de la conversación con presupuesto de tokens
+# Con ConversationBufferMemory cada pregunta reenvía todo el historial al prompt que reformula la pregunta (condense question),
+# así que las sesiones largas son cada vez más lentas y caras y acaban superando el contexto del modelo. Con MEMORY_MODE=summary:
+#    - Los últimos MEMORY_KEEP_TURNS turnos (pregunta + respuesta) se guardan tal cual
+#    - Cuando el historial supera MEMORY_MAX_TOKENS tokens (medidos con tiktoken), los turnos más antiguos se resumen
+#      con el LLM y se añaden al resumen que ya había (resumen incremental), que va al principio del historial
+# MEMORY_MODE=buffer mantiene el comportamiento anterior (todo el historial)
+from langchain.memory import ConversationBufferMemory, ConversationSummaryBufferMemory
+from langchain.schema import get_buffer_string
+
+#Tokenizador de OpenAI
+import tiktoken
+
+from textChunker import DEFAULT_ENCODING
+
+# Valores por defecto si no se configuran MEMORY_MODE, MEMORY_MAX_TOKENS y MEMORY_KEEP_TURNS
+DEFAULT_MODE = "summary"
+DEFAULT_MAX_TOKENS = 1000
+DEFAULT_KEEP_TURNS = 2
+
+
+# Función que cuenta los tokens de un texto con la codificación del modelo
+def count_tokens(text, encodingName=DEFAULT_ENCODING):
+    if not text:
+        return 0
+    return len(tiktoken.get_encoding(encodingName).encode_ordinary(text))
+
+
+# Memoria con resumen incremental de los turnos antiguos y presupuesto de tokens
+#    - max_token_limit: tokens máximos del historial (resumen + turnos literales) antes de resumir
+#    - keep_turns: turnos más recientes que nunca se resumen
+class TokenBudgetMemory(ConversationSummaryBufferMemory):
+    keep_turns: int = DEFAULT_KEEP_TURNS
+    encoding_name: str = DEFAULT_ENCODING
+    # Turnos que se han incorporado al resumen desde el principio de la conversación
+    summarized_turns: int = 0
+
+    def count_tokens(self, text):
+        return count_tokens(text, self.encoding_name)
+
+    def _buffer_tokens(self, messages):
+        return self.count_tokens(get_buffer_string(messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix))
+
+    # Función que resume los turnos más antiguos mientras el historial supere el presupuesto
+    # Todos los turnos que salen del buffer se resumen con una sola llamada al LLM
+    def prune(self):
+        buffer = self.chat_memory.messages
+        keepMessages = 2 * max(0, self.keep_turns)
+        summaryTokens = self.count_tokens(self.moving_summary_buffer)
+        pruned = []
+        while len(buffer) > keepMessages and summaryTokens + self._buffer_tokens(buffer) > self.max_token_limit:
+            pruned.extend(buffer[:2])
+            del buffer[:2]
+        if pruned:
+            self.moving_summary_buffer = self.predict_new_summary(pruned, self.moving_summary_buffer)
+            self.summarized_turns += len(pruned) // 2
+
+    # Return: diccionario con los tokens del historial que se envía en la siguiente pregunta (resumen y turnos literales)
+    def usage(self):
+        summaryTokens = self.count_tokens(self.moving_summary_buffer)
+        bufferTokens = self._buffer_tokens(self.chat_memory.messages)
+        return {"history_tokens": summaryTokens + bufferTokens,
+                "summary_tokens": summaryTokens,
+                "buffer_turns": len(self.chat_memory.messages) // 2,
+                "summarized_turns": self.summarized_turns}
+
+    def clear(self):
+        super().clear()
+        self.summarized_turns = 0
+
+
+# Función que crea la memoria de la conversación de un usuario según la configuración (MEMORY_MODE, MEMORY_MAX_TOKENS, MEMORY_KEEP_TURNS)
+#    - llm: LLM con el que se resumen los turnos antiguos (no se usa en modo buffer)
+# Return: memoria de LangChain con memory_key 'chat_history' y mensajes
+def create_memory(config, llm):
+    mode = str(config.get("MEMORY_MODE", DEFAULT_MODE)).lower()
+    if mode == "buffer":
+        return ConversationBufferMemory(memory_key='chat_history', return_messages=True)
+    if mode != "summary":
+        raise ValueError("MEMORY_MODE no soportado: " + mode)
+    return TokenBudgetMemory(llm=llm,
+                             memory_key='chat_history',
+                             return_messages=True,
+                             max_token_limit=int(config.get("MEMORY_MAX_TOKENS", DEFAULT_MAX_TOKENS)),
+                             keep_turns=int(config.get("MEMORY_KEEP_TURNS", DEFAULT_KEEP_TURNS)))
+
+
+# Función que calcula los tokens del historial de cualquier memoria (si no es TokenBudgetMemory, contando todos los mensajes)
+# Return: diccionario como TokenBudgetMemory.usage
+def memory_usage(memory):
+    if isinstance(memory, TokenBudgetMemory):
+        return memory.usage()
+    messages = memory.chat_memory.messages
+    return {"history_tokens": count_tokens(get_buffer_string(messages)),
+            "summary_tokens": 0,
+            "buffer_turns": len(messages) // 2,
+            "summarized_turns": 0}
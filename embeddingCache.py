@@ -0,0 +1,137 @@
+#Cache persistente de embeddings direccionada por contenido
+# La clave de cada embedding es el hash SHA-256 del modelo de embeddings y del texto del chunk,
+# de modo que volver a subir el mismo PDF (o una revisión con la mayoría de chunks iguales) solo envía a OpenAI los chunks nuevos
+# Se guarda en SQLite con un límite de entradas y expulsión LRU (se eliminan las entradas con acceso más antiguo)
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+
+#Interfaz de embeddings de LangChain
+from langchain.embeddings.base import Embeddings
+
+# Fichero SQLite y número máximo de embeddings por defecto si no se configuran EMBEDDING_CACHE_PATH y EMBEDDING_CACHE_MAX_ENTRIES
+DEFAULT_CACHE_PATH = "embedding_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 100000
+
+
+# Almacén SQLite de embeddings con expulsión LRU y contadores de aciertos/fallos
+# Es seguro compartirlo entre threads (sesiones de Streamlit): todos los accesos van protegidos por un lock
+class EmbeddingCache:
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, maxEntries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.maxEntries = int(maxEntries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings ("
+                               "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings(last_access)")
+
+    # Clave de cache: hash del modelo y del texto
+    @staticmethod
+    def make_key(model, text):
+        return hashlib.sha256((model + "\0" + text).encode("utf-8")).hexdigest()
+
+    # Return: diccionario clave -> embedding con las claves encontradas en la cache. Actualiza el último acceso (LRU)
+    def get_many(self, keys):
+        found = {}
+        uniqueKeys = list(set(keys))
+        with self._lock:
+            # SQLite limita el número de parámetros por consulta, se consulta por lotes
+            for i in range(0, len(uniqueKeys), 500):
+                batch = uniqueKeys[i:i + 500]
+                rows = self._conn.execute("SELECT key, vector FROM embeddings WHERE key IN (%s)" % ",".join("?" * len(batch)),
+                                          batch).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                           [(now, key) for key in found])
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    # Guarda los embeddings (diccionario clave -> embedding) y expulsa los más antiguos si se supera maxEntries
+    def put_many(self, items):
+        if not items:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                                   [(key, array("f", vector).tobytes(), now) for key, vector in items.items()])
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.maxEntries:
+                self._conn.execute("DELETE FROM embeddings WHERE key IN "
+                                   "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                                   (count - self.maxEntries,))
+
+    # Return: diccionario con el número de entradas, aciertos, fallos y ratio de aciertos
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            total = self.hits + self.misses
+            return {"entries": entries,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "hit_ratio": self.hits / total if total else 0.0}
+
+
+# Embeddings de LangChain que consultan primero la cache y solo envían al modelo real los textos que no están
+# Guarda sus propios contadores de aciertos/fallos para poder informar del resultado de cada subida
+class CachedEmbeddings(Embeddings):
+
+    def __init__(self, embeddings, cache, model=None):
+        self.embeddings = embeddings
+        self.cache = cache
+        # Por defecto se usa el nombre del modelo del objeto de embeddings (OpenAIEmbeddings.model)
+        self.model = model or getattr(embeddings, "model", type(embeddings).__name__)
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        keys = [self.cache.make_key(self.model, text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        # Solo se envían al modelo los textos que no están en la cache (sin repetir textos iguales)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+
+        hits = sum(1 for key in keys if key not in missing)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+# Una única cache por fichero en todo el proceso, compartida por todas las sesiones
+_caches = {}
+_cachesLock = threading.Lock()
+
+# Función que devuelve la cache de embeddings configurada (EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES)
+# Return: instancia de EmbeddingCache compartida en el proceso
+def get_embedding_cache(config):
+    path = config.get("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH)
+    with _cachesLock:
+        if path not in _caches:
+            _caches[path] = EmbeddingCache(path, config.get("EMBEDDING_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        return _caches[path]
@@ -0,0 +1,57 @@
+#Locks de escritura sobre ficheros compartidos entre threads y entre procesos
+# Los índices FAISS y de palabras clave se cargan completos, se modifican y se vuelven a guardar enteros. La aplicación web y la
+# línea de comandos (gptda2Cli.py) pueden escribir a la vez en el mismo juego: sin un lock entre procesos, el último en guardar
+# sobrescribe los chunks del otro. El lock se toma sobre un fichero <ruta>.lock con fcntl.flock (se libera solo si el proceso muere)
+# En sistemas sin fcntl (Windows) solo se bloquea entre threads del mismo proceso
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Locks entre threads del proceso, uno por fichero de lock
+_threadLocks = {}
+_threadLocksLock = threading.Lock()
+
+
+# Lock exclusivo sobre un fichero de lock. Se usa con with o con acquire/release desde el mismo thread
+class FileLock:
+
+    def __init__(self, lockFile):
+        self.lockFile = lockFile
+        self._file = None
+        with _threadLocksLock:
+            self._threadLock = _threadLocks.setdefault(os.path.abspath(lockFile), threading.Lock())
+
+    # Espera a que ningún otro thread ni proceso tenga el lock
+    def acquire(self):
+        self._threadLock.acquire()
+        try:
+            if fcntl is not None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.lockFile)), exist_ok=True)
+                self._file = open(self.lockFile, "a")
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        except Exception:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._threadLock.release()
+            raise
+
+    def release(self):
+        try:
+            if self._file is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+                self._file.close()
+                self._file = None
+        finally:
+            self._threadLock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
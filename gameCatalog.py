@@ -0,0 +1,186 @@
+#Catálogo local de juegos (SQLite) mantenido por la ingesta
+# Antes la lista de juegos salía de los namespaces del vector store (describe_index_stats en cada sesión nueva) y no se guardaba
+# nada de lo procesado: ni el ID de BGG, ni los ficheros, ni el número de chunks. El catálogo guarda:
+#    - games: namespace -> juego y ID de BGG
+#    - documents: ficheros de cada namespace con su hash (SHA-256), páginas, chunks e instante de la ingesta
+#    - document_chunks: IDs de los chunks de cada fichero en el vector store (para volver a procesarlo o borrarlo sin tocar el resto)
+# La lista de juegos se lee del catálogo (milisegundos). En segundo plano se compara con el vector store (reconcile) para detectar diferencias:
+#    - untracked: namespaces del vector store que no están en el catálogo (se añaden sin documentos)
+#    - missing: juegos del catálogo cuyo namespace ya no existe en el vector store (dejan de mostrarse)
+#    - count_mismatch: namespaces con distinto número de vectores que de chunks registrados
+import json
+import sqlite3
+import threading
+import time
+
+# Valor por defecto si no se configura CATALOG_PATH
+DEFAULT_CATALOG_PATH = "game_catalog.sqlite"
+# Segundos mínimos entre dos comparaciones con el vector store si no se configura GAME_CATALOG_TTL
+DEFAULT_RECONCILE_INTERVAL = 300
+
+
+class GameCatalog:
+
+    def __init__(self, path=DEFAULT_CATALOG_PATH):
+        self._lock = threading.Lock()
+        self._reconcileLock = threading.Lock()
+        self._lastReconcileStart = 0.0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS games ("
+                               "namespace TEXT PRIMARY KEY, game TEXT NOT NULL, bgg_id TEXT, "
+                               "missing INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS documents ("
+                               "namespace TEXT NOT NULL, file_name TEXT NOT NULL, file_hash TEXT NOT NULL, "
+                               "pages INTEGER NOT NULL, chunks INTEGER NOT NULL, ingested_at REAL NOT NULL, "
+                               "PRIMARY KEY (namespace, file_name))")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS document_chunks ("
+                               "namespace TEXT NOT NULL, file_name TEXT NOT NULL, chunk_id TEXT NOT NULL, "
+                               "PRIMARY KEY (namespace, file_name, chunk_id))")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS catalog_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    # Registra (o actualiza, si ya existe un fichero con el mismo nombre en el namespace) un documento procesado
+    #    - chunkIds: IDs de todos los chunks del documento en el vector store. Si es None se mantienen los registrados
+    def record_document(self, namespace, game, bggID, fileName, fileHash, pages, chunks, ingestedAt=None, chunkIds=None):
+        ingestedAt = ingestedAt or time.time()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO games (namespace, game, bgg_id, missing, updated_at) VALUES (?, ?, ?, 0, ?) "
+                               "ON CONFLICT(namespace) DO UPDATE SET game = excluded.game, "
+                               "bgg_id = COALESCE(excluded.bgg_id, games.bgg_id), missing = 0, updated_at = excluded.updated_at",
+                               (namespace, game, bggID, ingestedAt))
+            self._conn.execute("INSERT OR REPLACE INTO documents (namespace, file_name, file_hash, pages, chunks, ingested_at) "
+                               "VALUES (?, ?, ?, ?, ?, ?)",
+                               (namespace, fileName, fileHash, int(pages), int(chunks), ingestedAt))
+            if chunkIds is not None:
+                self._conn.execute("DELETE FROM document_chunks WHERE namespace = ? AND file_name = ?", (namespace, fileName))
+                self._conn.executemany("INSERT OR IGNORE INTO document_chunks (namespace, file_name, chunk_id) VALUES (?, ?, ?)",
+                                       [(namespace, fileName, chunkId) for chunkId in chunkIds])
+
+    # Return: lista con los IDs de los chunks del documento en el vector store. Vacía si el documento no está registrado
+    # o se procesó antes de guardar los IDs
+    def chunk_ids(self, namespace, fileName):
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_id FROM document_chunks WHERE namespace = ? AND file_name = ?",
+                                      (namespace, fileName)).fetchall()
+        return [row[0] for row in rows]
+
+    # Elimina un documento del catálogo. El juego se mantiene aunque no le queden documentos
+    def delete_document(self, namespace, fileName):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM document_chunks WHERE namespace = ? AND file_name = ?", (namespace, fileName))
+            self._conn.execute("DELETE FROM documents WHERE namespace = ? AND file_name = ?", (namespace, fileName))
+
+    # Return: True si el catálogo no tiene ningún juego (primera ejecución con un vector store ya existente)
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM games").fetchone()[0] == 0
+
+    # Return: lista ordenada con el nombre de los juegos cuyo namespace empieza por prefix y existe en el vector store
+    def list_games(self, prefix):
+        with self._lock:
+            rows = self._conn.execute("SELECT game FROM games WHERE missing = 0 AND substr(namespace, 1, ?) = ? ORDER BY game",
+                                      (len(prefix), prefix)).fetchall()
+        return [row[0] for row in rows]
+
+    # Return: diccionario con namespace, game, bgg_id y documents (lista de diccionarios) o None si el namespace no está en el catálogo
+    def get_game(self, namespace):
+        with self._lock:
+            row = self._conn.execute("SELECT namespace, game, bgg_id, missing, updated_at FROM games WHERE namespace = ?",
+                                     (namespace,)).fetchone()
+            if row is None:
+                return None
+            documents = self._conn.execute("SELECT file_name, file_hash, pages, chunks, ingested_at FROM documents "
+                                           "WHERE namespace = ? ORDER BY file_name", (namespace,)).fetchall()
+        return {"namespace": row[0], "game": row[1], "bgg_id": row[2], "missing": bool(row[3]), "updated_at": row[4],
+                "documents": [{"file_name": d[0], "file_hash": d[1], "pages": d[2], "chunks": d[3], "ingested_at": d[4]}
+                              for d in documents]}
+
+    # Marca el juego como modificado sin cambiar sus documentos (ej: se han vuelto a calcular los embeddings de sus chunks)
+    def touch_game(self, namespace, updatedAt=None):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE games SET updated_at = ? WHERE namespace = ?", (updatedAt or time.time(), namespace))
+
+    # Return: versión del contenido del namespace (instante de la última modificación del juego y ficheros, hashes e instantes
+    # de ingesta) o None si no está en el catálogo
+    # Cambia cada vez que se procesa o se borra un documento o se re-embebe el juego, también desde otro proceso (gptda2Cli.py)
+    def content_version(self, namespace):
+        with self._lock:
+            game = self._conn.execute("SELECT updated_at FROM games WHERE namespace = ?", (namespace,)).fetchone()
+            if game is None:
+                return None
+            rows = self._conn.execute("SELECT file_name, file_hash, ingested_at FROM documents WHERE namespace = ? ORDER BY file_name",
+                                      (namespace,)).fetchall()
+        return (game[0],) + tuple(rows)
+
+    # Elimina un namespace del catálogo con sus documentos
+    def delete_game(self, namespace):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM document_chunks WHERE namespace = ?", (namespace,))
+            self._conn.execute("DELETE FROM documents WHERE namespace = ?", (namespace,))
+            self._conn.execute("DELETE FROM games WHERE namespace = ?", (namespace,))
+
+    # Función que compara el catálogo con los namespaces del vector store y lo actualiza
+    #    - backend: backend de vectorBackends (namespace_counts). prefix: prefijo de los namespaces de juegos (PINECONE_PREFIX)
+    # Return: diccionario con untracked, missing, count_mismatch y checked_at. También se guarda como última comparación
+    def reconcile(self, backend, prefix):
+        counts = {namespace: count for namespace, count in backend.namespace_counts().items() if namespace.startswith(prefix)}
+        now = time.time()
+        with self._lock, self._conn:
+            catalog = {row[0]: row[1] for row in self._conn.execute("SELECT namespace, missing FROM games")}
+            chunks = dict(self._conn.execute("SELECT namespace, SUM(chunks) FROM documents GROUP BY namespace").fetchall())
+            untracked = sorted(namespace for namespace in counts if namespace not in catalog)
+            missing = sorted(namespace for namespace in catalog if namespace.startswith(prefix) and namespace not in counts)
+            countMismatch = [{"namespace": namespace, "chunks": chunks[namespace], "vectors": counts[namespace]}
+                             for namespace in sorted(counts)
+                             if namespace in chunks and counts[namespace] is not None and counts[namespace] != chunks[namespace]]
+            for namespace in untracked:
+                self._conn.execute("INSERT INTO games (namespace, game, bgg_id, missing, updated_at) VALUES (?, ?, NULL, 0, ?)",
+                                   (namespace, namespace[len(prefix):], now))
+            for namespace in counts:
+                if catalog.get(namespace):
+                    self._conn.execute("UPDATE games SET missing = 0, updated_at = ? WHERE namespace = ?", (now, namespace))
+            # updated_at solo cambia si cambia el estado (forma parte de content_version)
+            for namespace in missing:
+                if not catalog[namespace]:
+                    self._conn.execute("UPDATE games SET missing = 1, updated_at = ? WHERE namespace = ?", (now, namespace))
+            result = {"untracked": untracked, "missing": missing, "count_mismatch": countMismatch, "checked_at": now}
+            self._conn.execute("INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('last_reconcile', ?)", (json.dumps(result),))
+        return result
+
+    # Return: resultado de la última comparación con el vector store o None si no se ha hecho ninguna
+    def last_reconcile(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM catalog_meta WHERE key = 'last_reconcile'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Función que lanza reconcile en un thread en segundo plano si han pasado interval segundos desde la anterior
+    # Solo se ejecuta una comparación a la vez en el proceso. Los errores (vector store no disponible) se ignoran hasta la siguiente
+    # Return: True si se ha lanzado
+    def reconcile_in_background(self, backend, prefix, interval=DEFAULT_RECONCILE_INTERVAL):
+        with self._lock:
+            if time.time() - self._lastReconcileStart < float(interval) or self._reconcileLock.locked():
+                return False
+            self._lastReconcileStart = time.time()
+
+        def run():
+            with self._reconcileLock:
+                try:
+                    self.reconcile(backend, prefix)
+                except Exception:
+                    pass
+
+        threading.Thread(target=run, name="catalog-reconcile", daemon=True).start()
+        return True
+
+
+# Un único catálogo por fichero en todo el proceso, compartido por todas las sesiones
+_catalogs = {}
+_catalogsLock = threading.Lock()
+
+# Función que devuelve el catálogo configurado (CATALOG_PATH)
+def get_catalog(config):
+    path = config.get("CATALOG_PATH", DEFAULT_CATALOG_PATH)
+    with _catalogsLock:
+        if path not in _catalogs:
+            _catalogs[path] = GameCatalog(path)
+        return _catalogs[path]
@@ -0,0 +1,173 @@
+#Operaciones sobre la biblioteca de juegos (ingesta, borrado y re-embedding) sin Streamlit
+# Las usan la interfaz web (gptda2.py, configuración en st.secrets) y la línea de comandos (gptda2Cli.py, configuración de settings.py)
+# Todas reciben la configuración (config) y los objetos compartidos (backend, embeddings, catálogo) como parámetros
+import hashlib
+
+#Parsing PDF en paralelo (pool de procesos) devolviendo el texto página a página
+from pdfText import iter_pdf_pages
+#Crear chunks válidos para el LLM de OpenAI, medidos en tokens
+from textChunker import iter_chunks, DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS
+#Pipeline de ingesta concurrente de varios PDF
+from ingestPipeline import IngestPipeline, EXTRACT_WORKERS, EMBED_WORKERS
+from vectorBackends import BATCH_SIZE, batched
+#Títulos de juegos de BGG con cache persistente
+from bggResolver import get_resolver
+from tracing import NULL_TRACE
+
+
+# Excepción cuando el ID de BGG del nombre del fichero no existe en la BGG
+class GameNotFoundError(Exception):
+    pass
+
+# Excepción cuando no se conocen los IDs de los chunks de un documento (procesado antes de guardarlos en el catálogo)
+class UnknownChunksError(Exception):
+    pass
+
+# Excepción cuando el fichero no es un documento del juego en el catálogo (ej: nombre mal escrito o juego importado por reconcile)
+class DocumentNotFoundError(UnknownChunksError):
+    pass
+
+
+# Función que obtiene el ID de BGG a partir del nombre del fichero <BGG_ID>_<Type>.pdf. Ej: bggID de 342942_FAQ.pdf o 342942.pdf es 342942
+def get_bgg_id(fileName):
+    # Primero vemos si el nombre contiene un _
+    split = fileName.find('_')
+    if split > 0:
+        breakpoint = split
+    else:
+        # Si no tiene _, cogemos el nombre completo del fichero (sin .pdf)
+        breakpoint = fileName.find('.')
+    return fileName[0:breakpoint]
+
+# Función que obtiene los metadatos de la BGG y abre el PDF. Se puede llamar desde cualquier thread
+#    - fileName: nombre del fichero <BGG_ID>_<Type>.pdf. data: contenido binario del PDF
+#    - resolver: resolvedor de títulos de BGG (bggResolver)
+#    - workers: número de procesos para extraer las páginas (PDF_WORKERS)
+#    - trace: traza donde se miden la consulta a la BGG (bgg) y la apertura del PDF (pdf_open)
+# Return: bggID, gameTitle y generador con el texto de cada página. Lanza GameNotFoundError si el ID no existe en la BGG
+def read_pdf(fileName, data, resolver, workers=None, trace=NULL_TRACE):
+    # Vamos a obtener los metadatos de la BGG del fichero generado: 167791_FAQ.pdf
+    bggID = get_bgg_id(fileName)
+    # Vamos a confirmar que el ID existe.
+    with trace.span("bgg", bgg_id=bggID):
+        gameTitle = resolver.lookup(bggID)
+    if not gameTitle:
+        # BGG ha devuelto una pagina de error generica. El foramto del fichero debe ser BGGID.pdf
+        raise GameNotFoundError("No se ha encontrado el ID:"+bggID+" en la BGG.")
+    # Todo correcto, vamos a leer el PDF. El texto de las páginas se va generando a medida que se consume
+    with trace.span("pdf_open", file=fileName):
+        pages = iter_pdf_pages(data, workers)
+    return bggID, gameTitle, pages
+
+# Funcion que a partir del texto del pdf (página a página), lo divide en chunks de CHUNK_TOKENS tokens con un overlap de CHUNK_OVERLAP_TOKENS
+# Return: Generador con los chunks (texto, página y offset) en los que se divide el texto original
+def get_text_chunks(pages, chunkTokens=DEFAULT_CHUNK_TOKENS, overlapTokens=DEFAULT_OVERLAP_TOKENS):
+    # Se admite también el texto completo como un único string
+    if isinstance(pages, str):
+        pages = [pages]
+    return iter_chunks(pages, chunkTokens, overlapTokens)
+
+
+# Función que procesa varios PDF con el pipeline de ingesta y registra en el catálogo los que se procesan correctamente
+#    - sources: ficheros (objetos con .name y .getvalue()). El Namespace de cada fichero es <prefix><nombre del juego en BGG>
+#    - on_progress(progress): callback opcional con la lista de FileProgress (se llama desde el thread que llama a esta función)
+#    - Configuración: PDF_WORKERS, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, INGEST_EXTRACT_WORKERS, INGEST_EMBED_WORKERS
+# Si un fichero con el mismo nombre ya se había procesado en el juego, solo se insertan sus chunks nuevos y se borran los que han desaparecido
+# Return: lista de FileProgress con el resultado de cada fichero
+def ingest_files(config, backend, embeddings, catalog, sources, prefix, on_progress=None, trace=NULL_TRACE):
+    workers = config.get("PDF_WORKERS")
+    chunkTokens = config.get("CHUNK_TOKENS", DEFAULT_CHUNK_TOKENS)
+    overlapTokens = config.get("CHUNK_OVERLAP_TOKENS", DEFAULT_OVERLAP_TOKENS)
+    resolver = get_resolver(config)
+    # Se resuelven en paralelo los títulos de BGG de todos los ficheros. Quedan en la cache para el pipeline
+    with trace.span("bgg_prefetch") as span:
+        span.count("files", len(sources))
+        resolver.lookup_many([get_bgg_id(source.name) for source in sources])
+
+    # Metadatos de BGG y páginas de cada fichero. Se ejecuta en los threads del pipeline
+    def prepare(source):
+        bggID, gameTitle, pages = read_pdf(source.name, source.getvalue(), resolver, workers, trace)
+        return bggID, gameTitle, prefix+gameTitle, pages
+
+    pipeline = IngestPipeline(backend, embeddings, prepare,
+                              lambda pages: get_text_chunks(pages, chunkTokens, overlapTokens),
+                              knownIds=catalog.chunk_ids,
+                              extractWorkers=config.get("INGEST_EXTRACT_WORKERS", EXTRACT_WORKERS),
+                              embedWorkers=config.get("INGEST_EMBED_WORKERS", EMBED_WORKERS))
+    progress = pipeline.run(sources, on_progress, trace=trace)
+
+    for source, fileProgress in zip(sources, progress):
+        if fileProgress.status == "done":
+            # Se registra el documento en el catálogo de juegos
+            catalog.record_document(fileProgress.namespace, fileProgress.game, fileProgress.bggID, source.name,
+                                    hashlib.sha256(source.getvalue()).hexdigest(), fileProgress.pages, fileProgress.chunks,
+                                    chunkIds=fileProgress.chunkIds)
+    return progress
+
+
+# Función que borra un documento (fichero) de un juego sin volver a procesar el resto de documentos
+# Se borran del vector store y del índice de palabras clave solo los chunks del documento (IDs guardados en el catálogo)
+# Si es el último documento del juego, se borra el namespace completo y el juego del catálogo
+# Return: número de chunks borrados. Lanza DocumentNotFoundError si el fichero no es un documento del juego en el catálogo
+#         (no se borra nada) y UnknownChunksError si el juego tiene más documentos y no se conocen los chunks de este
+def delete_document(backend, catalog, embeddings, namespace, fileName, trace=NULL_TRACE):
+    game = catalog.get_game(namespace)
+    documents = (game or {}).get("documents", [])
+    document = next((document for document in documents if document["file_name"] == fileName), None)
+    if document is None:
+        raise DocumentNotFoundError("El fichero "+fileName+" no es un documento de "+namespace+" en el catálogo")
+    with trace.span("delete_document", namespace=namespace) as span:
+        if len(documents) == 1:
+            chunks = document["chunks"]
+            delete_game(backend, catalog, namespace)
+        else:
+            chunkIds = catalog.chunk_ids(namespace, fileName)
+            if not chunkIds:
+                raise UnknownChunksError("No se conocen los chunks de "+fileName+". Vuelve a procesarlo antes de borrarlo")
+            writer = backend.open_writer(embeddings, namespace)
+            try:
+                writer.delete(chunkIds)
+            finally:
+                writer.close()
+            catalog.delete_document(namespace, fileName)
+            chunks = len(chunkIds)
+        span.count("chunks", chunks)
+    return chunks
+
+# Función que borra un juego completo: namespace del vector store, índice de palabras clave y catálogo
+def delete_game(backend, catalog, namespace):
+    backend.delete_namespace(namespace)
+    catalog.delete_game(namespace)
+
+
+# Función que vuelve a calcular los embeddings de todos los chunks de un namespace y los sobrescribe en el vector store
+# Los textos, metadatos e IDs de los chunks se leen del índice de palabras clave, así que no hace falta volver a leer los PDF
+# (sirve también para reconstruir el namespace en otro backend, por ejemplo al pasar de PineCone a FAISS)
+# Los chunks sin ID (procesados antes de usar IDs deterministas) no se pueden sobrescribir y se saltan
+# Si falla algún lote, no se guarda nada (en FAISS el índice en disco queda como estaba). Si termina bien, se marca el juego como
+# modificado en el catálogo para que la aplicación en marcha descarte el vector store que tiene cargado
+# Return: diccionario con chunks (re-embebidos) y skipped (sin ID). Lanza ValueError si el namespace no tiene índice de palabras clave
+def reembed_namespace(backend, catalog, embeddings, namespace, batchSize=BATCH_SIZE, trace=NULL_TRACE):
+    index = backend.load_keywords(namespace)
+    if index is None:
+        raise ValueError("El namespace "+namespace+" no tiene índice de palabras clave y no se ha podido reconstruir")
+    chunks = [(id, text, metadata) for id, text, metadata in zip(index.ids, index.texts, index.metadatas) if id is not None]
+    result = {"chunks": 0, "skipped": len(index) - len(chunks)}
+    writer = backend.open_writer(embeddings, namespace)
+    try:
+        for batch in batched(chunks, batchSize):
+            texts = [text for _, text, _ in batch]
+            with trace.span("embed") as span:
+                span.count("chunks", len(batch))
+                vectors = embeddings.embed_documents(texts)
+            with trace.span("upsert", namespace=namespace) as span:
+                span.count("chunks", len(batch))
+                writer.add(texts, vectors, [metadata for _, _, metadata in batch], [id for id, _, _ in batch])
+            result["chunks"] += len(batch)
+    except BaseException:
+        writer.discard()
+        raise
+    with trace.span("save", namespace=namespace):
+        writer.close()
+    catalog.touch_game(namespace)
+    return result
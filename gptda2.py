@@ -1,126 +1,218 @@
 #Servidor Streamlit
 import streamlit as st
 #Parsing respuestas bot/humano
-from htmlTemplates import css, bot_template, user_template
+from htmlTemplates import css, bot_template, user_template, render_message
 
 #Capturar variables de entorno
 # from dotenv import dotenv_values
-#Parsing PDF
-from PyPDF2 import PdfReader
-#Crear chunks válidos para el LLM de OpenAI
-from langchain.text_splitter import CharacterTextSplitter
-
-#Creación de embeddings a partir de los chunks. Requiere instalar tiktoken
-from langchain.embeddings import OpenAIEmbeddings
-#Modelo LLM basado en chats
-from langchain.chat_models import ChatOpenAI
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-
-#Conexión con PineCone client (LangChain)
-from langchain.vectorstores import Pinecone
-
-#Descargar de HTML de BGG
-from urllib.request import urlopen
-
-#Parsing HTML de BGG. Requiere installar html5lib para parser de HTML
-from bs4 import BeautifulSoup
-
-#Libreria PineCone Client
-import pinecone
-#Libreria OpenAI Client
-import openai
+#Lectura de PDF, chunks, ingesta y borrado de documentos sin Streamlit (compartido con la línea de comandos gptda2Cli.py)
+import gameLibrary
+from gameLibrary import UnknownChunksError, ingest_files
+
+#LangChain, OpenAI y la memoria/retriever que dependen de LangChain se importan dentro de las funciones la primera vez que se usan
+# (la página del OpenAI Key se muestra sin esperar a estos imports). Cuando se introduce el OpenAI Key se precargan en segundo plano
+from startup import warm_up
+
+#Backends de vector store (PineCone o FAISS local) seleccionados con VECTORSTORE_BACKEND
+from vectorBackends import get_backend
+#Pool de clientes, vector stores y cadenas compartido por todas las sesiones
+from resourcePool import get_resource_pool, hash_key
+#Cache de respuestas por juego (pregunta exacta o parecida)
+from answerCache import get_answer_cache, normalize_question
+#Ejecutor de consultas compartido: llamadas a OpenAI fuera del thread del script, consultas iguales agrupadas, límites y timeouts
+from queryExecutor import get_query_executor, ExecutorBusyError, QueryTimeoutError, DEFAULT_TIMEOUT
+#Catálogo local de juegos y documentos procesados (SQLite)
+from gameCatalog import get_catalog, DEFAULT_RECONCILE_INTERVAL
+#Trazas con los tiempos de cada etapa, exportables en JSONL y como métricas de Prometheus
+from tracing import get_tracer, NULL_TRACE
+
 #Libreria Sistema
 import sys
+import json
+import time
+import threading
+
+# Versión del contenido de cada namespace en el catálogo (content_version) con la que se han creado los recursos del pool
+# y las respuestas de la cache. Es la misma para todas las sesiones del proceso
+_namespaceVersions = {}
+_namespaceVersionsLock = threading.Lock()
+
+# Intentos por defecto de cada llamada a OpenAI (OPENAI_MAX_RETRIES) y segundos que se reservan para la espera entre intentos
+# (LangChain espera entre 1 y 10 segundos antes de reintentar)
+DEFAULT_OPENAI_ATTEMPTS = 2
+OPENAI_RETRY_WAIT = 10
+
+# Función que crea el objeto de embeddings de OpenAI con el OpenAI KEY del formulario web
+# Los embeddings pasan por la cache persistente (EMBEDDING_CACHE_PATH): solo los chunks que no estan en la cache se envian a OpenAI
+# Return: objeto CachedEmbeddings
+def get_embeddings():
+    #Creación de embeddings a partir de los chunks. Requiere instalar tiktoken
+    from langchain.embeddings import OpenAIEmbeddings
+    #Cache persistente de embeddings para no volver a generar los chunks ya procesados
+    from embeddingCache import CachedEmbeddings, get_embedding_cache
+
+    openAI_user_key = st.session_state.openAI_user_key
+    # El cliente de OpenAI se comparte entre sesiones con el mismo OpenAI Key. Los contadores de la cache son de cada llamada
+    embeddings = get_resource_pool(st.secrets).get(("embeddings", hash_key(openAI_user_key)),
+                                                   lambda: OpenAIEmbeddings(openai_api_key=openAI_user_key, **get_openai_limits()))
+    return CachedEmbeddings(embeddings, get_embedding_cache(st.secrets))
+
+# Función que calcula los límites de los clientes de OpenAI para que una llamada lenta no ocupe un thread del ejecutor de consultas
+# más tiempo del que espera la sesión (QUERY_TIMEOUT): intentos x tiempo máximo por intento + esperas entre intentos <= QUERY_TIMEOUT
+#    - OPENAI_MAX_RETRIES: número total de intentos de cada llamada (max_retries de LangChain)
+#    - OPENAI_REQUEST_TIMEOUT: segundos máximos de cada intento. Si no se configura o no cabe en QUERY_TIMEOUT, se usa lo que cabe
+# Return: diccionario con request_timeout y max_retries para ChatOpenAI y OpenAIEmbeddings
+def get_openai_limits():
+    queryTimeout = st.secrets.get("QUERY_TIMEOUT", DEFAULT_TIMEOUT)
+    attempts = max(1, int(st.secrets.get("OPENAI_MAX_RETRIES", DEFAULT_OPENAI_ATTEMPTS)))
+    requestTimeout = max(1.0, (queryTimeout - (attempts - 1) * OPENAI_RETRY_WAIT) / attempts)
+    if st.secrets.get("OPENAI_REQUEST_TIMEOUT"):
+        requestTimeout = min(requestTimeout, st.secrets["OPENAI_REQUEST_TIMEOUT"])
+    return {"request_timeout": requestTimeout, "max_retries": attempts}
+
+# Función que devuelve el backend de vector store configurado, compartido por todas las sesiones (mantiene la conexión con PineCone)
+def get_shared_backend():
+    return get_resource_pool(st.secrets).get(("backend",), lambda: get_backend(st.secrets), ttl=0)
+
+# Función que empieza la traza de una operación de la sesión (subida de ficheros, pregunta...). Las funciones la obtienen con current_trace()
+def start_trace(name, **attrs):
+    trace = get_tracer(st.secrets).start(name, **attrs)
+    st.session_state.trace = trace
+    return trace
+
+# Return: traza de la operación en curso de la sesión, o una traza vacía si no hay ninguna
+def current_trace():
+    return st.session_state.get("trace") or NULL_TRACE
+
+# Función que termina la traza (se exporta a JSONL y a las métricas) y guarda su resumen para mostrarlo en el sidebar
+def finish_trace(trace):
+    trace.finish()
+    st.session_state.lastTrace = {"name": trace.name,
+                                  "seconds": trace.duration,
+                                  "stages": trace.summary(),
+                                  "errors": list(trace.errors),
+                                  "jsonl": json.dumps(trace.to_dict(), ensure_ascii=False) + "\n"}
+    st.session_state.trace = None
+
+# Función que muestra en el sidebar un desplegable con los tiempos por etapa de la última operación
+def render_trace():
+    lastTrace = st.session_state.get("lastTrace")
+    if not lastTrace:
+        return
+    with st.sidebar.expander("Tiempos: "+lastTrace["name"]+" ("+str(round(lastTrace["seconds"]*1000))+" ms)"):
+        for stage in lastTrace["stages"]:
+            line = "**"+stage["stage"]+"**: "+str(round(stage["seconds"]*1000))+" ms"
+            if stage["calls"] > 1:
+                line += " ("+str(stage["calls"])+" llamadas)"
+            counts = ", ".join(name+" "+str(value) for name, value in stage["counts"].items())
+            if counts:
+                line += " · "+counts
+            st.markdown(line)
+        for error in lastTrace["errors"]:
+            st.error(error["stage"]+": "+error["error"])
+        st.download_button("Descargar traza (JSONL)", lastTrace["jsonl"], file_name="trace.jsonl", mime="application/json")
+
+# Función que descarta del pool los recursos asociados a un namespace (vector store y cadenas)
+# Se llama despues de crear embeddings nuevos en el namespace para que las siguientes consultas vean los datos nuevos
+# También se vacía la cache de respuestas del juego: las respuestas anteriores pueden no reflejar las reglas nuevas
+def invalidate_namespace(namespace):
+    pool = get_resource_pool(st.secrets)
+    pool.invalidate_where(lambda key: key[-1] == namespace)
+    get_answer_cache(st.secrets).invalidate(namespace)
+    version = get_catalog(st.secrets).content_version(namespace)
+    with _namespaceVersionsLock:
+        _namespaceVersions[namespace] = version
+
+# Función que descarta los recursos y las respuestas de la cache de un namespace si sus documentos han cambiado en el catálogo
+# desde otro proceso (gptda2Cli.py ingest, delete-document o delete-game). Se llama antes de usar el vector store o la cache del juego
+# Return: True si se han descartado
+def refresh_namespace(namespace):
+    version = get_catalog(st.secrets).content_version(namespace)
+    with _namespaceVersionsLock:
+        if namespace not in _namespaceVersions:
+            _namespaceVersions[namespace] = version
+            return False
+        if _namespaceVersions[namespace] == version:
+            return False
+    invalidate_namespace(namespace)
+    return True
+
+# Función que procesa a la vez varios PDF con el pipeline de ingesta (extracción, embeddings e inserción en paralelo)
+# Muestra en el sidebar una barra de progreso por fichero y el resultado de cada uno
+# El Namespace de cada fichero tiene la estructura de <prefix-><nombre del juego> donde <nombre del juego> es el nombre en la BGG asociado al ID del PDF
+# Si un fichero con el mismo nombre ya se había procesado en el juego, solo se insertan sus chunks nuevos y se borran los que han desaparecido
+# Return: lista con el nombre de los juegos de los ficheros procesados correctamente y si todos los ficheros se han procesado sin error
+def ingest_pdfs(pdf_docs, pineConePrefix):
+    with st.sidebar:
+        progressBars = [st.progress(0.0, text=pdf.name) for pdf in pdf_docs]
 
-# Función que parsea objeto PDF (subido por el usuario)
-#    - Return: bggID: Extracto a partir del nombre generado por el usuario <BGG_ID>_<Type>.pdf. Ej: bggID de 342942_FAQ.pdf o 342942.pdf es 342942
-#    - gameTitle: Se conecta a la URL https://boardgamegeek.com/boardgame/'+bggID y parsea el título (primer string antes de |). Página de error empiezan por BoardGameGeek
-#    - text: Extracción de texto sin formato a partir del PDF creado por el usuario
-# En el caso de error (juego no encontrado en BGG, error parseando PDF...) devuelve 0,'',''
+    # Se llama desde el thread de Streamlit mientras el pipeline trabaja en segundo plano
+    def on_progress(progress):
+        for progressBar, fileProgress in zip(progressBars, progress):
+            text = fileProgress.name
+            if fileProgress.game:
+                text += " ("+fileProgress.game+")"
+            text += ": "+str(fileProgress.pages)+" páginas, "+str(fileProgress.upserted)+"/"+str(fileProgress.chunks)+" chunks"
+            progressBar.progress(fileProgress.fraction(), text=text)
 
-def get_pdf_text(pdf):
-    text = ""
     try:
-        # Vamos a obtener los metadatos de la BGG del fichero generado: 167791_FAQ.pdf
-        # Primero vemos si el nombre contiene un _
-        split = pdf.name.find('_')
-        if split > 0:
-            breakpoint = split
-        else:
-            # Si no tiene _, cogemos el nombre completo del fichero (sin .pdf)
-            breakpoint = pdf.name.find('.')
-
-        # Obtemeos el ID de BGG a partir del nombre del fichero
-        bggID = pdf.name[0:breakpoint]
-        url = 'https://boardgamegeek.com/boardgame/'+bggID
-        # Vamos a confirmar que el ID existe. 
-        # Usamos BeautifulSoup module para leer el HTML de la página de BGG asociada al nombre
-        soup = BeautifulSoup(urlopen(url), features="html5lib")
-        # Extraemos el título
-        BGGtitle = soup.title.get_text()
-        # Y nos quedamos con la primera parte antes de |
-        guion = BGGtitle.find(' |')
-        gameTitle = BGGtitle[0:guion]
-        if gameTitle == "BoardGameGeek":
-            # BGG ha devuelto una pagina de error generica. El foramto del fichero debe ser BGGID.pdf
-            with st.sidebar:
-                st.warning("No se ha encontrado el ID:"+bggID+" en la BGG.")
-        else:
-            # Todo correcto, vamos a leer el PDF y guardamos el texto en la variable text 
-            pdf_reader = PdfReader(pdf)
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-            return bggID, gameTitle, text
+        embeddings = get_embeddings()
+        progress = ingest_files(st.secrets, get_shared_backend(), embeddings, get_catalog(st.secrets),
+                                pdf_docs, pineConePrefix, on_progress, current_trace())
     except Exception:
         type, value, traceback = sys.exc_info()
         with st.sidebar:
-            st.warning("Error procesando "+pdf.name)
-    return 0,'',''
-
-# Funcion que a partir del texto completo del pdf, lo divide en token válidos para luego procesarlos en OpenAI
-# Usamos chunks de 1000 caracteres con un overlap de 100
-# Return: Chunks en los que se divide el texto original
-def get_text_chunks(text):
-    # Usamos la libreria de LangChain CharacterTextSplitter. Easy
-    text_splitter = CharacterTextSplitter(
-        separator="\n",
-        chunk_size=1000,
-        chunk_overlap=100,
-        length_function=len
-    )
-    chunks = text_splitter.split_text(text)
-    return chunks
-
-# Función que CREA embeddings en PineCone con chunks de texto que vienen del PDF
-# Usa variables de entorno para conectarse a PineCone. Los embeddings los genera en OpenAI a través del Open AI KEY del formulario web
-# El Namespace tiene la estructura de <prefix-><nombre del juego> donde <nombre del juego> es el nombre en la BGG asociado al ID del PDF
-# Return: vectorstore creado para usar búsquedas con LLM o False si existe un error 
-def create_vectorstore(text_chunks, namespace):
+            st.error("Error procesando los ficheros", icon="🚨")
+        return [], False
+
+    games = []
+    with st.sidebar:
+        for fileProgress in progress:
+            if fileProgress.namespace:
+                invalidate_namespace(fileProgress.namespace)
+            if fileProgress.status == "done":
+                games.append(fileProgress.game)
+                # Feedback al usuario si el fichero ya se había procesado antes
+                if fileProgress.unchanged or fileProgress.deleted:
+                    st.info(fileProgress.name+": "+str(fileProgress.unchanged)+" de "+str(fileProgress.chunks)+
+                            " chunks sin cambios, "+str(fileProgress.deleted)+" chunks antiguos borrados")
+            else:
+                st.warning("Error procesando "+fileProgress.name+": "+str(fileProgress.error))
+        # Feedback al usuario de cuantos chunks se han reutilizado de la cache
+        if embeddings.hits:
+            st.info(str(embeddings.hits)+" de "+str(embeddings.hits+embeddings.misses)+" chunks ya estaban en la cache de embeddings")
+    return games, len(games) == len(progress)
+
+# Función que borra un documento (fichero) de un juego sin volver a procesar el resto de documentos
+# Se borran del vector store y del índice de palabras clave solo los chunks del documento (IDs guardados en el catálogo)
+# Si es el último documento del juego, se borra el namespace completo y el juego del catálogo
+# Return: True si se ha borrado o False si existe un error
+def delete_document(namespace, fileName):
     try:
-        embeddings = OpenAIEmbeddings(openai_api_key=st.session_state.openAI_user_key)
-        vectorstore =  Pinecone.from_texts(api_key=st.secrets["PINECONE_API_KEY"],
-                                           environment=st.secrets["PINECONE_ENVIROMENT"],
-                                           texts=text_chunks, 
-                                           embedding=embeddings, 
-                                           index_name=st.secrets["PINECONE_INDEXNAME"],
-                                           namespace=namespace)
-        return vectorstore
+        gameLibrary.delete_document(get_shared_backend(), get_catalog(st.secrets), get_embeddings(),
+                                    namespace, fileName, current_trace())
+        invalidate_namespace(namespace)
+        return True
+    except UnknownChunksError as error:
+        # Documentos procesados antes de guardar los IDs de los chunks: no se pueden borrar sin borrar el juego
+        with st.sidebar:
+            st.warning(str(error))
     except Exception:
         type, value, traceback = sys.exc_info()
         with st.sidebar:
-            st.error("Error procesando el fichero", icon="🚨")
-        return False
+            st.error("Error borrando el fichero "+fileName, icon="🚨")
+    return False
 
 # Función que retorno un vectorstore con los embeddings del juego namespace
 # El Namespace tiene la estructura de <prefix-><nombre del juego> donde <nombre del juego> es el nombre en la BGG asociado al ID del PDF
+# El vectorstore se comparte entre las sesiones con el mismo OpenAI Key (pool de recursos)
 # Return: vectorstore asociado al juego para usar búsquedas con LLM o False si existe un error 
 def get_vectorstore(namespace):
     try:
-        embeddings = OpenAIEmbeddings(openai_api_key=st.session_state.openAI_user_key)
-        vectorstore =  Pinecone.from_existing_index(embedding=embeddings,
-                                                    index_name=st.secrets["PINECONE_INDEXNAME"],
-                                                    namespace=namespace)
+        refresh_namespace(namespace)
+        with current_trace().span("vectorstore", namespace=namespace):
+            vectorstore = get_resource_pool(st.secrets).get(("vectorstore", hash_key(st.session_state.openAI_user_key), namespace),
+                                                            lambda: get_shared_backend().get_vectorstore(get_embeddings(), namespace))
         return vectorstore
     except Exception:
         type, value, traceback = sys.exc_info()
@@ -129,18 +221,58 @@ def get_vectorstore(namespace):
         return False
 
 # Función que crea objeto ConversationalRetrievalChain de LangChain para hacer preguntas sobre los embeddings del VectorStore
-# ConversationalRetrievalChain tiene almacenado historial de búsquedas para dar contexto sobre nuevas búsquedas
+# ConversationalRetrievalChain tiene almacenado historial de búsquedas para dar contexto sobre nuevas búsquedas
+# Si se indica el namespace, el LLM y las cadenas se comparten entre sesiones (pool de recursos). La memoria es siempre propia de la sesión
 # Return: conversation_chain la conversación o False si existe un error 
-def get_conversation_chain(vectorstore):
+def get_conversation_chain(vectorstore, namespace=None):
+    #Modelo LLM basado en chats
+    from langchain.chat_models import ChatOpenAI
+    from langchain.chains import ConversationalRetrievalChain, LLMChain
+    from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
+    from langchain.chains.question_answering import load_qa_chain
+    #Memoria de la conversación con presupuesto de tokens (resumen de los turnos antiguos)
+    from conversationMemory import create_memory
+    #Retriever híbrido: palabras clave (BM25) + similitud de embeddings
+    from hybridRetriever import create_retriever
+
     try:
-        # Creamos el objeto LLM con el OpenAI UserKey del formulario web
-        llm = ChatOpenAI(openai_api_key=st.session_state.openAI_user_key)
-        # Creamos un Buffer con el historico de consultas del usuario (vacio)
-        memory = ConversationBufferMemory(memory_key='chat_history', return_messages=True)
-        # Creamos objeto de coneversación basado en OpenAI
-        conversation_chain = ConversationalRetrievalChain.from_llm(
-            llm=llm,
-            retriever=vectorstore.as_retriever(),
+        openAI_user_key = st.session_state.openAI_user_key
+
+        def build_chain():
+            # Índice de palabras clave del juego (None si no existe ni se puede reconstruir: solo búsqueda por similitud)
+            # Con PineCone, si el índice no está en el disco de esta máquina se reconstruye desde los metadatos del namespace
+            keywordIndex = get_shared_backend().load_keywords(namespace) if namespace else None
+            # Creamos el objeto LLM con el OpenAI UserKey del formulario web
+            # Con un tiempo máximo por llamada para que una respuesta lenta de OpenAI no deje ocupado un thread del ejecutor de consultas
+            llm = ChatOpenAI(openai_api_key=openAI_user_key, **get_openai_limits())
+            # La respuesta se genera en modo streaming para pintar los tokens a medida que llegan (callbacks en answer_question)
+            # La reformulación de la pregunta no se muestra al usuario y se pide completa
+            streamingLlm = ChatOpenAI(openai_api_key=openAI_user_key, streaming=True, **get_openai_limits())
+            # Creamos objeto de coneversación basado en OpenAI (mismas cadenas que ConversationalRetrievalChain.from_llm)
+            return ConversationalRetrievalChain(
+                retriever=create_retriever(st.secrets, vectorstore, keywordIndex),
+                combine_docs_chain=load_qa_chain(streamingLlm, chain_type="stuff"),
+                question_generator=LLMChain(llm=llm, prompt=CONDENSE_QUESTION_PROMPT)
+            )
+
+        with current_trace().span("chain") as span:
+            if namespace:
+                sharedChain = get_resource_pool(st.secrets).get(("chain", hash_key(openAI_user_key), namespace), build_chain)
+            else:
+                sharedChain = build_chain()
+            keywordSearch = sharedChain.retriever.keywordIndex is not None
+            span.set("keyword_index", keywordSearch)
+        # Sin índice de palabras clave las respuestas usan solo la búsqueda por similitud (sin fast path): se avisa al usuario
+        if namespace and not keywordSearch:
+            with st.sidebar:
+                st.caption("Este juego no tiene índice de palabras clave: se busca solo por similitud. Vuelve a procesar sus PDF para crearlo")
+        # Creamos la memoria con el historico de consultas del usuario (vacia). Los turnos antiguos se resumen con el LLM que reformula las preguntas
+        memory = create_memory(st.secrets, sharedChain.question_generator.llm)
+        # Cadena con la memoria del usuario que reutiliza las cadenas internas (LLM, retriever) de la cadena compartida
+        conversation_chain = ConversationalRetrievalChain(
+            retriever=sharedChain.retriever,
+            combine_docs_chain=sharedChain.combine_docs_chain,
+            question_generator=sharedChain.question_generator,
             memory=memory
         )
         return conversation_chain
@@ -150,27 +282,169 @@ def get_conversation_chain(vectorstore):
             st.error("Error realizando la consulta a OpenAI", icon="🚨")
         return False
     
+# Función que responde a una pregunta con los pasos de ConversationalRetrievalChain, consultando antes la cache de respuestas del juego
+#    1. Si hay historial, se reformula la pregunta como pregunta independiente (condense question). La primera pregunta se usa tal cual
+#    2. Se busca la pregunta en la cache del namespace: primero por texto normalizado y despues por similitud de embeddings
+#       Si la pregunta es una búsqueda evidente por palabras clave (fast path del retriever), no se calcula su embedding
+#    3. Si no está, se recuperan los chunks (palabras clave + vector store), se genera la respuesta con el LLM y se guarda en la cache
+# La pregunta y la respuesta se guardan en la memoria de la conversación del usuario
+# Las llamadas a OpenAI y al vector store se ejecutan en el ejecutor de consultas compartido (queryExecutor) con el namespace como clave
+# (salvo el resumen de la memoria, que se hace en el thread que llama una vez obtenida la respuesta)
+# Si otra sesión está respondiendo ya la misma pregunta (reformulada y normalizada) del mismo juego, se espera a su respuesta (pasos 2 y 3)
+#    - callbacks: objetos con on_llm_new_token(token) que reciben los tokens de la respuesta mientras se genera (StreamHandler)
+#      Se llaman desde el thread que llama a answer_question (el thread del script de Streamlit)
+#    - trace: traza donde se mide cada paso (condense, answer_cache, keyword_fast_path, embed_query, retrieve, llm, memory)
+#      y la espera de la respuesta (answer, con coalesced=True si se ha compartido con otra sesión)
+# Return: diccionario con question, answer, chat_history, cached (True si la respuesta viene de la cache), coalesced y usage (tokens del turno)
+#         Lanza ExecutorBusyError si hay demasiadas consultas pendientes, QueryTimeoutError si entre la reformulación y la respuesta
+#         se superan QUERY_TIMEOUT segundos y QueryFailedError si falla la llamada a OpenAI o al vector store
+def answer_question(conversation, question, namespace, callbacks=None, trace=NULL_TRACE):
+    from langchain.chains.conversational_retrieval.base import _get_chat_history
+    from conversationMemory import memory_usage, count_tokens
+    #Callbacks que miden el tiempo hasta el primer token y reenvían los tokens de la respuesta a las sesiones que la esperan
+    from chatCallbacks import FirstTokenTimer, TokenForwarder
+
+    executor = get_query_executor(st.secrets)
+    # La reformulación y la respuesta comparten un único tiempo máximo (QUERY_TIMEOUT): la respuesta espera solo lo que queda
+    deadline = time.monotonic() + executor.timeout if executor.timeout else None
+
+    def remaining():
+        return deadline - time.monotonic() if deadline is not None else None
+
+    memory = conversation.memory
+    chat_history = memory.load_memory_variables({})[memory.memory_key]
+    # Tokens del historial que se envían para reformular la pregunta
+    usage = memory_usage(memory)
+    if chat_history:
+        def condense(emit):
+            with trace.span("condense") as span:
+                span.count("history_tokens", usage["history_tokens"])
+                return conversation.question_generator.run(question=question, chat_history=_get_chat_history(chat_history))
+        standalone_question, _ = executor.run(namespace, condense, timeout=remaining())
+    else:
+        standalone_question = question
+
+    answerCache = get_answer_cache(st.secrets)
+    with trace.span("answer_cache"):
+        answer = answerCache.get_exact(namespace, standalone_question)
+    cached = answer is not None
+    coalesced = False
+    if not cached:
+        # Los embeddings usan el OpenAI Key de la sesión (st.session_state): se obtienen antes de pasar al thread del ejecutor
+        embeddings = get_embeddings()
+
+        # Pasos 2 y 3 en un thread del ejecutor. Return: (respuesta, True si viene de la cache)
+        def respond(emit):
+            questionVector = None
+            docs = None
+            fastPath = getattr(conversation.retriever, "keyword_fast_path", None)
+            if fastPath:
+                with trace.span("keyword_fast_path") as span:
+                    docs = fastPath(standalone_question)
+                    span.count("hits", int(docs is not None))
+                    span.count("chunks", len(docs or []))
+            if docs is None:
+                # El embedding de la pregunta queda en la cache de embeddings y el retriever lo reutiliza
+                with trace.span("embed_query"):
+                    questionVector = embeddings.embed_query(standalone_question)
+                with trace.span("answer_cache"):
+                    answer = answerCache.get_similar(namespace, questionVector)
+                if answer is not None:
+                    return answer, True
+                with trace.span("retrieve") as span:
+                    # Si ya se ha probado el fast path, se va directamente a la búsqueda híbrida (no se repite la búsqueda BM25)
+                    if fastPath:
+                        docs = conversation.retriever.hybrid_search(standalone_question)
+                    else:
+                        docs = conversation.retriever.get_relevant_documents(standalone_question)
+                    span.count("chunks", len(docs))
+            with trace.span("llm") as span:
+                span.count("context_tokens", sum(count_tokens(doc.page_content) for doc in docs))
+                timer = FirstTokenTimer()
+                answer = conversation.combine_docs_chain.run(input_documents=docs, question=standalone_question,
+                                                             callbacks=[TokenForwarder(emit), timer])
+                span.count("answer_tokens", count_tokens(answer))
+                if timer.firstToken is not None:
+                    span.set("first_token_seconds", timer.firstToken - timer.start)
+            answerCache.put(namespace, standalone_question, answer, questionVector)
+            return answer, False
+
+        def on_token(token):
+            for callback in callbacks or []:
+                callback.on_llm_new_token(token)
+
+        with trace.span("answer") as span:
+            (answer, cached), coalesced = executor.run(namespace, respond, groupKey=(namespace, normalize_question(standalone_question)),
+                                                       on_token=on_token, timeout=remaining())
+            span.set("coalesced", coalesced)
+
+    # Si la memoria supera el presupuesto de tokens, aquí se resumen los turnos antiguos con el LLM
+    # Se guarda en el thread de la sesión y no en el ejecutor: si el ejecutor estuviera ocupado se perdería una respuesta ya mostrada
+    with trace.span("memory"):
+        memory.save_context({"question": question}, {"answer": answer})
+    usage["question_tokens"] = count_tokens(standalone_question)
+    usage["answer_tokens"] = count_tokens(answer)
+    return {"question": question,
+            "answer": answer,
+            "chat_history": memory.load_memory_variables({})[memory.memory_key],
+            "cached": cached,
+            "coalesced": coalesced,
+            "usage": usage}
+
 # Función que invoca el objeto ConversationalRetrievalChain para hacer preguntas. Las preguntas y respuestas, se las envia a Streamlit para pintarlas en pantalla
+#    - La pregunta actual se pinta arriba y la respuesta se va completando token a token debajo
+#    - Los turnos anteriores se pintan con el fragmento HTML guardado en st.session_state.chat_html (no se vuelve a generar todo el histórico)
 # Return: False si ha habido error invocando ConversationalRetrievalChain
 def handle_userinput(user_question):
+    #Callback para recibir los tokens de la respuesta a medida que los genera el LLM
+    from chatCallbacks import StreamHandler
+
     try:
-        # Lanzamos la pregunta al objeto ConversationalRetrievalChain con la pregunta del usuario
-        response = st.session_state.conversation({'question': user_question})
-        # Añadimos la respuesta al histórico de chats
+        namespace = st.secrets["PINECONE_PREFIX"]+st.session_state.selectedGame
+        questionHtml = render_message(user_template, user_question)
+        st.write(questionHtml, unsafe_allow_html=True)
+        answerPlaceholder = st.empty()
+        usagePlaceholder = st.empty()
+        # Mientras se genera la respuesta ya se ven los turnos anteriores
+        if st.session_state.chat_html:
+            st.write(st.session_state.chat_html, unsafe_allow_html=True)
+
+        # Si los documentos del juego han cambiado desde la línea de comandos, se vuelve a crear la cadena (con el vector store
+        # y el índice de palabras clave nuevos) manteniendo la memoria de la conversación
+        if refresh_namespace(namespace):
+            memory = st.session_state.conversation.memory
+            vectorstore = get_vectorstore(namespace)
+            conversation = get_conversation_chain(vectorstore, namespace) if vectorstore else False
+            if not conversation:
+                return False
+            conversation.memory = memory
+            st.session_state.conversation = conversation
+        # Lanzamos la pregunta al objeto ConversationalRetrievalChain con la pregunta del usuario (o la respondemos desde la cache)
+        response = answer_question(st.session_state.conversation, user_question, namespace,
+                                   callbacks=[StreamHandler(answerPlaceholder)], trace=current_trace())
+        answerHtml = render_message(bot_template, response['answer'])
+        answerPlaceholder.write(answerHtml, unsafe_allow_html=True)
+        usage = response['usage']
+        usageText = "Tokens: historial " + str(usage['history_tokens']) + " (resumen " + str(usage['summary_tokens']) + ", " + \
+            str(usage['summarized_turns']) + " turno(s) resumido(s)), pregunta " + str(usage['question_tokens']) + \
+            ", respuesta " + str(usage['answer_tokens'])
+        if response['cached']:
+            usageText = "Respuesta obtenida de la cache de preguntas frecuentes. " + usageText
+        elif response['coalesced']:
+            usageText = "Respuesta compartida con otro usuario que ha hecho la misma pregunta a la vez. " + usageText
+        usagePlaceholder.caption(usageText)
+        # Añadimos la respuesta al histórico de chats. El turno nuevo se añade al principio del HTML (primero el más reciente)
         st.session_state.chat_history = response['chat_history']
-                
-        # Por defecto, el orden es primero el primer mensaje, para pintarlo en orden inverso, hacemos copia del chat_history y le damos la vuelta
-        reverseChatHistory = st.session_state.chat_history[::-1]
-        userMessage = ""
-        for i, message in enumerate(reverseChatHistory):
-            # Los mensajes pares son los mensajes del usaurio, los impares las respuesta. Queremos que se muestre por parejas, pero primero la pregunta (arriba) y despues la respuesta (abajo)
-            if i % 2 == 0:
-                userMessage = message
-            else:
-                st.write(bot_template.replace(
-                    "{{MSG}}", message.content), unsafe_allow_html=True)
-                st.write(user_template.replace(
-                    "{{MSG}}", userMessage.content), unsafe_allow_html=True)
+        st.session_state.chat_html = questionHtml + answerHtml + (st.session_state.chat_html or "")
+        st.session_state.lastQuestion = (st.session_state.selectedGame, user_question)
+    except ExecutorBusyError:
+        with st.sidebar:
+            st.warning("Hay muchas consultas en curso. Vuelve a intentarlo en unos segundos")
+        return False
+    except QueryTimeoutError:
+        with st.sidebar:
+            st.warning("OpenAI está tardando demasiado en responder. Vuelve a intentarlo en unos segundos")
+        return False
     except Exception:
         type, value, traceback = sys.exc_info()
         with st.sidebar:
@@ -195,55 +469,83 @@ def checkOpenAIKey(openAI_user_key):
     #    checkOpenAIKey = False
 
     checkOpenAIKey = True
+    #Libreria OpenAI Client
+    import openai
     openai.api_key = openAI_user_key
 
-# Función que cargar todos los juegos almacenados en PineCone para devolver la lista de juegos disponibles
-# Return: Lista de juegos (array) o False si ha encontrado algun error. Puede devolver una lista vacia ([]) si no se encuetra en Pinecone ningun namespace que empiece por el prefix configurado
+    # Precarga en segundo plano de LangChain y de la conexión con el vector store (una sola vez por proceso)
+    if st.secrets.get("WARMUP", True):
+        backend = get_shared_backend()
+        warm_up([("vectorstore_connect", backend.warm_up)], get_tracer(st.secrets))
+
+# Función que cargar todos los juegos del catálogo local (SQLite) para devolver la lista de juegos disponibles
+# El catálogo lo mantiene la ingesta. En segundo plano, como mucho cada GAME_CATALOG_TTL segundos, se compara con el vector store (PineCone o FAISS local)
+# Si el catálogo está vacío (juegos procesados antes de existir el catálogo), se importan antes los namespaces del vector store
+# Return: Lista de juegos (array) o False si ha encontrado algun error. Puede devolver una lista vacia ([]) si no se encuetra ningun namespace que empiece por el prefix configurado
 def load_games():
     try:
-        # Cargamos las variables de entorno relacionadas con PineCone
-
         #Configuracion gestionado por Streamlit. Para debugging en local crear fichero en .streamlit/secrests.toml
-        pinecone.init(api_key=st.secrets["PINECONE_API_KEY"], 
-                      environment=st.secrets["PINECONE_ENVIROMENT"])
-        
-        pineconeIndexName = st.secrets["PINECONE_INDEXNAME"]
-        if pineconeIndexName:
-            # Si no esta el indice creado, se crea en PineCone. En este caso, la lista de juegos estará vacia
-            if pineconeIndexName not in pinecone.list_indexes():
-                    pinecone.create_index(pineconeIndexName, 
-                                        dimension=1536, 
-                                        metric='cosine', 
-                                        pods=1, 
-                                        replicas=1, 
-                                        pod_type='p1.x1')
-            
-            pineconeIndex = pinecone.Index(index_name=pineconeIndexName)
-            # Retorna el listado de Namespace asocaidos al indice y cuenta configurado de Pinecone
-            index_stats_response = pineconeIndex.describe_index_stats()
-            pineconeNamespaces = index_stats_response.get("namespaces")
-
-            # Registramos en gamesNamepsaces los gamespaces asociados al prefijo de juegos da2 (configurable en .env)
-            gamesNamepsaces = []
-            pineConePrefixLen = len(st.secrets["PINECONE_PREFIX"])
-            for namespace in pineconeNamespaces:
-                # Si el nombre del namespace (ej: 'gptda2-Deep Sea Adventure') empieza por el prefix configurado ('gptda2-')
-                if namespace.startswith(st.secrets["PINECONE_PREFIX"]):
-                    # Se añade a la lista de juegos con embeddings generado
-                    gameName = namespace[pineConePrefixLen:]
-                    gamesNamepsaces.append(gameName)
-
-            # Antes de devolver la lista de juegos, se ordena alfabeticamente
-            gamesNamepsaces.sort()
-            return gamesNamepsaces
+        pineConePrefix = st.secrets["PINECONE_PREFIX"]
+        catalog = get_catalog(st.secrets)
+        if catalog.is_empty():
+            # Si no esta el indice creado en PineCone, se crea. En este caso, la lista de juegos estará vacia
+            with current_trace().span("catalog_reconcile"):
+                catalog.reconcile(get_shared_backend(), pineConePrefix)
         else:
-            return False
+            catalog.reconcile_in_background(get_shared_backend(), pineConePrefix,
+                                            st.secrets.get("GAME_CATALOG_TTL", DEFAULT_RECONCILE_INTERVAL))
+        # Juegos cuyo namespace (ej: 'gptda2-Deep Sea Adventure') empieza por el prefix configurado ('gptda2-'), ordenados alfabeticamente
+        with current_trace().span("catalog"):
+            return catalog.list_games(pineConePrefix)
     except Exception:
         type, value, traceback = sys.exc_info()
         with st.sidebar:
             st.error("Error al cargar la base de datos. Recarga la página", icon="🚨")
         return False
 
+# Función que muestra en el sidebar un desplegable con los ficheros del juego (catálogo) y un botón para borrar cada uno
+# Después de borrar se recarga la página: la conversación se vuelve a crear y, si el juego se ha quedado sin ficheros, desaparece de la lista
+def render_documents(namespace):
+    try:
+        game = get_catalog(st.secrets).get_game(namespace)
+    except Exception:
+        return
+    if not game or not game["documents"]:
+        return
+    with st.expander("Ficheros de "+game["game"]):
+        for document in game["documents"]:
+            st.caption(document["file_name"]+": "+str(document["pages"])+" páginas, "+str(document["chunks"])+" chunks")
+            if st.button("Borrar "+document["file_name"], key="delete-"+namespace+"/"+document["file_name"]):
+                trace = start_trace("delete", game=game["game"])
+                deleted = delete_document(namespace, document["file_name"])
+                finish_trace(trace)
+                if deleted:
+                    if get_catalog(st.secrets).get_game(namespace) is None:
+                        gameList = [name for name in st.session_state.gameList if name != game["game"]]
+                        st.session_state.gameList = gameList
+                        st.session_state.gameListIndex = 0
+                    st.session_state.selectedGame = None
+                    st.experimental_rerun()
+
+# Función que avisa en el sidebar si la última comparación del catálogo con el vector store ha encontrado diferencias
+def render_catalog_drift():
+    try:
+        lastReconcile = get_catalog(st.secrets).last_reconcile()
+    except Exception:
+        return
+    if not lastReconcile:
+        return
+    messages = []
+    if lastReconcile["missing"]:
+        messages.append("sin datos en el vector store: "+", ".join(lastReconcile["missing"]))
+    if lastReconcile["count_mismatch"]:
+        messages.append("con distinto número de chunks: "+", ".join(
+            mismatch["namespace"]+" ("+str(mismatch["chunks"])+" registrados, "+str(mismatch["vectors"])+" en el vector store)"
+            for mismatch in lastReconcile["count_mismatch"]))
+    if messages:
+        with st.sidebar:
+            st.warning("Catálogo de juegos desincronizado. Juegos "+"; ".join(messages))
+
 
 # Funcion principal de StreamLit. 
 def main():    
@@ -259,6 +561,12 @@ def main():
     # Almancena el historico de busqueas realizado
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = None
+    # HTML ya generado de los turnos anteriores del chat (el más reciente primero)
+    if "chat_html" not in st.session_state:
+        st.session_state.chat_html = ""
+    # Última pregunta respondida (juego, pregunta), para no repetirla en cada rerun de Streamlit
+    if "lastQuestion" not in st.session_state:
+        st.session_state.lastQuestion = None
     # Almacena el OpenAI Key del input web validado con la funcion checkOpenAIKey
     if "openAI_user_key" not in st.session_state:
         st.session_state.openAI_user_key = None
@@ -289,7 +597,9 @@ def main():
 
         # Si es la primera vez que se carga la pagina (gamelist vacia), se buscan los juegos disponibles en Pinecone
         if not st.session_state.gameList:
+            trace = start_trace("load_games")
             games = load_games()
+            finish_trace(trace)
             # Se inicializa la lista de juegos, ya no deberia volver a actualizarse otra vez en esta sesión de usuario
             st.session_state.gameList = games
 
@@ -302,59 +612,49 @@ def main():
                     help="Nombre del juego en BGG sobre el que hacer las preeguntas",
                     key="GameSelector",
                     index=st.session_state.gameListIndex)
+                # Ficheros procesados del juego seleccionado, con la opción de borrar cada uno
+                render_documents(pineConePrefix+st.session_state.GameSelector)
                 
         # Se da la opción de subir nuevos ficheros de reglas/FAQ/..., tanto si la lista de juegos original esta vacia como si ya habia elementos
         with st.sidebar:           
             # Se crea el objeto de Streamlit File_Uploader para subir PDF y se da información al usuario de los formatos válidos soportados para el nombre del fichero
             pdf_docs = st.file_uploader("O Si no está el juego que buscas, sube nuevas reglas en PDF y pulsa el botón 'Procesar'", 
-                                    accept_multiple_files=False, 
-                                    help="El fichero debe ser un pdf con el formato <ID BGG>_<tipo>.pdf. Ej: 167791_FAQ.pdf")
+                                    accept_multiple_files=True, 
+                                    help="Los ficheros deben ser pdf con el formato <ID BGG>_<tipo>.pdf. Ej: 167791_FAQ.pdf. Se pueden subir varios a la vez")
 
             # Si se detecta que el usuario ha pulsado sobre el botón "Process"
             if st.button("Process"):
-                # Si el usuario ha insertado previamente un fichero de texto
+                # Si el usuario ha insertado previamente algún fichero
                 if pdf_docs:
                     # Feedback con spinner
                     with st.spinner("Processing"):
-                        # Se extraen el id, name, raw_text del fichero PDF con la funcion get_pdf_text
-                        id, name, raw_text = get_pdf_text(pdf_docs)
-
-                        # Si el fichero tenia información de texto
-                        if raw_text:
-                            # Se muestra un feedback al usaurio de que se está procesando el fichero PDF con el nombre del juego asocaido a BGG
-                            with st.sidebar:
-                                st.info("Procesando el juego: '"+name+"'")
-                           
-                            # Se crean los chunks a partir del texto plano del PDF subido
-                            text_chunks = get_text_chunks(raw_text)
-
-                            # Creamos en PineCone los embeddings asociados a los chunks con el namespace <Prefix-><Nombre del juego en BGG>
-                            vectorstore = create_vectorstore(text_chunks, pineConePrefix+name)
-
-                            # Si se ha creado correctamente en Pinecone los embeddings del texto
-                            if vectorstore:
-                                # Creamos el objetivo ConversationalRetrievalChain y lo almacenamos en la variable de seion de Streamlit conversation
-                                st.session_state.conversation = get_conversation_chain(vectorstore)
-
-                                # Si se ha creado correctamente el objeto ConversationalRetrievalChain
-                                if st.session_state.conversation:  
-                                    # Miramos si el juego ya existia en la lista de juegos creados
-                                    gameList = st.session_state.gameList 
-                                    # Si no existe, se crea nueva entrada y se actualiza la lista de juegos
-                                    if not name in gameList:
-                                        gameList.append(name)
-                                    # La lista de juegos de ordena
-                                    gameList.sort()
-                                    st.session_state.gameList = gameList
-                                    # Y se devuelve el indice donde debe posicionarse el select para marcar el juego asociado al fichero subido
-                                    # Esta logica aplica tanto si el juego es nuevo o si ya existia
-                                    st.session_state.gameListIndex = gameList.index(name)
-
-                                    with st.sidebar:
-                                        st.success('Fichero subido correctamente!', icon="✅")
-                                    st.experimental_rerun()
-                                else:
-                                    st.session_state.conversation = None
+                        # Se procesan todos los ficheros a la vez. Cada fichero crea los embeddings en el namespace <Prefix-><Nombre del juego en BGG>
+                        trace = start_trace("ingest", files=len(pdf_docs))
+                        games, allProcessed = ingest_pdfs(pdf_docs, pineConePrefix)
+                        finish_trace(trace)
+
+                    # Si se ha creado correctamente algún juego
+                    if games:
+                        # Miramos si los juegos ya existian en la lista de juegos creados
+                        gameList = list(st.session_state.gameList or [])
+                        # Si no existe, se crea nueva entrada y se actualiza la lista de juegos
+                        for name in games:
+                            if not name in gameList:
+                                gameList.append(name)
+                        # La lista de juegos de ordena
+                        gameList.sort()
+                        st.session_state.gameList = gameList
+                        # Y se devuelve el indice donde debe posicionarse el select para marcar el juego asociado al último fichero subido
+                        # Esta logica aplica tanto si el juego es nuevo o si ya existia
+                        st.session_state.gameListIndex = gameList.index(games[-1])
+                        # La conversación se vuelve a crear con los nuevos embeddings en la siguiente pregunta
+                        st.session_state.selectedGame = None
+
+                        with st.sidebar:
+                            st.success(str(len(games))+' fichero(s) subido(s) correctamente!', icon="✅")
+                        # Si algún fichero ha fallado no se recarga la página para que el usuario vea los errores
+                        if allProcessed:
+                            st.experimental_rerun()
 
                 else:
                     with st.sidebar:
@@ -365,27 +665,45 @@ def main():
             user_question = st.text_input("Preguntame sobre las reglas de: '"+st.session_state.GameSelector+"'")
             # Si el usuario ha introducido un criterio de búsqueda
             if user_question:
+                # Traza de la pregunta (solo si hay que crear la conversación o responder una pregunta nueva)
+                trace = None
                 # Si ha modificado el juego sobre el que realizar la busqueda, creamos unas nuevas variables de entorno de StreamList asociados a la conversacion
                 # En el caso que se haya iniciado la sesion en StreamList, selectedGame es None y por lo tanto se crea un setup con el primer juego seleccionado de la lista
                 if not(st.session_state.selectedGame == st.session_state.GameSelector):
+                    trace = start_trace("query", game=st.session_state.GameSelector)
                     # Se crea el VectorStore asociado al juego de la lista de juegos
                     vectorstore = get_vectorstore(pineConePrefix+st.session_state.GameSelector)
                     # Si se ha creado correctmente, se inicializan todas las variables de sesion de StreamLit asociados con el juego seleccionado
                     if vectorstore:
           #              st.session_state.chat_history = None
-                        st.session_state.conversation = get_conversation_chain(vectorstore)
+                        st.session_state.conversation = get_conversation_chain(vectorstore, pineConePrefix+st.session_state.GameSelector)
                         st.session_state.selectedGame = st.session_state.GameSelector
+                        # La conversación nueva empieza sin historial
+                        st.session_state.chat_html = ""
+                        st.session_state.lastQuestion = None
                     else:
                         st.session_state.selectedGame = None
 
                 # Tanto si se ha detectado una seleccion de juego nuevo, como si la consulta es del mismo juego de la conversacion existente
                 # Se comprueba si hay un juego seleccionado (puede estar vacio si ha habido un error en la conexion con Pinecone)
                 if st.session_state.selectedGame:
-                    # La pregunta del usuario se manda a OpenAI y tanto la pregunta como respuesta se muestran en pantalla
-                    handle_userinput(user_question)
+                    # Si la pregunta ya se ha respondido (rerun de Streamlit sin pregunta nueva) solo se pinta el histórico
+                    if st.session_state.lastQuestion == (st.session_state.selectedGame, user_question):
+                        st.write(st.session_state.chat_html, unsafe_allow_html=True)
+                    else:
+                        trace = trace or start_trace("query", game=st.session_state.selectedGame)
+                        # La pregunta del usuario se manda a OpenAI y tanto la pregunta como respuesta se muestran en pantalla
+                        handle_userinput(user_question)
+                if trace:
+                    finish_trace(trace)
         else:
             with st.sidebar:        
                 st.warning("Base de datos de juegos vacia")
 
+        # Diferencias entre el catálogo de juegos y el vector store
+        render_catalog_drift()
+        # Desplegable con los tiempos por etapa de la última operación (subida, pregunta o carga de juegos)
+        render_trace()
+
 if __name__ == '__main__':
     main()
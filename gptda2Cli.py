@@ -0,0 +1,307 @@
+#Línea de comandos para administrar la biblioteca de juegos sin Streamlit (cron, contenedores...)
+# Usa las mismas funciones que gptda2.py (gameLibrary, vectorBackends, gameCatalog) con la configuración de settings.py:
+# .streamlit/secrets.toml (o --secrets) y variables de entorno GPTDA2_<VARIABLE>. El OpenAI Key se lee de OPENAI_API_KEY
+# Comandos:
+#    ingest <directorio>: procesa todos los <BGGID>_<tipo>.pdf del árbol de directorios (los que no han cambiado se saltan)
+#    games / documents <juego>: lista los juegos del catálogo / los ficheros de un juego
+#    delete-game <juego> / delete-document <juego> <fichero>: borra un juego completo / un fichero de un juego
+#    reembed <juego>: vuelve a calcular los embeddings de todos los chunks del juego
+# <juego> es el nombre del juego en la BGG o su ID. Cada comando muestra los tiempos por etapa y el rendimiento (páginas/s, chunks/s)
+# La aplicación web en marcha detecta los cambios de ingest, delete-game y delete-document en el catálogo (CATALOG_PATH) antes de la
+# siguiente pregunta sobre el juego y descarta sus respuestas en cache y sus cadenas. Tiene que usar el mismo fichero de catálogo
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+from settings import load_settings
+import gameLibrary
+from vectorBackends import get_backend
+from gameCatalog import get_catalog
+from bggResolver import get_resolver
+from tracing import get_tracer
+
+# Ficheros que se procesan: <BGGID>.pdf o <BGGID>_<tipo>.pdf
+PDF_NAME_REGEX = re.compile(r"^\d+(_.*)?\.pdf$", re.IGNORECASE)
+# Ficheros que se procesan en cada ejecución del pipeline. Al terminar cada grupo se registra en el catálogo
+DEFAULT_FILES_PER_RUN = 16
+
+
+# Fichero del disco con la misma interfaz que los ficheros subidos en Streamlit (name y getvalue). El contenido se lee al pedirlo
+class LocalFile:
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+
+    def getvalue(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+# Función que busca los PDF de un árbol de directorios
+# Return: (lista de LocalFile en orden alfabético, lista de (ruta, motivo) de los ficheros que no se procesan)
+def find_pdfs(root):
+    files = []
+    skipped = []
+    names = {}
+    for folder, dirs, fileNames in os.walk(root):
+        dirs.sort()
+        for fileName in sorted(fileNames):
+            path = os.path.join(folder, fileName)
+            if not fileName.lower().endswith(".pdf"):
+                continue
+            if not PDF_NAME_REGEX.match(fileName):
+                skipped.append((path, "el nombre no tiene el formato <BGGID>_<tipo>.pdf"))
+            elif fileName in names:
+                # El catálogo identifica los documentos por nombre de fichero
+                skipped.append((path, "mismo nombre que " + names[fileName]))
+            else:
+                names[fileName] = path
+                files.append(LocalFile(path))
+    return files, skipped
+
+
+# Función que crea los embeddings de OpenAI (con la cache persistente salvo que useCache sea False)
+def create_embeddings(settings, useCache=True):
+    from langchain.embeddings import OpenAIEmbeddings
+    from embeddingCache import CachedEmbeddings, get_embedding_cache
+
+    apiKey = os.environ.get("OPENAI_API_KEY") or settings.get("OPENAI_API_KEY")
+    if not apiKey:
+        raise SystemExit("Falta el OpenAI Key: variable de entorno OPENAI_API_KEY")
+    embeddings = OpenAIEmbeddings(openai_api_key=apiKey)
+    if not useCache:
+        return embeddings
+    return CachedEmbeddings(embeddings, get_embedding_cache(settings))
+
+
+# Return: namespace del juego indicado por nombre en la BGG o por ID de BGG. Lanza SystemExit si el ID no existe
+def game_namespace(settings, game):
+    if game.isdigit():
+        title = get_resolver(settings).lookup(game)
+        if not title:
+            raise SystemExit("No se ha encontrado el ID:" + game + " en la BGG.")
+        game = title
+    return settings["PINECONE_PREFIX"] + game
+
+
+# Return: lista de etapas de la traza con los tiempos en milisegundos, para el informe
+def stage_report(trace):
+    return [{"stage": stage["stage"], "calls": stage["calls"], "ms": round(stage["seconds"] * 1000), "counts": stage["counts"]}
+            for stage in trace.summary()]
+
+
+# Función que muestra el resultado de un comando (texto o JSON)
+def print_report(report, asJson):
+    if asJson:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+    for name, value in report.items():
+        if name == "stages":
+            print("stages:")
+            for stage in value:
+                counts = ", ".join(key + " " + str(count) for key, count in stage["counts"].items())
+                print("  " + stage["stage"] + ": " + str(stage["ms"]) + " ms (" + str(stage["calls"]) + " llamadas)" +
+                      (" · " + counts if counts else ""))
+        elif name in ("files", "games", "documents") and isinstance(value, list):
+            print(name + ":")
+            for item in value:
+                print("  " + " · ".join(str(key) + "=" + str(itemValue) for key, itemValue in item.items()))
+        else:
+            print(name + ": " + str(value))
+
+
+# Comando ingest: procesa los PDF del directorio por grupos con el pipeline de ingesta
+def command_ingest(settings, args):
+    settings = dict(settings)
+    if args.workers:
+        settings["INGEST_EXTRACT_WORKERS"] = args.workers
+    if args.embed_workers:
+        settings["INGEST_EMBED_WORKERS"] = args.embed_workers
+    if args.pdf_workers:
+        settings["PDF_WORKERS"] = args.pdf_workers
+    prefix = settings["PINECONE_PREFIX"]
+    backend = get_backend(settings)
+    catalog = get_catalog(settings)
+    resolver = get_resolver(settings)
+    embeddings = create_embeddings(settings)
+    trace = get_tracer(settings).start("cli_ingest", root=args.directory)
+    start = time.perf_counter()
+
+    files, skipped = find_pdfs(args.directory)
+    results = [{"file": path, "status": "skipped", "reason": reason} for path, reason in skipped]
+    # Los ficheros con el mismo contenido (hash) que el registrado en el catálogo no se vuelven a leer
+    if not args.force:
+        titles = resolver.lookup_many([gameLibrary.get_bgg_id(source.name) for source in files])
+        pending = []
+        for source in files:
+            title = titles.get(gameLibrary.get_bgg_id(source.name))
+            game = catalog.get_game(prefix + title) if title else None
+            hashes = {document["file_name"]: document["file_hash"] for document in (game or {}).get("documents", [])}
+            if hashes.get(source.name) == hashlib.sha256(source.getvalue()).hexdigest():
+                results.append({"file": source.path, "status": "unchanged"})
+            else:
+                pending.append(source)
+        files = pending
+
+    reported = set()
+
+    def on_progress(progress):
+        for source, fileProgress in zip(group, progress):
+            if fileProgress.status in ("done", "error") and source.path not in reported:
+                reported.add(source.path)
+                print(fileProgress.status + ": " + source.path + (" (" + str(fileProgress.error) + ")" if fileProgress.error else ""),
+                      file=sys.stderr)
+
+    totals = {"pages": 0, "chunks": 0, "unchanged_chunks": 0, "deleted_chunks": 0}
+    filesPerRun = max(1, args.files_per_run)
+    for i in range(0, len(files), filesPerRun):
+        group = files[i:i + filesPerRun]
+        progress = gameLibrary.ingest_files(settings, backend, embeddings, catalog, group, prefix, on_progress, trace)
+        for source, fileProgress in zip(group, progress):
+            results.append({"file": source.path, "status": fileProgress.status, "game": fileProgress.game,
+                            "pages": fileProgress.pages, "chunks": fileProgress.chunks, "unchanged": fileProgress.unchanged,
+                            "deleted": fileProgress.deleted, "error": fileProgress.error})
+            totals["pages"] += fileProgress.pages
+            totals["chunks"] += fileProgress.chunks
+            totals["unchanged_chunks"] += fileProgress.unchanged
+            totals["deleted_chunks"] += fileProgress.deleted
+
+    seconds = time.perf_counter() - start
+    trace.finish()
+    errors = sum(1 for result in results if result["status"] == "error")
+    report = {"files": results,
+              "processed": sum(1 for result in results if result["status"] == "done"),
+              "errors": errors}
+    report.update(totals)
+    report.update({"embedding_cache_hits": embeddings.hits,
+                   "embedding_cache_misses": embeddings.misses,
+                   "seconds": round(seconds, 3),
+                   "pages_per_second": round(totals["pages"] / seconds, 2) if seconds else 0.0,
+                   "chunks_per_second": round(totals["chunks"] / seconds, 2) if seconds else 0.0,
+                   "stages": stage_report(trace)})
+    print_report(report, args.json)
+    return 1 if errors else 0
+
+
+# Comando games: juegos del catálogo con su número de ficheros y chunks
+# Si el catálogo está vacío (juegos procesados antes de existir el catálogo), se importan antes los namespaces del vector store
+def command_games(settings, args):
+    prefix = settings["PINECONE_PREFIX"]
+    catalog = get_catalog(settings)
+    if catalog.is_empty():
+        catalog.reconcile(get_backend(settings), prefix)
+    games = []
+    for name in catalog.list_games(prefix):
+        game = catalog.get_game(prefix + name) or {"bgg_id": None, "documents": []}
+        games.append({"game": name, "bgg_id": game["bgg_id"], "documents": len(game["documents"]),
+                      "chunks": sum(document["chunks"] for document in game["documents"])})
+    print_report({"games": games}, args.json)
+    return 0
+
+
+# Comando documents: ficheros procesados de un juego
+def command_documents(settings, args):
+    namespace = game_namespace(settings, args.game)
+    game = get_catalog(settings).get_game(namespace)
+    if game is None:
+        raise SystemExit("El juego no está en el catálogo: " + namespace)
+    documents = [{"file": document["file_name"], "pages": document["pages"], "chunks": document["chunks"],
+                  "ingested_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(document["ingested_at"]))}
+                 for document in game["documents"]]
+    print_report({"game": game["game"], "bgg_id": game["bgg_id"], "documents": documents}, args.json)
+    return 0
+
+
+# Comando delete-game: borra el namespace del juego, su índice de palabras clave y su entrada en el catálogo
+def command_delete_game(settings, args):
+    namespace = game_namespace(settings, args.game)
+    gameLibrary.delete_game(get_backend(settings), get_catalog(settings), namespace)
+    print_report({"deleted": namespace}, args.json)
+    return 0
+
+
+# Comando delete-document: borra los chunks de un fichero sin tocar el resto del juego
+def command_delete_document(settings, args):
+    namespace = game_namespace(settings, args.game)
+    try:
+        chunks = gameLibrary.delete_document(get_backend(settings), get_catalog(settings), create_embeddings(settings),
+                                             namespace, args.file)
+    except gameLibrary.UnknownChunksError as error:
+        raise SystemExit(str(error))
+    print_report({"deleted": namespace + "/" + args.file, "chunks": chunks}, args.json)
+    return 0
+
+
+# Comando reembed: vuelve a calcular y sobrescribe los embeddings de todos los chunks del juego
+def command_reembed(settings, args):
+    namespace = game_namespace(settings, args.game)
+    embeddings = create_embeddings(settings, useCache=not args.no_cache)
+    trace = get_tracer(settings).start("cli_reembed", namespace=namespace)
+    start = time.perf_counter()
+    result = gameLibrary.reembed_namespace(get_backend(settings), get_catalog(settings), embeddings, namespace,
+                                           trace=trace)
+    seconds = time.perf_counter() - start
+    trace.finish()
+    report = {"namespace": namespace}
+    report.update(result)
+    report.update({"seconds": round(seconds, 3),
+                   "chunks_per_second": round(result["chunks"] / seconds, 2) if seconds else 0.0,
+                   "stages": stage_report(trace)})
+    print_report(report, args.json)
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Administración de la biblioteca de juegos de gptda2 sin Streamlit",
+                                     epilog="La aplicación web en marcha ve los cambios antes de la siguiente pregunta sobre el juego "
+                                            "si usa el mismo catálogo (CATALOG_PATH)")
+    parser.add_argument("--secrets", help="Fichero de configuración TOML (por defecto .streamlit/secrets.toml)")
+    parser.add_argument("--json", action="store_true", help="Resultado en JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="Procesa los <BGGID>_<tipo>.pdf de un árbol de directorios")
+    ingest.add_argument("directory")
+    ingest.add_argument("--workers", type=int, help="Ficheros que se extraen en paralelo (INGEST_EXTRACT_WORKERS)")
+    ingest.add_argument("--embed-workers", type=int, help="Peticiones de embeddings simultáneas (INGEST_EMBED_WORKERS)")
+    ingest.add_argument("--pdf-workers", type=int, help="Procesos para extraer las páginas de cada PDF (PDF_WORKERS)")
+    ingest.add_argument("--files-per-run", type=int, default=DEFAULT_FILES_PER_RUN,
+                        help="Ficheros por ejecución del pipeline (se registran en el catálogo al terminar cada grupo)")
+    ingest.add_argument("--force", action="store_true", help="Procesa también los ficheros que no han cambiado")
+    ingest.set_defaults(handler=command_ingest)
+
+    games = commands.add_parser("games", help="Lista los juegos del catálogo")
+    games.set_defaults(handler=command_games)
+
+    documents = commands.add_parser("documents", help="Lista los ficheros de un juego")
+    documents.add_argument("game", help="Nombre del juego en la BGG o ID de BGG")
+    documents.set_defaults(handler=command_documents)
+
+    deleteGame = commands.add_parser("delete-game", help="Borra un juego completo")
+    deleteGame.add_argument("game", help="Nombre del juego en la BGG o ID de BGG")
+    deleteGame.set_defaults(handler=command_delete_game)
+
+    deleteDocument = commands.add_parser("delete-document", help="Borra un fichero de un juego")
+    deleteDocument.add_argument("game", help="Nombre del juego en la BGG o ID de BGG")
+    deleteDocument.add_argument("file", help="Nombre del fichero (ej: 167791_FAQ.pdf)")
+    deleteDocument.set_defaults(handler=command_delete_document)
+
+    reembed = commands.add_parser("reembed", help="Vuelve a calcular los embeddings de un juego")
+    reembed.add_argument("game", help="Nombre del juego en la BGG o ID de BGG")
+    reembed.add_argument("--no-cache", action="store_true", help="No usa la cache de embeddings (se piden todos a OpenAI)")
+    reembed.set_defaults(handler=command_reembed)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = load_settings(args.secrets)
+    return args.handler(settings, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,5 @@
+import html
+
 css = '''
 <style>
 .chat-message {
@@ -42,3 +44,7 @@ user_template = '''
     <div class="message">{{MSG}}</div>
 </div>
 '''
+
+# Función que pinta un mensaje del chat con la plantilla HTML (bot_template o user_template)
+def render_message(template, content):
+    return template.replace("{{MSG}}", html.escape(content))
@@ -0,0 +1,85 @@
+#Retriever híbrido: búsqueda por palabras clave (BM25) combinada con la búsqueda por similitud del vector store
+# Sustituye a vectorstore.as_retriever() (solo similitud de embeddings con k por defecto):
+#    - Se buscan los fetchK mejores chunks en el índice BM25 y en el vector store
+#    - Los dos rankings se combinan con Reciprocal Rank Fusion (RRF): puntuación = suma de 1 / (RRF_K + posición). No hace falta llamar a ningún modelo
+#    - Fast path: si el mejor chunk por palabras clave contiene todos los términos de la pregunta y destaca claramente sobre el segundo,
+#      se devuelven los resultados de palabras clave sin calcular el embedding de la pregunta (no se llama a OpenAI)
+# Si el namespace no tiene índice de palabras clave (juegos procesados antes de existir), se usa solo el vector store
+from langchain.schema import BaseRetriever, Document
+
+# Valores por defecto si no se configuran RETRIEVER_K, RETRIEVER_FETCH_K y KEYWORD_FAST_PATH_RATIO
+DEFAULT_K = 4
+DEFAULT_FETCH_K = 10
+DEFAULT_FAST_PATH_RATIO = 2.0
+# Constante de Reciprocal Rank Fusion
+RRF_K = 60
+
+
+class HybridRetriever(BaseRetriever):
+
+    # vectorstore: vector store de LangChain del namespace. keywordIndex: KeywordIndex del namespace o None
+    # fastPathRatio: cuánto tiene que superar la puntuación del primer chunk a la del segundo para usar el fast path (0 lo desactiva)
+    def __init__(self, vectorstore, keywordIndex=None, k=DEFAULT_K, fetchK=DEFAULT_FETCH_K, fastPathRatio=DEFAULT_FAST_PATH_RATIO):
+        self.vectorstore = vectorstore
+        self.keywordIndex = keywordIndex if keywordIndex is not None and len(keywordIndex) else None
+        self.k = max(1, int(k))
+        self.fetchK = max(self.k, int(fetchK))
+        self.fastPathRatio = float(fastPathRatio)
+
+    def _keyword_documents(self, results):
+        return [Document(page_content=self.keywordIndex.texts[docId], metadata=dict(self.keywordIndex.metadatas[docId]))
+                for docId, _ in results]
+
+    # Función que resuelve la consulta solo con el índice de palabras clave si es una búsqueda evidente
+    # Return: lista de Document o None si hace falta la búsqueda por similitud
+    def keyword_fast_path(self, query):
+        if self.keywordIndex is None or self.fastPathRatio <= 0:
+            return None
+        results = self.keywordIndex.search(query, self.k)
+        if not results or self.keywordIndex.coverage(query, results[0][0]) < 1.0:
+            return None
+        if len(results) > 1 and results[0][1] < self.fastPathRatio * results[1][1]:
+            return None
+        return self._keyword_documents(results)
+
+    # Función que busca en el vector store y en el índice de palabras clave y combina los resultados (sin fast path)
+    # Se llama directamente si ya se ha probado el fast path (answer_question)
+    # Return: lista con los k Document más relevantes
+    def hybrid_search(self, query):
+        vectorDocuments = self.vectorstore.similarity_search(query, k=self.fetchK if self.keywordIndex else self.k)
+        if self.keywordIndex is None:
+            return vectorDocuments
+        keywordDocuments = self._keyword_documents(self.keywordIndex.search(query, self.fetchK))
+        return fuse([keywordDocuments, vectorDocuments], self.k)
+
+    def get_relevant_documents(self, query):
+        documents = self.keyword_fast_path(query)
+        if documents is not None:
+            return documents
+        return self.hybrid_search(query)
+
+    async def aget_relevant_documents(self, query):
+        return self.get_relevant_documents(query)
+
+
+# Función que combina varios rankings de Document con Reciprocal Rank Fusion
+# Los chunks se identifican por su texto: el mismo chunk puede venir del índice BM25 y del vector store
+# Return: los k Document con más puntuación
+def fuse(rankings, k):
+    scores = {}
+    documents = {}
+    for ranking in rankings:
+        for position, document in enumerate(ranking):
+            key = document.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + position + 1)
+            documents.setdefault(key, document)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [documents[key] for key in best]
+
+
+# Función que crea el retriever híbrido con la configuración (RETRIEVER_K, RETRIEVER_FETCH_K, KEYWORD_FAST_PATH_RATIO)
+def create_retriever(config, vectorstore, keywordIndex):
+    return HybridRetriever(vectorstore, keywordIndex,
+                           k=config.get("RETRIEVER_K", DEFAULT_K),
+                           fetchK=config.get("RETRIEVER_FETCH_K", DEFAULT_FETCH_K),
+                           fastPathRatio=config.get("KEYWORD_FAST_PATH_RATIO", DEFAULT_FAST_PATH_RATIO))
@@ -0,0 +1,284 @@
+#Pipeline de ingesta concurrente de varios PDF
+# Cada fichero pasa por tres etapas conectadas con colas acotadas (si una etapa va lenta, las anteriores esperan en vez de acumular memoria):
+#    1. Extracción: varios ficheros a la vez (metadatos de BGG, texto de las páginas y chunks)
+#    2. Embeddings: los chunks de todos los ficheros se agrupan en lotes y se envían a OpenAI con varias peticiones en paralelo
+#    3. Inserción: los embeddings se agrupan por namespace y se insertan por lotes en el vector store
+# El tiempo total se acerca al de la etapa más lenta en vez de a la suma de todos los ficheros
+# Los chunks se guardan con IDs deterministas (vectorBackends.chunk_id). Si un fichero ya se había procesado (knownIds), solo se embeben
+# e insertan los chunks que no existían y, al final, se borran los chunks antiguos que ya no forman parte del fichero
+# Este módulo no importa Streamlit: el progreso se notifica con un callback que se ejecuta en el thread que llama a run()
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from vectorBackends import BATCH_SIZE, document_key, chunk_id
+from textChunker import as_chunk
+from tracing import NULL_TRACE
+
+# Valores por defecto de concurrencia y tamaño de las colas entre etapas
+EXTRACT_WORKERS = 2
+EMBED_WORKERS = 2
+QUEUE_SIZE = 256
+
+# Marca de fin de etapa en las colas
+_END = object()
+
+
+# Estado de un fichero dentro del pipeline
+#    - status: pending, extracting, embedding, done o error
+#    - pages/chunks: páginas y chunks extraídos. embedded/upserted: chunks ya embebidos / insertados
+#    - unchanged: chunks que ya estaban en el vector store. stale: IDs de chunks antiguos que se borran (deleted: ya borrados)
+#    - chunkIds: IDs de todos los chunks del fichero
+class FileProgress:
+
+    def __init__(self, name):
+        self.name = name
+        self.game = None
+        self.bggID = None
+        self.namespace = None
+        self.status = "pending"
+        self.error = None
+        self.pages = 0
+        self.chunks = 0
+        self.embedded = 0
+        self.upserted = 0
+        self.unchanged = 0
+        self.chunkIds = []
+        self.stale = []
+        self.deleted = 0
+        self.extracted = False
+
+    # Return: fracción completada (0..1). Mientras se extrae no se conoce el total de chunks
+    def fraction(self):
+        if self.status in ("done", "error"):
+            return 1.0
+        if not self.chunks:
+            return 0.0
+        done = (self.embedded + self.upserted + 2 * self.unchanged) / (2.0 * self.chunks)
+        return done if self.extracted else min(done, 0.99)
+
+
+# Pipeline de ingesta
+#    - backend: backend de vector store (vectorBackends) donde se insertan los embeddings
+#    - embeddings: objeto de embeddings de LangChain (embed_documents)
+#    - prepare(source): función que recibe un fichero y devuelve (bggID, gameTitle, namespace, pages). Lanza excepción si no es válido
+#    - chunker(pages): función que convierte el texto de las páginas en chunks (get_text_chunks). Puede devolver Chunk o strings
+#    - knownIds(namespace, fileName): función opcional que devuelve los IDs de los chunks ya guardados del fichero (catálogo de juegos)
+class IngestPipeline:
+
+    def __init__(self, backend, embeddings, prepare, chunker, knownIds=None,
+                 extractWorkers=EXTRACT_WORKERS, embedWorkers=EMBED_WORKERS,
+                 batchSize=BATCH_SIZE, queueSize=QUEUE_SIZE):
+        self.backend = backend
+        self.embeddings = embeddings
+        self.prepare = prepare
+        self.chunker = chunker
+        self.knownIds = knownIds
+        self.extractWorkers = max(1, int(extractWorkers))
+        self.embedWorkers = max(1, int(embedWorkers))
+        self.batchSize = max(1, int(batchSize))
+        self.queueSize = max(1, int(queueSize))
+        self._lock = threading.Lock()
+
+    # Función que procesa todos los ficheros (sources: objetos con .name y .getvalue())
+    #    - on_progress(progress): callback opcional que se llama cada interval segundos (y al terminar) con la lista de FileProgress
+    #    - trace: traza (tracing) donde se miden las etapas: extract (por fichero), embed (por lote), upsert (por lote) y delete (por namespace)
+    # Return: lista de FileProgress con el resultado de cada fichero
+    def run(self, sources, on_progress=None, interval=0.25, trace=None):
+        self.trace = trace or NULL_TRACE
+        progress = [FileProgress(source.name) for source in sources]
+        chunkQueue = queue.Queue(maxsize=self.queueSize)
+        vectorQueue = queue.Queue(maxsize=self.queueSize)
+
+        embedThreads = [threading.Thread(target=self._embed_stage, args=(chunkQueue, vectorQueue, progress), daemon=True)
+                        for _ in range(self.embedWorkers)]
+        upsertThread = threading.Thread(target=self._upsert_stage, args=(vectorQueue, progress), daemon=True)
+        for thread in embedThreads + [upsertThread]:
+            thread.start()
+
+        with ThreadPoolExecutor(max_workers=self.extractWorkers) as extractPool:
+            futures = [extractPool.submit(self._extract_stage, i, source, chunkQueue, progress)
+                       for i, source in enumerate(sources)]
+            while not all(future.done() for future in futures):
+                if on_progress:
+                    on_progress(progress)
+                time.sleep(interval)
+
+        # Fin de la extracción: una marca de fin para cada thread de embeddings, y cuando acaban todos, para la inserción
+        for _ in embedThreads:
+            chunkQueue.put(_END)
+        while any(thread.is_alive() for thread in embedThreads):
+            if on_progress:
+                on_progress(progress)
+            time.sleep(interval)
+        vectorQueue.put(_END)
+        while upsertThread.is_alive():
+            if on_progress:
+                on_progress(progress)
+            time.sleep(interval)
+
+        for fileProgress in progress:
+            if fileProgress.status != "error":
+                if fileProgress.chunks and fileProgress.upserted + fileProgress.unchanged == fileProgress.chunks:
+                    fileProgress.status = "done"
+                else:
+                    self._fail(fileProgress, "No se ha extraido texto del PDF")
+            if fileProgress.status == "error":
+                self.trace.error("ingest", fileProgress.name + ": " + str(fileProgress.error))
+        if on_progress:
+            on_progress(progress)
+        return progress
+
+    def _fail(self, fileProgress, error):
+        with self._lock:
+            if fileProgress.status != "error":
+                fileProgress.status = "error"
+                fileProgress.error = str(error)
+
+    # Etapa 1: metadatos, texto y chunks de un fichero. Los chunks se encolan a medida que se generan
+    def _extract_stage(self, fileIndex, source, chunkQueue, progress):
+        fileProgress = progress[fileIndex]
+        fileProgress.status = "extracting"
+        try:
+            # La duración incluye la espera cuando la cola de chunks está llena (embeddings más lentos que la extracción)
+            with self.trace.span("extract", file=source.name) as span:
+                bggID, gameTitle, namespace, pages = self.prepare(source)
+                fileProgress.bggID, fileProgress.game, fileProgress.namespace = bggID, gameTitle, namespace
+                known = set(self.knownIds(namespace, source.name)) if self.knownIds else set()
+                documentKey = document_key(namespace, source.name)
+                occurrences = Counter()
+
+                def counted(pages):
+                    for pageText in pages:
+                        fileProgress.pages += 1
+                        yield pageText
+
+                for chunk in self.chunker(counted(pages)):
+                    if fileProgress.status == "error":
+                        return
+                    chunk = as_chunk(chunk)
+                    chunkId = chunk_id(documentKey, chunk.text, occurrences[chunk.text])
+                    occurrences[chunk.text] += 1
+                    fileProgress.chunkIds.append(chunkId)
+                    with self._lock:
+                        fileProgress.chunks += 1
+                    span.count("chunks")
+                    # Chunk sin cambios desde la ingesta anterior: no se vuelve a embeber ni a insertar
+                    if chunkId in known:
+                        with self._lock:
+                            fileProgress.unchanged += 1
+                        span.count("unchanged")
+                        continue
+                    span.count("tokens", chunk.tokens or 0)
+                    # Además de la página y el offset, se guarda el fichero de origen del chunk
+                    metadata = dict(chunk.metadata, source=source.name)
+                    chunkQueue.put((fileIndex, chunk.text, metadata, chunkId))
+                span.count("pages", fileProgress.pages)
+                fileProgress.stale = sorted(known.difference(fileProgress.chunkIds))
+            fileProgress.extracted = True
+            if fileProgress.status != "error":
+                fileProgress.status = "embedding"
+        except Exception as error:
+            self._fail(fileProgress, error)
+
+    # Etapa 2: agrupa chunks (de cualquier fichero) en lotes y pide los embeddings a OpenAI
+    def _embed_stage(self, chunkQueue, vectorQueue, progress):
+        finished = False
+        while not finished:
+            batch = []
+            item = chunkQueue.get()
+            while item is not _END:
+                batch.append(item)
+                if len(batch) >= self.batchSize:
+                    break
+                try:
+                    # Se espera un poco a completar el lote antes de enviarlo incompleto
+                    item = chunkQueue.get(timeout=0.05)
+                except queue.Empty:
+                    break
+            finished = item is _END
+            batch = [item for item in batch if progress[item[0]].status != "error"]
+            if not batch:
+                continue
+            try:
+                with self.trace.span("embed") as span:
+                    span.count("chunks", len(batch))
+                    span.count("tokens", sum(metadata.get("tokens", 0) for _, _, metadata, _ in batch))
+                    vectors = self.embeddings.embed_documents([text for _, text, _, _ in batch])
+            except Exception as error:
+                for fileIndex in set(item[0] for item in batch):
+                    self._fail(progress[fileIndex], error)
+                continue
+            for (fileIndex, text, metadata, chunkId), vector in zip(batch, vectors):
+                with self._lock:
+                    progress[fileIndex].embedded += 1
+                vectorQueue.put((fileIndex, text, metadata, chunkId, vector))
+
+    # Etapa 3: agrupa los embeddings por namespace y los inserta por lotes. Un único thread: los writers no se comparten
+    def _upsert_stage(self, vectorQueue, progress):
+        writers = {}
+        pending = {}
+
+        def flush(namespace):
+            items = [item for item in pending.pop(namespace, []) if progress[item[0]].status != "error"]
+            if not items:
+                return
+            try:
+                with self.trace.span("upsert", namespace=namespace) as span:
+                    span.count("chunks", len(items))
+                    if namespace not in writers:
+                        writers[namespace] = self.backend.open_writer(self.embeddings, namespace)
+                    writers[namespace].add([item[1] for item in items], [item[4] for item in items], [item[2] for item in items],
+                                           [item[3] for item in items])
+                for item in items:
+                    with self._lock:
+                        progress[item[0]].upserted += 1
+            except Exception as error:
+                for fileIndex in set(item[0] for item in items):
+                    self._fail(progress[fileIndex], error)
+
+        while True:
+            try:
+                item = vectorQueue.get(timeout=0.2)
+            except queue.Empty:
+                # Sin datos nuevos: se insertan los lotes incompletos para no retrasar el progreso
+                for namespace in list(pending):
+                    flush(namespace)
+                continue
+            if item is _END:
+                break
+            fileIndex = item[0]
+            namespace = progress[fileIndex].namespace
+            pending.setdefault(namespace, []).append(item)
+            if len(pending[namespace]) >= self.batchSize:
+                flush(namespace)
+
+        for namespace in list(pending):
+            flush(namespace)
+        # Chunks antiguos de los ficheros que se han vuelto a procesar. Solo se borran si todos los chunks nuevos del fichero se han insertado
+        staleFiles = [fileProgress for fileProgress in progress
+                      if fileProgress.stale and fileProgress.status != "error"
+                      and fileProgress.upserted + fileProgress.unchanged == fileProgress.chunks]
+        for namespace in set(fileProgress.namespace for fileProgress in staleFiles):
+            files = [fileProgress for fileProgress in staleFiles if fileProgress.namespace == namespace]
+            try:
+                with self.trace.span("delete", namespace=namespace) as span:
+                    if namespace not in writers:
+                        writers[namespace] = self.backend.open_writer(self.embeddings, namespace)
+                    for fileProgress in files:
+                        writers[namespace].delete(fileProgress.stale)
+                        fileProgress.deleted = len(fileProgress.stale)
+                        span.count("chunks", fileProgress.deleted)
+            except Exception as error:
+                for fileProgress in files:
+                    self._fail(fileProgress, error)
+        for namespace, writer in writers.items():
+            try:
+                with self.trace.span("save", namespace=namespace):
+                    writer.close()
+            except Exception as error:
+                for fileProgress in progress:
+                    if fileProgress.namespace == namespace:
+                        self._fail(fileProgress, error)
@@ -0,0 +1,214 @@
+#Índice de palabras clave (BM25) por juego (namespace)
+# Las preguntas de reglas suelen depender del nombre exacto de una carta, ficha o palabra clave, que los embeddings recuperan mal
+# Cada namespace tiene un índice invertido con los mismos chunks que el vector store:
+#    - Se construye en la ingesta (los writers de vectorBackends añaden los chunks) y se guarda en disco en <KEYWORD_INDEX_PATH>/<namespace>.json
+#    - Con PineCone el índice es local al servidor de Streamlit (el vector store es remoto, pero el índice de palabras no)
+#    - Las consultas se puntúan con BM25 sin llamar a OpenAI
+#    - Cada chunk guarda el mismo ID que en el vector store para poder borrarlo cuando se vuelve a procesar o se borra su documento
+import json
+import math
+import os
+from collections import Counter
+from urllib.parse import quote
+
+#Misma normalización que las preguntas de la cache (minúsculas, sin acentos ni signos de puntuación)
+from answerCache import normalize_question
+#Lock de escritura entre threads y procesos
+from fileLock import FileLock
+
+# Directorio por defecto donde se guardan los índices si no se configura KEYWORD_INDEX_PATH
+DEFAULT_KEYWORD_INDEX_PATH = "keyword_indexes"
+# Parámetros de BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+FORMAT_VERSION = 2
+
+# Palabras muy frecuentes (reglas en español o en inglés) que no se indexan
+STOPWORDS = frozenset("""
+a al algo como con cual cuando cuanto cuanta cuantos cuantas de del donde el en es esta este hace hacer hay la las le lo los mas me mi
+no o para pasa pero por puede puedo que se si sin su sus un una uno unos y ya
+an and are as at be by can do does for from how i if in is it its many much of on or the this to what when where which with you
+""".split())
+
+
+# Función que divide un texto en términos normalizados para el índice
+# Return: lista de términos (sin palabras vacías ni términos de una letra)
+def tokenize(text):
+    return [term for term in normalize_question(text).split() if len(term) > 1 and term not in STOPWORDS]
+
+
+# Índice BM25 de los chunks de un namespace
+class KeywordIndex:
+
+    def __init__(self):
+        self.texts = []
+        self.metadatas = []
+        self.ids = []
+        self.lengths = []
+        # término -> {posición del chunk: frecuencia del término en el chunk}
+        self.postings = {}
+        self._totalLength = 0
+
+    def __len__(self):
+        return len(self.texts)
+
+    # Añade chunks al índice (texts, metadatas e ids en el mismo orden)
+    # Un chunk con un id que ya está en el índice solo actualiza sus metadatos: el id se calcula con el texto (vectorBackends.chunk_id)
+    def add(self, texts, metadatas=None, ids=None):
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [None for _ in texts]
+        positions = {id: docId for docId, id in enumerate(self.ids) if id is not None} if any(ids) else {}
+        for text, metadata, id in zip(texts, metadatas, ids):
+            if id is not None and id in positions:
+                self.metadatas[positions[id]] = dict(metadata)
+                continue
+            docId = len(self.texts)
+            if id is not None:
+                positions[id] = docId
+            terms = Counter(tokenize(text))
+            self.texts.append(text)
+            self.metadatas.append(dict(metadata))
+            self.ids.append(id)
+            length = sum(terms.values())
+            self.lengths.append(length)
+            self._totalLength += length
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, {})[docId] = frequency
+
+    # Función que borra del índice los chunks con esos ids. Las posiciones de los chunks cambian: el índice se reconstruye con los que quedan
+    # Return: número de chunks borrados
+    def delete(self, ids):
+        ids = set(ids)
+        if not ids or not ids.intersection(self.ids):
+            return 0
+        kept = [(text, metadata, id) for text, metadata, id in zip(self.texts, self.metadatas, self.ids) if id not in ids]
+        deleted = len(self.texts) - len(kept)
+        self.__init__()
+        if kept:
+            texts, metadatas, keptIds = zip(*kept)
+            self.add(list(texts), list(metadatas), list(keptIds))
+        return deleted
+
+    # Función que busca los chunks con más puntuación BM25 para la consulta
+    # Return: lista de (posición del chunk, puntuación) de mayor a menor puntuación, como máximo k
+    def search(self, query, k=10):
+        if not self.texts:
+            return []
+        averageLength = self._totalLength / len(self.texts) or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.texts) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for docId, frequency in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[docId] / averageLength)
+                scores[docId] = scores.get(docId, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    # Return: fracción de los términos de la consulta que aparecen en el chunk docId (los términos que no están en el índice no cuentan)
+    def coverage(self, query, docId):
+        terms = set(term for term in tokenize(query) if term in self.postings)
+        if not terms:
+            return 0.0
+        return sum(1 for term in terms if docId in self.postings.get(term, ())) / len(terms)
+
+    def to_dict(self):
+        return {"version": FORMAT_VERSION,
+                "texts": self.texts,
+                "metadatas": self.metadatas,
+                "ids": self.ids,
+                "lengths": self.lengths,
+                "postings": {term: list(postings.items()) for term, postings in self.postings.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        # La versión 1 no guardaba los IDs de los chunks: esos chunks no se pueden borrar uno a uno
+        if data.get("version") not in (1, FORMAT_VERSION):
+            raise ValueError("Versión del índice de palabras clave no soportada: " + str(data.get("version")))
+        index = cls()
+        index.texts = data["texts"]
+        index.metadatas = data["metadatas"]
+        index.ids = data.get("ids") or [None for _ in index.texts]
+        index.lengths = data["lengths"]
+        index.postings = {term: dict(postings) for term, postings in data["postings"].items()}
+        index._totalLength = sum(index.lengths)
+        return index
+
+
+# Índices de palabras clave guardados en disco, un fichero por namespace
+class KeywordStore:
+
+    def __init__(self, config):
+        self.path = config.get("KEYWORD_INDEX_PATH", DEFAULT_KEYWORD_INDEX_PATH)
+
+    def namespace_file(self, namespace):
+        return os.path.join(self.path, quote(namespace, safe="") + ".json")
+
+    def exists(self, namespace):
+        return os.path.isfile(self.namespace_file(namespace))
+
+    # Return: lock de escritura del índice del namespace, compartido entre threads y procesos (aplicación y línea de comandos)
+    def namespace_lock(self, namespace):
+        return FileLock(self.namespace_file(namespace) + ".lock")
+
+    # Return: KeywordIndex del namespace o None si el namespace no tiene índice (juegos procesados antes de existir el índice)
+    def load(self, namespace):
+        if not self.exists(namespace):
+            return None
+        with open(self.namespace_file(namespace), "r", encoding="utf-8") as f:
+            return KeywordIndex.from_dict(json.load(f))
+
+    # Guarda el índice en disco. Se escribe en un fichero temporal y se renombra para no dejar un índice a medias
+    def save(self, namespace, index):
+        os.makedirs(self.path, exist_ok=True)
+        fileName = self.namespace_file(namespace)
+        with open(fileName + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(index.to_dict(), f, ensure_ascii=False)
+        os.replace(fileName + ".tmp", fileName)
+
+    # Elimina el índice del namespace. Espera a que termine cualquier writer abierto en el namespace (también de otro proceso)
+    def delete(self, namespace):
+        with self.namespace_lock(namespace):
+            if self.exists(namespace):
+                os.remove(self.namespace_file(namespace))
+
+    # Return: writer para añadir chunks al índice del namespace. Mientras está abierto, nadie más escribe en el namespace
+    # (ni otra sesión ni otro proceso). El índice se lee después de tomar el lock: incluye lo que haya guardado el writer anterior
+    def open_writer(self, namespace):
+        return KeywordWriter(self, namespace, self.namespace_lock(namespace))
+
+
+# Writer del índice de palabras clave: se carga el índice existente y se guarda en disco al cerrar
+class KeywordWriter:
+
+    def __init__(self, store, namespace, lock):
+        self.store = store
+        self.namespace = namespace
+        self.count = 0
+        self.deleted = 0
+        self._lock = lock
+        self._lock.acquire()
+        try:
+            self.index = store.load(namespace) or KeywordIndex()
+        except Exception:
+            self._lock.release()
+            raise
+
+    def add(self, texts, metadatas=None, ids=None):
+        self.index.add(texts, metadatas, ids)
+        self.count += len(texts)
+
+    def delete(self, ids):
+        self.deleted += self.index.delete(ids)
+
+    def close(self):
+        try:
+            if self.count or self.deleted:
+                self.store.save(self.namespace, self.index)
+        finally:
+            self._lock.release()
+
+    # Cierra el writer sin guardar los cambios (el índice en disco queda como estaba)
+    def discard(self):
+        self._lock.release()
@@ -0,0 +1,59 @@
+#Extracción de texto de PDF en paralelo
+# Las páginas se reparten en bloques entre un pool de procesos y el texto se devuelve página a página y en orden (generador),
+# para que el troceado en chunks y los embeddings puedan empezar antes de que se haya parseado la última página
+# Este módulo no importa Streamlit: los procesos del pool solo cargan PyPDF2
+# PyPDF2 se importa la primera vez que se abre un PDF (startup)
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+# Páginas que procesa cada tarea del pool (reduce el coste de comunicación entre procesos)
+PAGES_PER_TASK = 8
+# Por debajo de este número de páginas no compensa arrancar el pool y se extrae en el mismo proceso
+MIN_PAGES_PARALLEL = 16
+
+# PdfReader de cada proceso del pool. Se crea una sola vez por proceso en _init_worker
+_workerReader = None
+
+def _init_worker(data):
+    #Parsing PDF
+    from PyPDF2 import PdfReader
+
+    global _workerReader
+    _workerReader = PdfReader(BytesIO(data))
+
+# Return: lista con el texto de las páginas [start, end) del PDF del proceso
+def _extract_pages(pageRange):
+    start, end = pageRange
+    return [_workerReader.pages[i].extract_text() or "" for i in range(start, end)]
+
+# Función que extrae el texto de un PDF página a página
+#    - data: contenido binario del PDF
+#    - workers: número de procesos del pool (por defecto, número de CPUs). Con 1 se extrae en el mismo proceso
+# El PDF se abre antes de devolver el generador, de modo que un fichero corrupto lanza la excepción en la llamada y no al iterar
+# Return: generador con el texto de cada página, en el orden del documento
+def iter_pdf_pages(data, workers=None):
+    #Parsing PDF
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(BytesIO(data))
+    workers = int(workers or os.cpu_count() or 1)
+    if workers <= 1 or len(reader.pages) < MIN_PAGES_PARALLEL:
+        return (page.extract_text() or "" for page in reader.pages)
+    return _iter_pages_parallel(data, len(reader.pages), workers)
+
+def _iter_pages_parallel(data, numPages, workers):
+    ranges = [(start, min(start + PAGES_PER_TASK, numPages)) for start in range(0, numPages, PAGES_PER_TASK)]
+    # Se usa spawn para no duplicar con fork el estado (threads, conexiones) del servidor de Streamlit
+    pool = ProcessPoolExecutor(max_workers=min(workers, len(ranges)),
+                               mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_worker,
+                               initargs=(data,))
+    try:
+        # map devuelve los resultados en orden a medida que terminan los bloques
+        for pages in pool.map(_extract_pages, ranges):
+            yield from pages
+    finally:
+        # Si se deja de consumir el generador (error aguas abajo), se cancelan los bloques pendientes
+        pool.shutdown(wait=False, cancel_futures=True)
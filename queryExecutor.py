@@ -0,0 +1,241 @@
+#Ejecutor de consultas compartido por todas las sesiones de Streamlit del proceso
+# Cada pregunta se respondía en el thread del script de Streamlit de la sesión, y cuando muchos usuarios preguntaban a la vez lo mismo
+# sobre un juego (juego destacado), cada sesión llamaba por separado a OpenAI y a PineCone. Con el ejecutor:
+#    - Las llamadas a OpenAI y al vector store se ejecutan en un pool de threads (QUERY_WORKERS). El thread del script solo espera
+#      y va pintando los tokens que le llegan por una cola
+#    - Límite de consultas a la vez por clave (QUERY_MAX_PER_KEY, la clave es el namespace del juego). El resto espera en la cola de
+#      su clave sin ocupar un thread del pool, así un juego muy consultado no bloquea las consultas del resto de juegos
+#    - Las consultas iguales en curso (misma clave de agrupación, ej: namespace + pregunta normalizada) comparten una única ejecución.
+#      Las que llegan tarde reciben primero los tokens que ya se habían generado
+#    - Backpressure: si hay QUERY_MAX_PENDING consultas en curso o en cola, las nuevas se rechazan (ExecutorBusyError)
+#    - Timeout: cada sesión espera como máximo QUERY_TIMEOUT segundos (QueryTimeoutError). Si ninguna sesión espera ya una consulta
+#      que sigue en cola, no se llega a ejecutar
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Valores por defecto si no se configuran QUERY_WORKERS, QUERY_MAX_PER_KEY, QUERY_MAX_PENDING y QUERY_TIMEOUT (segundos)
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_PER_KEY = 4
+DEFAULT_MAX_PENDING = 64
+DEFAULT_TIMEOUT = 120
+
+
+# Excepción cuando el ejecutor tiene ya el máximo de consultas en curso o en cola (QUERY_MAX_PENDING)
+class ExecutorBusyError(Exception):
+    pass
+
+# Excepción cuando la consulta no ha terminado en el tiempo máximo de espera (QUERY_TIMEOUT)
+class QueryTimeoutError(TimeoutError):
+    pass
+
+# Excepción cuando la consulta ha fallado. La excepción original de fn está en __cause__
+# Cada sesión que esperaba la consulta recibe su propia instancia: la excepción original no se lanza a la vez en varios threads
+class QueryFailedError(Exception):
+    pass
+
+
+# Ejecución de una consulta, compartida por todas las sesiones que esperan su resultado
+#  Los tokens que genera la consulta se guardan y se envían a la cola de cada sesión suscrita
+class _Flight:
+
+    def __init__(self, key, groupKey):
+        self.key = key
+        self.groupKey = groupKey
+        self.tokens = []
+        self.result = None
+        self.error = None
+        self.started = False
+        self.done = False
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    # Función que envía un token de la respuesta a todas las sesiones suscritas. Se llama desde el thread del pool
+    def emit(self, token):
+        with self._lock:
+            self.tokens.append(token)
+            for subscriber in self._subscribers:
+                subscriber.put(("token", token))
+
+    # Return: cola de la sesión, con los tokens ya generados y el aviso de fin si la consulta ya ha terminado
+    def subscribe(self):
+        subscriber = queue.Queue()
+        with self._lock:
+            for token in self.tokens:
+                subscriber.put(("token", token))
+            if self.done:
+                subscriber.put(("done", None))
+            else:
+                self._subscribers.append(subscriber)
+        return subscriber
+
+    # Función que quita la cola de una sesión que ha dejado de esperar (timeout)
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    # Función que marca la consulta como empezada si todavía la espera alguna sesión
+    # Return: False si ya no la espera ninguna sesión (se descarta sin ejecutarla)
+    def start(self):
+        with self._lock:
+            if not self._subscribers:
+                return False
+            self.started = True
+            return True
+
+    def finish(self, result=None, error=None):
+        with self._lock:
+            self.result = result
+            self.error = error
+            self.done = True
+            for subscriber in self._subscribers:
+                subscriber.put(("done", None))
+            self._subscribers = []
+
+
+class QueryExecutor:
+
+    def __init__(self, workers=DEFAULT_WORKERS, maxPerKey=DEFAULT_MAX_PER_KEY, maxPending=DEFAULT_MAX_PENDING,
+                 timeout=DEFAULT_TIMEOUT):
+        self.workers = max(1, int(workers))
+        self.maxPerKey = max(1, int(maxPerKey))
+        self.maxPending = max(1, int(maxPending))
+        self.timeout = float(timeout) if timeout else None
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.abandoned = 0
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="query")
+        # clave -> consultas ejecutándose y consultas en cola
+        self._running = {}
+        self._waiting = {}
+        # clave de agrupación -> consulta en curso
+        self._flights = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    # Función que encola la consulta fn(emit) con la clave key y suscribe a la sesión. Si groupKey ya tiene una consulta en curso, se suscribe a esa
+    # La suscripción se hace antes de lanzar la consulta para que no se descarte (ver _run)
+    # Return: (consulta, cola de la sesión, True si se comparte). Lanza ExecutorBusyError si hay demasiadas consultas pendientes
+    def _submit(self, key, fn, groupKey=None):
+        with self._lock:
+            if groupKey is not None:
+                flight = self._flights.get(groupKey)
+                if flight is not None:
+                    self.coalesced += 1
+                    return flight, flight.subscribe(), True
+            if self._pending >= self.maxPending:
+                self.rejected += 1
+                raise ExecutorBusyError("Demasiadas consultas en curso (" + str(self._pending) + "). Inténtalo en unos segundos")
+            self._pending += 1
+            self.submitted += 1
+            flight = _Flight(key, groupKey)
+            subscriber = flight.subscribe()
+            if groupKey is not None:
+                self._flights[groupKey] = flight
+            if self._running.get(key, 0) < self.maxPerKey:
+                self._running[key] = self._running.get(key, 0) + 1
+                dispatch = True
+            else:
+                self._waiting.setdefault(key, deque()).append((flight, fn))
+                dispatch = False
+        if dispatch:
+            self._pool.submit(self._run, flight, fn)
+        return flight, subscriber, False
+
+    # Función que ejecuta una consulta en un thread del pool y al terminar lanza la siguiente consulta en cola de la misma clave
+    def _run(self, flight, fn):
+        if flight.start():
+            try:
+                flight.finish(fn(flight.emit))
+            except BaseException as error:
+                flight.finish(error=error)
+        else:
+            # Todas las sesiones han dejado de esperar mientras estaba en cola
+            with self._lock:
+                self.abandoned += 1
+            flight.finish(error=QueryTimeoutError("Consulta descartada: nadie espera su resultado"))
+        with self._lock:
+            self._pending -= 1
+            if flight.groupKey is not None and self._flights.get(flight.groupKey) is flight:
+                del self._flights[flight.groupKey]
+            waiting = self._waiting.get(flight.key)
+            if waiting:
+                nextFlight, nextFn = waiting.popleft()
+                if not waiting:
+                    del self._waiting[flight.key]
+            else:
+                nextFlight = None
+                self._running[flight.key] -= 1
+                if not self._running[flight.key]:
+                    del self._running[flight.key]
+        if nextFlight is not None:
+            self._pool.submit(self._run, nextFlight, nextFn)
+
+    # Función que ejecuta la consulta fn(emit) en el pool y espera su resultado en el thread que llama
+    #    - key: clave del límite de consultas a la vez (namespace del juego)
+    #    - fn: función que recibe emit(token) para enviar los tokens de la respuesta a medida que se generan
+    #    - groupKey: clave de agrupación. Las consultas en curso con la misma groupKey comparten una única ejecución (None: no se agrupa)
+    #    - on_token(token): callback opcional que recibe los tokens en el thread que llama (ej: pintar en Streamlit)
+    #    - timeout: segundos máximos de espera (por defecto QUERY_TIMEOUT). Con 0 o menos no se lanza la consulta (QueryTimeoutError)
+    # Return: (resultado de fn, True si se ha compartido la ejecución de otra sesión)
+    #         Lanza QueryFailedError si fn falla, ExecutorBusyError si hay demasiadas consultas pendientes o QueryTimeoutError
+    def run(self, key, fn, groupKey=None, on_token=None, timeout=None):
+        timeout = timeout if timeout is not None else self.timeout
+        if timeout is not None and timeout <= 0:
+            with self._lock:
+                self.timeouts += 1
+            raise QueryTimeoutError("No queda tiempo para la consulta")
+        flight, subscriber, shared = self._submit(key, fn, groupKey)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                flight.unsubscribe(subscriber)
+                with self._lock:
+                    self.timeouts += 1
+                raise QueryTimeoutError("La consulta no ha terminado en " + str(round(timeout, 1)) + " segundos")
+            try:
+                kind, token = subscriber.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if kind == "done":
+                break
+            if on_token:
+                on_token(token)
+        if flight.error is not None:
+            raise QueryFailedError(str(flight.error)) from flight.error
+        return flight.result, shared
+
+    # Return: diccionario con las consultas en curso o en cola, ejecutadas, compartidas, rechazadas, timeouts y descartadas
+    def stats(self):
+        with self._lock:
+            return {"pending": self._pending,
+                    "running": sum(self._running.values()),
+                    "queued": sum(len(waiting) for waiting in self._waiting.values()),
+                    "submitted": self.submitted,
+                    "coalesced": self.coalesced,
+                    "rejected": self.rejected,
+                    "timeouts": self.timeouts,
+                    "abandoned": self.abandoned}
+
+
+# Un único ejecutor en todo el proceso
+_executor = None
+_executorLock = threading.Lock()
+
+# Función que devuelve el ejecutor de consultas del proceso (QUERY_WORKERS, QUERY_MAX_PER_KEY, QUERY_MAX_PENDING, QUERY_TIMEOUT)
+# Return: instancia de QueryExecutor compartida por todas las sesiones
+def get_query_executor(config):
+    global _executor
+    with _executorLock:
+        if _executor is None:
+            _executor = QueryExecutor(config.get("QUERY_WORKERS", DEFAULT_WORKERS),
+                                      config.get("QUERY_MAX_PER_KEY", DEFAULT_MAX_PER_KEY),
+                                      config.get("QUERY_MAX_PENDING", DEFAULT_MAX_PENDING),
+                                      config.get("QUERY_TIMEOUT", DEFAULT_TIMEOUT))
+        return _executor
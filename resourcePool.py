@@ -0,0 +1,112 @@
+#Pool de recursos compartido por todas las sesiones de Streamlit del proceso
+# Cada rerun de Streamlit y cada cambio de juego volvía a crear los clientes de OpenAI, el vector store y las cadenas de LangChain,
+# y cada sesión nueva volvía a conectar con PineCone para listar los juegos. Con el pool se crean una vez y se reutilizan:
+#    - Las claves son tuplas, normalmente (tipo de recurso, hash del OpenAI Key, namespace)
+#    - Tamaño máximo con expulsión LRU y caducidad (TTL) opcional por entrada
+#    - Si varias sesiones piden a la vez un recurso que no existe, solo una lo crea y el resto espera
+# Lo que es propio de cada usuario (memoria del chat) no se guarda aquí
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# Valores por defecto si no se configuran RESOURCE_POOL_SIZE y RESOURCE_POOL_TTL (segundos)
+DEFAULT_MAX_SIZE = 64
+DEFAULT_TTL = 3600
+
+
+# Función que genera un identificador estable para una API key sin guardar la clave en las claves del pool
+def hash_key(apiKey):
+    return hashlib.sha256(str(apiKey).encode("utf-8")).hexdigest()[:16]
+
+
+class ResourcePool:
+
+    def __init__(self, maxSize=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        self.maxSize = max(1, int(maxSize))
+        self.ttl = float(ttl) if ttl else None
+        self.hits = 0
+        self.misses = 0
+        # clave -> (valor, instante de caducidad o None)
+        self._entries = OrderedDict()
+        self._keyLocks = {}
+        self._lock = threading.Lock()
+
+    # Return: (True, valor) si la clave está en el pool y no ha caducado. Se marca como usada recientemente
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        value, expires = entry
+        if expires is not None and expires < time.time():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    # Función que devuelve el recurso de la clave key, creándolo con factory() si no existe o ha caducado
+    #    - ttl: caducidad de esta entrada en segundos (por defecto la del pool, 0 para que no caduque)
+    # Return: el recurso. Si factory lanza una excepción, no se guarda nada y se propaga
+    def get(self, key, factory, ttl=None):
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            keyLock = self._keyLocks.setdefault(key, threading.Lock())
+
+        with keyLock:
+            # Otra sesión puede haberlo creado mientras se esperaba el lock
+            with self._lock:
+                found, value = self._lookup(key)
+                if found:
+                    self.hits += 1
+                    return value
+                self.misses += 1
+            try:
+                value = factory()
+                ttl = ttl if ttl is not None else self.ttl
+                with self._lock:
+                    self._entries[key] = (value, time.time() + ttl if ttl else None)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.maxSize:
+                        self._entries.popitem(last=False)
+                return value
+            finally:
+                with self._lock:
+                    self._keyLocks.pop(key, None)
+
+    # Elimina la clave key del pool
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    # Elimina todas las claves para las que predicate(key) es True. Ej: todos los recursos de un namespace
+    def invalidate_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # Return: diccionario con el número de entradas, aciertos y fallos
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Un único pool en todo el proceso
+_pool = None
+_poolLock = threading.Lock()
+
+# Función que devuelve el pool de recursos del proceso (RESOURCE_POOL_SIZE, RESOURCE_POOL_TTL)
+# Return: instancia de ResourcePool compartida por todas las sesiones
+def get_resource_pool(config):
+    global _pool
+    with _poolLock:
+        if _pool is None:
+            _pool = ResourcePool(config.get("RESOURCE_POOL_SIZE", DEFAULT_MAX_SIZE),
+                                 config.get("RESOURCE_POOL_TTL", DEFAULT_TTL))
+        return _pool
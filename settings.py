@@ -0,0 +1,52 @@
+#Configuración de la aplicación sin Streamlit (línea de comandos, cron, contenedores)
+# gptda2.py lee la configuración con st.secrets (.streamlit/secrets.toml). Fuera de Streamlit se lee el mismo fichero con este módulo:
+#    - Mismas variables que secrets.toml (ver empty_env)
+#    - Las variables de entorno GPTDA2_<VARIABLE> tienen prioridad sobre el fichero (ej: GPTDA2_PINECONE_API_KEY)
+#    - Los valores de las variables de entorno se interpretan como en TOML (números, true/false...) y si no, como texto
+import os
+
+try:
+    import tomllib
+except ImportError:
+    # Python < 3.11: librería toml (dependencia de Streamlit)
+    tomllib = None
+    import toml
+
+# Fichero de configuración por defecto (el mismo que usa Streamlit)
+DEFAULT_SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+# Prefijo de las variables de entorno de configuración
+ENV_PREFIX = "GPTDA2_"
+
+
+# Return: diccionario con el contenido del fichero TOML
+def _load_toml(path):
+    if tomllib is not None:
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path, "r", encoding="utf-8") as f:
+        return toml.load(f)
+
+# Return: valor TOML del texto (7 -> 7, true -> True...) o el texto tal cual si no es un valor TOML válido
+def _parse_value(text):
+    try:
+        if tomllib is not None:
+            return tomllib.loads("value = " + text)["value"]
+        return toml.loads("value = " + text)["value"]
+    except Exception:
+        return text
+
+
+# Función que carga la configuración del fichero secrets.toml y de las variables de entorno
+#    - path: fichero TOML. Por defecto GPTDA2_SECRETS o .streamlit/secrets.toml. Si no existe, solo se usan las variables de entorno
+#    - environ: variables de entorno (por defecto os.environ)
+# Return: diccionario con la configuración (se usa igual que st.secrets: config["KEY"], config.get("KEY", default))
+def load_settings(path=None, environ=None):
+    environ = os.environ if environ is None else environ
+    path = path or environ.get(ENV_PREFIX + "SECRETS") or DEFAULT_SECRETS_PATH
+    settings = {}
+    if os.path.isfile(path):
+        settings.update(_load_toml(path))
+    for name, value in environ.items():
+        if name.startswith(ENV_PREFIX) and name != ENV_PREFIX + "SECRETS":
+            settings[name[len(ENV_PREFIX):]] = _parse_value(value)
+    return settings
@@ -0,0 +1,143 @@
+#Arranque rápido de la aplicación: imports diferidos, precarga en segundo plano e informe de tiempos de import
+# LangChain, OpenAI, PineCone, PyPDF2 y tiktoken tardan en importarse cerca de un segundo. gptda2.py ya no los importa al cargar el script:
+# cada función los importa la primera vez que los usa, y la página con el formulario del OpenAI Key se muestra sin esperar
+#    - warm_up: cuando el usuario introduce el OpenAI Key, un thread importa estos módulos y abre la conexión con el vector store
+#      mientras el usuario elige juego o escribe la pregunta (WARMUP = false lo desactiva)
+#    - Los tiempos de cada import de la precarga se miden en una traza (warmup) y se publican en las métricas de tracing
+#    - python startup.py: informe del tiempo de import en frío de gptda2.py desglosado por módulo (python -X importtime)
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# Módulos que se importan de forma diferida y que se precargan en warm_up
+HEAVY_MODULES = (
+    "openai",
+    "tiktoken",
+    "PyPDF2",
+    "langchain.embeddings",
+    "langchain.chat_models",
+    "langchain.chains",
+    "langchain.vectorstores",
+    "embeddingCache",
+    "conversationMemory",
+    "hybridRetriever",
+    "chatCallbacks",
+)
+# Módulos que se informan por defecto en python startup.py
+DEFAULT_REPORT_MODULE = "gptda2"
+DEFAULT_REPORT_TOP = 25
+
+# Segundos que ha tardado el primer import de cada módulo en este proceso (timed_import)
+_importTimes = {}
+_importLock = threading.Lock()
+_warmUpThread = None
+
+
+# Función que importa un módulo y guarda cuánto ha tardado si no estaba importado
+# Return: el módulo
+def timed_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    with _importLock:
+        _importTimes.setdefault(name, time.perf_counter() - start)
+    return module
+
+# Return: diccionario módulo -> segundos del primer import de los módulos importados con timed_import
+def import_times():
+    with _importLock:
+        return dict(_importTimes)
+
+
+# Función que lanza (una sola vez por proceso) un thread que importa HEAVY_MODULES y ejecuta las tareas de precarga
+#    - tasks: lista de (nombre, función sin argumentos), por ejemplo abrir la conexión con el vector store
+#    - tracer: tracer (tracing) donde se guarda la traza warmup con un span por módulo (import:<módulo>) y por tarea
+# Los errores no se propagan: el módulo o la conexión se volverán a intentar cuando se usen
+# Return: True si se ha lanzado, False si ya se había lanzado antes
+def warm_up(tasks=(), tracer=None, modules=HEAVY_MODULES):
+    global _warmUpThread
+    with _importLock:
+        if _warmUpThread is not None:
+            return False
+
+        def run():
+            trace = tracer.start("warmup") if tracer else None
+            for name in modules:
+                try:
+                    if trace:
+                        with trace.span("import:" + name):
+                            timed_import(name)
+                    else:
+                        timed_import(name)
+                except Exception:
+                    pass
+            for name, task in tasks:
+                try:
+                    if trace:
+                        with trace.span(name):
+                            task()
+                    else:
+                        task()
+                except Exception:
+                    pass
+            if trace:
+                trace.finish()
+
+        _warmUpThread = threading.Thread(target=run, name="warmup", daemon=True)
+        _warmUpThread.start()
+        return True
+
+
+# Función que mide el import en frío de un módulo en un proceso nuevo con python -X importtime
+# El proceso se ejecuta en el directorio de la aplicación (cwd) para encontrar sus módulos
+# Return: diccionario con total_ms y modules: lista de {module, self_ms, cumulative_ms, depth} ordenada por tiempo acumulado
+def profile_imports(module=DEFAULT_REPORT_MODULE, python=sys.executable, cwd=None):
+    start = time.perf_counter()
+    completed = subprocess.run([python, "-X", "importtime", "-c", "import " + module],
+                               capture_output=True, text=True, check=True,
+                               cwd=cwd or os.path.dirname(os.path.abspath(__file__)))
+    total = time.perf_counter() - start
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        selfTime, cumulative, name = line[len("import time:"):].split("|", 2)
+        modules.append({"module": name.strip(),
+                        "self_ms": round(int(selfTime) / 1000, 1),
+                        "cumulative_ms": round(int(cumulative) / 1000, 1),
+                        # Nivel de anidación: import directo (0) o import hecho por otro módulo
+                        "depth": (len(name) - len(name.lstrip()) - 1) // 2})
+    imported = next((item for item in modules if item["module"] == module), None)
+    return {"module": module,
+            "total_ms": round(total * 1000, 1),
+            "import_ms": imported["cumulative_ms"] if imported else None,
+            "modules": sorted(modules, key=lambda item: item["cumulative_ms"], reverse=True)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo de import en frío desglosado por módulo")
+    parser.add_argument("module", nargs="?", default=DEFAULT_REPORT_MODULE)
+    parser.add_argument("--top", type=int, default=DEFAULT_REPORT_TOP, help="Módulos que se muestran (por tiempo acumulado)")
+    parser.add_argument("--depth", type=int, default=1, help="Nivel de anidación máximo de los módulos que se muestran")
+    parser.add_argument("--json", action="store_true", help="Resultado en JSON")
+    args = parser.parse_args(argv)
+
+    report = profile_imports(args.module)
+    report["modules"] = [item for item in report["modules"] if item["depth"] <= args.depth][:args.top]
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return 0
+    print("import " + report["module"] + ": " + str(report["import_ms"]) + " ms (proceso completo " + str(report["total_ms"]) + " ms)")
+    for item in report["modules"]:
+        print("  " + item["module"] + ": " + str(item["cumulative_ms"]) + " ms (propio " + str(item["self_ms"]) + " ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,17 @@
 
 import streamlit as st
-import pinecone
-from bs4 import BeautifulSoup
-from urllib.request import urlopen
+from bggResolver import get_resolver
+from vectorBackends import get_backend
+from gameCatalog import get_catalog
 
 def borrarJuego(bggID):
-    pinecone.init(api_key=st.secrets["PINECONE_API_KEY"], 
-                environment=st.secrets["PINECONE_ENVIROMENT"])
-    
-    pineconeIndexName = st.secrets["PINECONE_INDEXNAME"]
     pineConePrefix = st.secrets["PINECONE_PREFIX"]
-    pineconeIndex = pinecone.Index(index_name=pineconeIndexName)
 
-    url = 'https://boardgamegeek.com/boardgame/'+str(bggID)
-    soup = BeautifulSoup(urlopen(url), features="html5lib")
-    BGGtitle = soup.title.get_text()
-    guion = BGGtitle.find(' |')
-    gameTitle = BGGtitle[0:guion]
-    if not gameTitle == "BoardGameGeek":
-        pineconeIndex.delete(delete_all=True, namespace=pineConePrefix+gameTitle)
+    gameTitle = get_resolver(st.secrets).lookup(bggID)
+    if gameTitle:
+        # Se borra el namespace del backend configurado (PineCone o FAISS) y el juego del catálogo
+        get_backend(st.secrets).delete_namespace(pineConePrefix+gameTitle)
+        get_catalog(st.secrets).delete_game(pineConePrefix+gameTitle)
 
 borrarJuego(213606)
 
-
@@ -0,0 +1,145 @@
+#Troceado del texto de los PDF en chunks medidos en tokens (tiktoken) en vez de en caracteres
+# Sustituye a CharacterTextSplitter:
+#    - Una sola pasada: cada línea se tokeniza una vez y los chunks se generan a medida que llegan las páginas (generador)
+#    - El tamaño de cada chunk se mide en tokens del modelo, así el tamaño de los prompts es predecible
+#    - Los títulos de sección del reglamento (numerados o en mayúsculas) empiezan un chunk nuevo
+#    - Las líneas demasiado largas (PDF sin saltos de línea) se parten por frases y, si hace falta, por tokens
+#    - Cada chunk lleva metadatos: página inicial y final y posición (offset en caracteres) dentro del documento
+import codecs
+import re
+
+# Valores por defecto si no se configuran CHUNK_TOKENS y CHUNK_OVERLAP_TOKENS
+DEFAULT_CHUNK_TOKENS = 300
+DEFAULT_OVERLAP_TOKENS = 30
+# Codificación de text-embedding-ada-002 y gpt-3.5-turbo
+DEFAULT_ENCODING = "cl100k_base"
+# Un título solo corta el chunk actual si este ya tiene al menos esta fracción del tamaño máximo (evita chunks minúsculos)
+MIN_FILL_BEFORE_HEADING = 0.25
+
+# Títulos de sección: "3.2 Preparación", "4) Fin de la partida", "FASE DE ACCIONES"...
+_headingRegex = re.compile(r"^\s*(\d+(\.\d+)*[.)]?\s+\S.{0,70}|[A-ZÁÉÍÓÚÜÑ0-9][A-ZÁÉÍÓÚÜÑ0-9 ,:;'&/()-]{3,70})\s*$")
+# Fin de frase para partir líneas largas
+_sentenceRegex = re.compile(r"(?<=[.!?;:])\s+")
+
+
+# Chunk de texto con sus metadatos
+class Chunk:
+    __slots__ = ("text", "page", "pageEnd", "offset", "tokens")
+
+    def __init__(self, text, page=None, pageEnd=None, offset=None, tokens=None):
+        self.text = text
+        self.page = page
+        self.pageEnd = pageEnd
+        self.offset = offset
+        self.tokens = tokens
+
+    # Return: diccionario de metadatos que se guarda con el embedding en el vector store
+    @property
+    def metadata(self):
+        metadata = {}
+        if self.page is not None:
+            metadata["page"] = self.page
+            metadata["page_end"] = self.pageEnd
+        if self.offset is not None:
+            metadata["offset"] = self.offset
+        if self.tokens is not None:
+            metadata["tokens"] = self.tokens
+        return metadata
+
+    def __repr__(self):
+        return "Chunk(page=%r, offset=%r, tokens=%r, text=%r)" % (self.page, self.offset, self.tokens, self.text[:40])
+
+
+# Función que convierte un string en Chunk sin metadatos (los Chunk se devuelven tal cual)
+def as_chunk(item):
+    return item if isinstance(item, Chunk) else Chunk(item)
+
+def is_heading(line):
+    return bool(_headingRegex.match(line))
+
+
+# Función que trocea el texto de las páginas en chunks de como máximo chunkTokens tokens
+#    - pages: iterable (puede ser un generador) con el texto de cada página, en orden
+#    - overlapTokens: tokens (líneas completas) del final de un chunk que se repiten al principio del siguiente
+# Return: generador de Chunk
+def iter_chunks(pages, chunkTokens=DEFAULT_CHUNK_TOKENS, overlapTokens=DEFAULT_OVERLAP_TOKENS, encodingName=DEFAULT_ENCODING):
+    #Tokenizador de OpenAI. Se importa la primera vez que se trocea un texto (startup)
+    import tiktoken
+
+    encoding = tiktoken.get_encoding(encodingName)
+    # Cada segmento ocupa al menos un token más el salto de línea
+    chunkTokens = max(2, int(chunkTokens))
+    overlapTokens = max(0, min(int(overlapTokens), chunkTokens // 2))
+
+    # Líneas del chunk actual: (texto, tokens, página, offset)
+    current = []
+    currentTokens = 0
+
+    def flush(keepOverlap=True):
+        nonlocal current, currentTokens
+        # La última línea no lleva salto de línea detrás: no se cuenta en los tokens del chunk
+        chunk = Chunk("\n".join(line for line, _, _, _ in current),
+                      page=current[0][2], pageEnd=current[-1][2], offset=current[0][3], tokens=currentTokens - 1)
+        # Se conservan las últimas líneas que caben en el solape
+        tail = []
+        tailTokens = 0
+        if keepOverlap:
+            for entry in reversed(current):
+                if tailTokens + entry[1] > overlapTokens:
+                    break
+                tail.insert(0, entry)
+                tailTokens += entry[1]
+        current, currentTokens = tail, tailTokens
+        return chunk
+
+    offset = 0
+    for pageNumber, pageText in enumerate(pages, start=1):
+        for rawLine in pageText.splitlines(keepends=True):
+            lineOffset = offset
+            offset += len(rawLine)
+            line = rawLine.rstrip("\r\n")
+            if not line.strip():
+                continue
+            for segment, segmentOffset, segmentTokens in _split_line(line, lineOffset, encoding, chunkTokens - 1):
+                # Se cuenta también el salto de línea con el que se une al resto del chunk
+                segmentTokens += 1
+                # Un título de sección empieza un chunk nuevo (sin solape con la sección anterior)
+                if current and currentTokens >= chunkTokens * MIN_FILL_BEFORE_HEADING and is_heading(segment):
+                    yield flush(keepOverlap=False)
+                if current and currentTokens + segmentTokens > chunkTokens:
+                    yield flush()
+                    # Si el solape más el segmento no caben, el segmento empieza el chunk solo
+                    if currentTokens + segmentTokens > chunkTokens:
+                        current, currentTokens = [], 0
+                current.append((segment, segmentTokens, pageNumber, segmentOffset))
+                currentTokens += segmentTokens
+    if current:
+        yield flush(keepOverlap=False)
+
+# Función que divide una línea en segmentos de como máximo maxTokens tokens
+# Las líneas normales se devuelven tal cual. Las largas se parten por frases y las frases demasiado largas por tokens
+# Return: generador de (texto, offset, tokens)
+def _split_line(line, lineOffset, encoding, maxTokens):
+    tokens = encoding.encode_ordinary(line)
+    if len(tokens) <= maxTokens:
+        yield line, lineOffset, len(tokens)
+        return
+    position = 0
+    for sentence in _sentenceRegex.split(line):
+        start = line.find(sentence, position)
+        position = start + len(sentence)
+        sentenceTokens = encoding.encode_ordinary(sentence)
+        if len(sentenceTokens) <= maxTokens:
+            yield sentence, lineOffset + start, len(sentenceTokens)
+            continue
+        # Frase sin puntuación más larga que un chunk: se corta por tokens
+        # El decodificador incremental evita romper caracteres UTF-8 que ocupan varios tokens
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pieceOffset = lineOffset + start
+        for i in range(0, len(sentenceTokens), maxTokens):
+            window = sentenceTokens[i:i + maxTokens]
+            last = i + maxTokens >= len(sentenceTokens)
+            piece = decoder.decode(encoding.decode_bytes(window), final=last)
+            if piece:
+                yield piece, pieceOffset, len(window)
+                pieceOffset += len(piece)
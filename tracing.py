@@ -0,0 +1,297 @@
+#Trazas de tiempos por etapa (BGG, PDF, chunks, embeddings, vector store, LLM...) de cada operación de la aplicación
+# Cada subida de ficheros o pregunta crea una traza (Trace) con un span por etapa:
+#    - Duración, contadores (páginas, chunks, tokens...), reintentos de OpenAI y el error (tipo y mensaje) si la etapa falla
+#    - Las trazas terminadas se pueden guardar en un fichero JSONL (TRACE_JSONL_PATH), una línea por traza
+#    - Las métricas agregadas del proceso se publican en formato texto de Prometheus en http://<METRICS_HOST>:<METRICS_PORT>/metrics
+# Los reintentos se cuentan con los avisos de tenacity ("Retrying ...") que escriben los loggers de LangChain de OpenAI,
+# y se asignan al span activo en el thread que reintenta
+# Este módulo no importa Streamlit: los spans se pueden abrir desde los threads del pipeline de ingesta
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Límites (segundos) de los histogramas de Prometheus
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Trazas recientes que se guardan en memoria
+MAX_TRACES = 100
+METRIC_PREFIX = "gptda2_"
+# Loggers de LangChain donde tenacity avisa de cada reintento de las llamadas a OpenAI
+RETRY_LOGGERS = ("langchain.embeddings.openai", "langchain.chat_models.openai", "langchain.llms.openai")
+
+
+# Etapa de una traza
+class Span:
+
+    def __init__(self, name, attrs=None):
+        self.name = name
+        self.attrs = dict(attrs or {})
+        self.counts = {}
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+
+    # Suma value al contador name del span (chunks, tokens, retries...)
+    def count(self, name, value=1):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def set(self, name, value):
+        self.attrs[name] = value
+
+    def to_dict(self):
+        return {"name": self.name, "start": self.start, "duration": self.duration,
+                "attrs": self.attrs, "counts": self.counts, "error": self.error}
+
+
+# Traza de una operación (subida de ficheros, pregunta...). Los spans se pueden abrir desde varios threads
+class Trace:
+
+    def __init__(self, tracer, name, attrs=None):
+        self.tracer = tracer
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = dict(attrs or {})
+        self.start = time.time()
+        self.duration = None
+        self.spans = []
+        self.errors = []
+        self._lock = threading.Lock()
+
+    # Mide la etapa name. Si el bloque lanza una excepción, se guarda el error en el span y en la traza y se propaga
+    # Return: el Span, para añadir contadores dentro del bloque
+    @contextmanager
+    def span(self, name, **attrs):
+        span = Span(name, attrs)
+        started = time.perf_counter()
+        stack = self.tracer._stack()
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as error:
+            span.error = type(error).__name__ + ": " + str(error)
+            with self._lock:
+                self.errors.append({"stage": name, "error": span.error})
+            raise
+        finally:
+            stack.remove(span)
+            span.duration = time.perf_counter() - started
+            with self._lock:
+                self.spans.append(span)
+            self.tracer._record_span(span)
+
+    # Guarda un error que no viene de un span (por ejemplo, un fichero que el pipeline marca como erróneo)
+    def error(self, stage, error):
+        with self._lock:
+            self.errors.append({"stage": stage, "error": str(error)})
+        self.tracer._record_error(stage)
+
+    def finish(self):
+        if self.duration is None:
+            self.duration = time.time() - self.start
+            self.tracer._finish(self)
+        return self
+
+    # Return: lista de etapas agregadas (mismo nombre sumado) en orden de aparición: stage, calls, seconds, counts y errors
+    def summary(self):
+        stages = {}
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        for span in spans:
+            stage = stages.setdefault(span.name, {"stage": span.name, "calls": 0, "seconds": 0.0, "counts": {}, "errors": 0})
+            stage["calls"] += 1
+            stage["seconds"] += span.duration or 0.0
+            for name, value in span.counts.items():
+                stage["counts"][name] = stage["counts"].get(name, 0) + value
+            if span.error:
+                stage["errors"] += 1
+        return list(stages.values())
+
+    def to_dict(self):
+        with self._lock:
+            return {"id": self.id, "name": self.name, "attrs": self.attrs, "start": self.start, "duration": self.duration,
+                    "spans": [span.to_dict() for span in self.spans], "errors": list(self.errors)}
+
+
+# Traza vacía para llamar a las funciones instrumentadas sin trazas (mismas funciones que Trace)
+class NullTrace:
+
+    @contextmanager
+    def span(self, name, **attrs):
+        yield Span(name, attrs)
+
+    def error(self, stage, error):
+        pass
+
+    def finish(self):
+        return self
+
+    def summary(self):
+        return []
+
+NULL_TRACE = NullTrace()
+
+
+# Histograma acumulativo de Prometheus
+class _Histogram:
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, limit in enumerate(BUCKETS):
+            if value <= limit:
+                self.buckets[i] += 1
+
+
+# Registro de trazas del proceso y métricas agregadas
+class Tracer:
+
+    def __init__(self, jsonlPath=None, maxTraces=MAX_TRACES):
+        self.jsonlPath = jsonlPath
+        self.traces = deque(maxlen=max(1, int(maxTraces)))
+        self._stageDurations = {}
+        self._stageErrors = {}
+        self._stageCounts = {}
+        self._requestDurations = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    # Return: pila de spans abiertos en el thread actual (para asignar los reintentos)
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    # Return: span abierto más reciente del thread actual o None
+    def current_span(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def start(self, name, **attrs):
+        return Trace(self, name, attrs)
+
+    def _record_span(self, span):
+        with self._lock:
+            self._stageDurations.setdefault(span.name, _Histogram()).observe(span.duration)
+            if span.error:
+                self._stageErrors[span.name] = self._stageErrors.get(span.name, 0) + 1
+            for name, value in span.counts.items():
+                key = (span.name, name)
+                self._stageCounts[key] = self._stageCounts.get(key, 0) + value
+
+    def _record_error(self, stage):
+        with self._lock:
+            self._stageErrors[stage] = self._stageErrors.get(stage, 0) + 1
+
+    def _finish(self, trace):
+        with self._lock:
+            self._requestDurations.setdefault(trace.name, _Histogram()).observe(trace.duration)
+            self.traces.append(trace)
+            if self.jsonlPath:
+                with open(self.jsonlPath, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+
+    # Guarda las trazas recientes en un fichero JSONL
+    def export_jsonl(self, path):
+        with self._lock:
+            traces = list(self.traces)
+        with open(path, "w", encoding="utf-8") as f:
+            for trace in traces:
+                f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+
+    # Return: métricas del proceso en formato texto de Prometheus
+    def metrics_text(self):
+        lines = []
+        with self._lock:
+            _histogram_lines(lines, METRIC_PREFIX + "request_duration_seconds", "Duración de cada operación", "kind", self._requestDurations)
+            _histogram_lines(lines, METRIC_PREFIX + "stage_duration_seconds", "Duración de cada etapa", "stage", self._stageDurations)
+            lines.append("# HELP " + METRIC_PREFIX + "stage_errors_total Errores por etapa")
+            lines.append("# TYPE " + METRIC_PREFIX + "stage_errors_total counter")
+            for stage, value in sorted(self._stageErrors.items()):
+                lines.append(METRIC_PREFIX + 'stage_errors_total{stage="' + _label(stage) + '"} ' + str(value))
+            lines.append("# HELP " + METRIC_PREFIX + "stage_items_total Elementos procesados por etapa (páginas, chunks, tokens, reintentos...)")
+            lines.append("# TYPE " + METRIC_PREFIX + "stage_items_total counter")
+            for (stage, name), value in sorted(self._stageCounts.items()):
+                lines.append(METRIC_PREFIX + 'stage_items_total{stage="' + _label(stage) + '",item="' + _label(name) + '"} ' + str(value))
+        return "\n".join(lines) + "\n"
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _histogram_lines(lines, metric, help, labelName, histograms):
+    lines.append("# HELP " + metric + " " + help)
+    lines.append("# TYPE " + metric + " histogram")
+    for name, histogram in sorted(histograms.items()):
+        label = labelName + '="' + _label(name) + '"'
+        for limit, value in zip(BUCKETS, histogram.buckets):
+            lines.append(metric + "_bucket{" + label + ',le="' + repr(limit) + '"} ' + str(value))
+        lines.append(metric + "_bucket{" + label + ',le="+Inf"} ' + str(histogram.count))
+        lines.append(metric + "_sum{" + label + "} " + repr(histogram.sum))
+        lines.append(metric + "_count{" + label + "} " + str(histogram.count))
+
+
+# Handler de logging que cuenta los reintentos de tenacity en el span activo del thread
+class _RetryHandler(logging.Handler):
+
+    def __init__(self, tracer):
+        super().__init__(logging.WARNING)
+        self.tracer = tracer
+
+    def emit(self, record):
+        if record.getMessage().startswith("Retrying"):
+            span = self.tracer.current_span()
+            if span is not None:
+                span.count("retries")
+
+
+# Servidor HTTP con el endpoint /metrics en un thread en segundo plano
+def start_metrics_server(tracer, port, host="127.0.0.1"):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = tracer.metrics_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, int(port)), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+# Un único tracer en todo el proceso
+_tracer = None
+_tracerLock = threading.Lock()
+
+# Función que devuelve el tracer del proceso (TRACE_JSONL_PATH, METRICS_PORT, METRICS_HOST)
+# La primera llamada registra el contador de reintentos y arranca el endpoint de métricas si METRICS_PORT está configurado
+def get_tracer(config):
+    global _tracer
+    with _tracerLock:
+        if _tracer is None:
+            tracer = Tracer(config.get("TRACE_JSONL_PATH") or None)
+            handler = _RetryHandler(tracer)
+            for loggerName in RETRY_LOGGERS:
+                logging.getLogger(loggerName).addHandler(handler)
+            if config.get("METRICS_PORT"):
+                start_metrics_server(tracer, config.get("METRICS_PORT"), config.get("METRICS_HOST", "127.0.0.1"))
+            _tracer = tracer
+        return _tracer
@@ -0,0 +1,441 @@
+#Backends de almacenamiento de embeddings (vector stores)
+# Se selecciona con la variable de configuración VECTORSTORE_BACKEND (secrets.toml):
+#    - pinecone (por defecto): índice remoto en PineCone, un namespace por juego
+#    - faiss: índice local FAISS en disco, un directorio por namespace. Permite ejecutar toda la aplicación sin conexión a PineCone
+# Ambos backends ofrecen las mismas funciones para que gptda2.py no tenga que saber cuál se está usando
+# Los writers de los dos backends añaden también los chunks al índice de palabras clave (BM25) del namespace (keywordIndex)
+# Los chunks de un documento se guardan con IDs deterministas (documento + hash del chunk): al volver a procesar un documento
+# solo se insertan los chunks nuevos y se borran los que ya no existen (ver ingestPipeline)
+import hashlib
+import logging
+import os
+import shutil
+import struct
+import threading
+import uuid
+from itertools import islice
+from urllib.parse import quote, unquote
+
+#LangChain (vector stores Pinecone y FAISS), PineCone client y FAISS se importan dentro de las funciones la primera vez que se usan:
+# importar este módulo es rápido (startup)
+
+#Chunks con metadatos (página, offset)
+from textChunker import as_chunk
+#Índice de palabras clave por namespace
+from keywordIndex import KeywordStore
+#Lock de escritura entre threads y procesos
+from fileLock import FileLock
+
+# Dimensión de los embeddings de OpenAI (text-embedding-ada-002)
+EMBEDDING_DIMENSION = 1536
+# Directorio por defecto donde se guardan los índices FAISS si no se configura FAISS_PATH
+DEFAULT_FAISS_PATH = "faiss_indexes"
+# Número de chunks que se envían juntos a OpenAI para generar embeddings y que se insertan juntos en el vector store
+BATCH_SIZE = 32
+# Número máximo de IDs por petición de borrado en PineCone
+DELETE_BATCH_SIZE = 1000
+# Número máximo de resultados de una consulta a PineCone sin metadatos y de IDs por petición fetch
+PINECONE_MAX_TOP_K = 10000
+FETCH_BATCH_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+
+# Función que agrupa los elementos de un iterable (puede ser un generador) en listas de tamaño size
+# Return: generador de listas. La última puede tener menos elementos
+def batched(iterable, size):
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+# Return: clave de un documento (fichero) dentro de un namespace. Es el prefijo de los IDs de sus chunks
+def document_key(namespace, fileName):
+    return hashlib.sha256((namespace + "/" + fileName).encode("utf-8")).hexdigest()[:16]
+
+# Función que calcula el ID determinista de un chunk de un documento
+#    - occurrence: número de veces que el mismo texto ha aparecido antes en el documento (chunks repetidos tienen IDs distintos)
+# Return: string "<clave del documento>-<hash del chunk>"
+def chunk_id(documentKey, text, occurrence=0):
+    chunkHash = hashlib.sha256((str(occurrence) + "\0" + text).encode("utf-8")).hexdigest()[:32]
+    return documentKey + "-" + chunkHash
+
+
+# Backend remoto: PineCone
+# Se conecta con las variables PINECONE_API_KEY, PINECONE_ENVIROMENT y PINECONE_INDEXNAME
+class PineconeBackend:
+    name = "pinecone"
+
+    def __init__(self, config):
+        self.config = config
+        self.indexName = config["PINECONE_INDEXNAME"]
+        self.keywords = KeywordStore(config)
+        self._index = None
+        self._connectLock = threading.Lock()
+
+    # Inicializa el cliente de PineCone. Si no esta el indice creado, se crea en PineCone
+    # La conexión se hace una sola vez por backend: las siguientes llamadas reutilizan el handle del índice
+    def connect(self):
+        #Libreria PineCone Client
+        import pinecone
+
+        with self._connectLock:
+            if self._index is None:
+                pinecone.init(api_key=self.config["PINECONE_API_KEY"],
+                              environment=self.config["PINECONE_ENVIROMENT"])
+                if self.indexName not in pinecone.list_indexes():
+                    pinecone.create_index(self.indexName,
+                                          dimension=EMBEDDING_DIMENSION,
+                                          metric='cosine',
+                                          pods=1,
+                                          replicas=1,
+                                          pod_type='p1.x1')
+                self._index = pinecone.Index(index_name=self.indexName)
+            return self._index
+
+    # Precarga (startup.warm_up): abre la conexión con PineCone e importa el vector store de LangChain
+    def warm_up(self):
+        from langchain.vectorstores import Pinecone
+
+        self.connect()
+
+    # Return: Lista con el nombre de todos los namespaces del índice
+    def list_namespaces(self):
+        pineconeIndex = self.connect()
+        index_stats_response = pineconeIndex.describe_index_stats()
+        return list(index_stats_response.get("namespaces") or [])
+
+    # Return: diccionario namespace -> número de vectores del namespace
+    def namespace_counts(self):
+        pineconeIndex = self.connect()
+        namespaces = pineconeIndex.describe_index_stats().get("namespaces") or {}
+        return {namespace: summary.get("vector_count") for namespace, summary in namespaces.items()}
+
+    # Return: writer para insertar embeddings ya calculados en el namespace
+    def open_writer(self, embeddings, namespace):
+        pineconeIndex = self.connect()
+        return PineconeWriter(pineconeIndex, embeddings, namespace, self.keywords.open_writer(namespace))
+
+    # Crea (o amplía) el namespace con los embeddings de text_chunks (Chunk o strings)
+    # text_chunks puede ser un generador: los chunks se embeben e insertan por lotes a medida que llegan
+    # Return: vectorstore de LangChain asociado al namespace. Lanza ValueError si no hay ningún chunk
+    def from_texts(self, text_chunks, embeddings, namespace):
+        return write_texts(self.open_writer(embeddings, namespace), text_chunks, embeddings)
+
+    # Return: vectorstore de LangChain asociado a un namespace ya existente
+    def get_vectorstore(self, embeddings, namespace):
+        from langchain.vectorstores import Pinecone
+
+        return Pinecone(self.connect(), embeddings.embed_query, "text", namespace)
+
+    # Elimina todos los vectores del namespace y su índice de palabras clave
+    def delete_namespace(self, namespace):
+        self.connect().delete(delete_all=True, namespace=namespace)
+        self.keywords.delete(namespace)
+
+    # Return: índice de palabras clave del namespace (KeywordIndex) o None si no se puede obtener
+    # El índice se guarda en el disco local de la máquina que procesa los PDF. En otra réplica o en un contenedor nuevo no existe:
+    # se reconstruye con el texto de los chunks guardado en los metadatos de PineCone (metadato "text") y se guarda en disco
+    def load_keywords(self, namespace):
+        index = self.keywords.load(namespace)
+        if index is None:
+            try:
+                index = self.rebuild_keywords(namespace)
+            except Exception:
+                logger.warning("No se ha podido reconstruir el índice de palabras clave de %s", namespace, exc_info=True)
+        return index
+
+    # Función que reconstruye el índice de palabras clave de un namespace con los chunks guardados en PineCone
+    # PineCone (cliente 2.x) no permite listar los IDs: se obtienen con una consulta de top_k = número de vectores (sin metadatos)
+    # y después se piden sus metadatos por lotes (fetch)
+    # Return: KeywordIndex o None si el namespace está vacío o tiene más de PINECONE_MAX_TOP_K vectores (no se pueden listar todos)
+    def rebuild_keywords(self, namespace):
+        count = self.namespace_counts().get(namespace)
+        if not count:
+            return None
+        if count > PINECONE_MAX_TOP_K:
+            logger.warning("El namespace %s tiene %d vectores: no se puede reconstruir su índice de palabras clave", namespace, count)
+            return None
+        pineconeIndex = self.connect()
+        # Cualquier vector sirve: se piden todos los vectores del namespace
+        queryVector = [0.0] * (EMBEDDING_DIMENSION - 1) + [1.0]
+        response = pineconeIndex.query(vector=queryVector, top_k=count, namespace=namespace,
+                                       include_values=False, include_metadata=False)
+        ids = [match["id"] for match in response["matches"]]
+        writer = self.keywords.open_writer(namespace)
+        try:
+            for batch in batched(ids, FETCH_BATCH_SIZE):
+                vectors = pineconeIndex.fetch(ids=batch, namespace=namespace)["vectors"]
+                texts, metadatas, chunkIds = [], [], []
+                for id in batch:
+                    metadata = dict((vectors.get(id) or {}).get("metadata") or {})
+                    text = metadata.pop("text", None)
+                    if text:
+                        texts.append(text)
+                        metadatas.append(metadata)
+                        chunkIds.append(id)
+                writer.add(texts, metadatas, chunkIds)
+        except BaseException:
+            writer.discard()
+            raise
+        writer.close()
+        logger.info("Índice de palabras clave de %s reconstruido desde PineCone (%d chunks)", namespace, writer.count)
+        return self.keywords.load(namespace)
+
+
+# Cabecera de los ficheros de IndexFlat de FAISS (IndexFlatL2, IndexFlatIP): tipo (4 bytes), dimensión (int32) y número de vectores (int64)
+FLAT_INDEX_TYPES = (b"IxF2", b"IxFI")
+
+# Return: número de vectores de un índice FAISS guardado en disco
+# De los IndexFlat se lee solo la cabecera (no se carga el índice completo en memoria para contar sus vectores)
+def _index_size(indexFile):
+    with open(indexFile, "rb") as f:
+        header = f.read(16)
+    if header[:4] in FLAT_INDEX_TYPES:
+        return struct.unpack_from("<q", header, 8)[0]
+    import faiss
+    return faiss.read_index(indexFile).ntotal
+
+
+# Backend local: un índice FAISS por namespace guardado en <FAISS_PATH>/<namespace>
+# El nombre del namespace se codifica (quote) para que nombres de juego con '/' o ':' sean directorios válidos
+# Los índices son IndexFlat de FAISS, que se cargan completos en memoria: cada namespace abierto para consultas ocupa en RAM
+# lo mismo que su fichero .faiss (FAISS no hace mmap de IndexFlat), y los vector stores se reutilizan entre sesiones (resourcePool)
+class FaissBackend:
+    name = "faiss"
+    # Ficheros generados por FAISS.save_local
+    INDEX_NAME = "index"
+
+    def __init__(self, config):
+        self.config = config
+        self.path = config.get("FAISS_PATH", DEFAULT_FAISS_PATH)
+        self.keywords = KeywordStore(config)
+
+    def namespace_path(self, namespace):
+        return os.path.join(self.path, quote(namespace, safe=""))
+
+    def exists(self, namespace):
+        return os.path.isfile(os.path.join(self.namespace_path(namespace), self.INDEX_NAME + ".faiss"))
+
+    # Return: lock de escritura del índice del namespace, compartido entre threads y procesos (aplicación y línea de comandos)
+    # El fichero de lock está junto al directorio del namespace (<FAISS_PATH>/<namespace>.lock)
+    def namespace_lock(self, namespace):
+        return FileLock(self.namespace_path(namespace) + ".lock")
+
+    # Return: índice de palabras clave del namespace (KeywordIndex) o None si no existe. Está en el mismo disco que el índice FAISS
+    def load_keywords(self, namespace):
+        return self.keywords.load(namespace)
+
+    # Precarga (startup.warm_up): importa FAISS y el vector store de LangChain (no hay conexión que abrir)
+    def warm_up(self):
+        import faiss
+        from langchain.vectorstores import FAISS
+
+    # Return: Lista con el nombre de todos los namespaces guardados en disco
+    def list_namespaces(self):
+        if not os.path.isdir(self.path):
+            return []
+        namespaces = []
+        for entry in os.listdir(self.path):
+            namespace = unquote(entry)
+            if self.exists(namespace):
+                namespaces.append(namespace)
+        return namespaces
+
+    # Return: diccionario namespace -> número de vectores del índice (None si no se puede leer)
+    def namespace_counts(self):
+        counts = {}
+        for namespace in self.list_namespaces():
+            indexFile = os.path.join(self.namespace_path(namespace), self.INDEX_NAME + ".faiss")
+            try:
+                counts[namespace] = _index_size(indexFile)
+            except (OSError, RuntimeError, struct.error):
+                counts[namespace] = None
+        return counts
+
+    # Return: writer para insertar embeddings ya calculados en el índice del namespace
+    # Mientras el writer está abierto, ninguna otra sesión ni proceso puede escribir en el mismo namespace
+    def open_writer(self, embeddings, namespace):
+        lock = self.namespace_lock(namespace)
+        keywords = self.keywords.open_writer(namespace)
+        try:
+            return FaissWriter(self, embeddings, namespace, lock, keywords)
+        except Exception:
+            keywords.close()
+            raise
+
+    # Crea (o amplía) el índice del namespace con los embeddings de text_chunks (Chunk o strings) y lo guarda en disco
+    # text_chunks puede ser un generador: los chunks se embeben y se añaden al índice por lotes a medida que llegan
+    # Return: vectorstore de LangChain asociado al namespace. Lanza ValueError si no hay ningún chunk
+    def from_texts(self, text_chunks, embeddings, namespace):
+        return write_texts(self.open_writer(embeddings, namespace), text_chunks, embeddings)
+
+    # Return: vectorstore de LangChain asociado a un namespace ya existente. El índice se carga completo en memoria
+    def get_vectorstore(self, embeddings, namespace):
+        import pickle
+        import faiss
+        from langchain.vectorstores import FAISS
+
+        folder = self.namespace_path(namespace)
+        index = faiss.read_index(os.path.join(folder, self.INDEX_NAME + ".faiss"))
+        with open(os.path.join(folder, self.INDEX_NAME + ".pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(embeddings.embed_query, index, docstore, index_to_docstore_id)
+
+    # Elimina el índice del namespace y su índice de palabras clave. Espera a que termine cualquier writer abierto en el namespace
+    # (también de otro proceso)
+    # Los dos locks se toman uno detrás de otro (no anidados): los writers toman primero el de palabras clave y después el de FAISS
+    def delete_namespace(self, namespace):
+        with self.namespace_lock(namespace):
+            if os.path.isdir(self.namespace_path(namespace)):
+                shutil.rmtree(self.namespace_path(namespace))
+        self.keywords.delete(namespace)
+
+
+# Writer de PineCone: cada lote se inserta (upsert) directamente en el namespace
+class PineconeWriter:
+
+    def __init__(self, pineconeIndex, embeddings, namespace, keywords):
+        self.pineconeIndex = pineconeIndex
+        self.embeddings = embeddings
+        self.namespace = namespace
+        self.keywords = keywords
+        self.count = 0
+        self.deleted = 0
+
+    # Inserta los chunks. Si no se indican ids se generan aleatorios; un id que ya existe se sobrescribe
+    def add(self, texts, vectors, metadatas=None, ids=None):
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        # Mismo formato que usa LangChain: el texto del chunk se guarda en el metadato "text"
+        self.pineconeIndex.upsert(vectors=[(id, vector, dict(metadata, text=text))
+                                           for id, text, vector, metadata in zip(ids, texts, vectors, metadatas)],
+                                  namespace=self.namespace)
+        self.keywords.add(texts, metadatas, ids)
+        self.count += len(texts)
+
+    # Borra los chunks con esos ids del namespace (los ids que no existen se ignoran)
+    def delete(self, ids):
+        for batch in batched(ids, DELETE_BATCH_SIZE):
+            self.pineconeIndex.delete(ids=batch, namespace=self.namespace)
+        self.keywords.delete(ids)
+        self.deleted += len(ids)
+
+    # Guarda el índice de palabras clave
+    # Return: vectorstore de LangChain asociado al namespace
+    def close(self):
+        from langchain.vectorstores import Pinecone
+
+        self.keywords.close()
+        return Pinecone(self.pineconeIndex, self.embeddings.embed_query, "text", self.namespace)
+
+    # Cierra el writer sin guardar el índice de palabras clave. Los vectores ya insertados en PineCone no se deshacen
+    def discard(self):
+        self.keywords.discard()
+
+
+# Writer de FAISS: el índice existente se carga completo en memoria y se guarda en disco al cerrar
+class FaissWriter:
+
+    def __init__(self, backend, embeddings, namespace, lock, keywords):
+        self.backend = backend
+        self.embeddings = embeddings
+        self.namespace = namespace
+        self.keywords = keywords
+        self.count = 0
+        self.deleted = 0
+        self._lock = lock
+        self._lock.acquire()
+        try:
+            self.vectorstore = None
+            if backend.exists(namespace):
+                from langchain.vectorstores import FAISS
+
+                self.vectorstore = FAISS.load_local(backend.namespace_path(namespace), embeddings, index_name=backend.INDEX_NAME)
+        except Exception:
+            self._lock.release()
+            raise
+
+    # Inserta los chunks. Igual que en PineCone, un id que ya existe se sobrescribe (se borra y se vuelve a añadir)
+    def add(self, texts, vectors, metadatas=None, ids=None):
+        textEmbeddings = list(zip(texts, vectors))
+        if self.vectorstore is None:
+            from langchain.vectorstores import FAISS
+
+            self.vectorstore = FAISS.from_embeddings(textEmbeddings, self.embeddings, metadatas=metadatas, ids=ids)
+        else:
+            if ids:
+                existing = [id for id in ids if id in self.vectorstore.docstore._dict]
+                if existing:
+                    self.delete(existing)
+            self.vectorstore.add_embeddings(textEmbeddings, metadatas=metadatas, ids=ids)
+        self.keywords.add(texts, metadatas, ids)
+        self.count += len(texts)
+
+    # Borra los chunks con esos ids del índice (los ids que no existen se ignoran)
+    # IndexFlat compacta los vectores al borrar sin cambiar su orden, así que las posiciones se renumeran en el mismo orden
+    def delete(self, ids):
+        import numpy as np
+
+        ids = set(ids)
+        if self.vectorstore is not None and ids:
+            vectorstore = self.vectorstore
+            positions = [position for position, id in sorted(vectorstore.index_to_docstore_id.items()) if id in ids]
+            if positions:
+                vectorstore.index.remove_ids(np.array(positions, dtype=np.int64))
+                kept = [id for _, id in sorted(vectorstore.index_to_docstore_id.items()) if id not in ids]
+                vectorstore.index_to_docstore_id = dict(enumerate(kept))
+                for id in ids:
+                    vectorstore.docstore._dict.pop(id, None)
+                self.deleted += len(positions)
+        self.keywords.delete(ids)
+
+    # Guarda el índice (y el de palabras clave) en disco y libera el namespace
+    # Return: vectorstore de LangChain asociado al namespace (None si no se ha añadido nada a un índice nuevo)
+    def close(self):
+        try:
+            if self.vectorstore is not None and (self.count or self.deleted):
+                self.vectorstore.save_local(self.backend.namespace_path(self.namespace), index_name=self.backend.INDEX_NAME)
+            return self.vectorstore
+        finally:
+            try:
+                self.keywords.close()
+            finally:
+                self._lock.release()
+
+    # Cierra el writer sin guardar los cambios: el índice FAISS y el de palabras clave en disco quedan como estaban
+    def discard(self):
+        try:
+            self.keywords.discard()
+        finally:
+            self._lock.release()
+
+
+# Función que embebe e inserta por lotes los chunks de text_chunks (Chunk o strings) con un writer y lo cierra
+# Return: vectorstore de LangChain del writer. Lanza ValueError si no hay ningún chunk
+def write_texts(writer, text_chunks, embeddings):
+    try:
+        for batch in batched(map(as_chunk, text_chunks), BATCH_SIZE):
+            texts = [chunk.text for chunk in batch]
+            writer.add(texts, embeddings.embed_documents(texts), [chunk.metadata for chunk in batch])
+    finally:
+        vectorstore = writer.close()
+    if not writer.count:
+        raise ValueError("No hay texto para crear embeddings en " + writer.namespace)
+    return vectorstore
+
+
+BACKENDS = {
+    PineconeBackend.name: PineconeBackend,
+    FaissBackend.name: FaissBackend,
+}
+
+# Función que devuelve el backend configurado en VECTORSTORE_BACKEND (por defecto pinecone)
+# Return: instancia del backend. Lanza ValueError si el nombre no es válido
+def get_backend(config):
+    backendName = str(config.get("VECTORSTORE_BACKEND", PineconeBackend.name)).lower()
+    if backendName not in BACKENDS:
+        raise ValueError("VECTORSTORE_BACKEND no soportado: " + backendName)
+    return BACKENDS[backendName](config)